@@ -161,6 +161,12 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
+    'if-none-match',
+]
+CORS_EXPOSE_HEADERS = [
+    'idempotent-replayed',
+    'etag',
 ]
 CORS_PREFLIGHT_MAX_AGE = 86400
 
@@ -181,6 +187,42 @@ MAILGUN_DOMAIN = 'mg.qfsvaultledger.org'
 # Frontend URL
 FRONTEND_URL = 'https://www.qfsvaultledger.org'
 
+# Wallet balance cache lifetime in seconds; entries are keyed by the wallet's updated_at,
+# so a balance change made by any process is seen at once
+WALLET_BALANCE_CACHE_TIMEOUT = 3600
+
+# Coin prices (USD). Quotes are fresh for PRICE_CACHE_TTL seconds and then served stale,
+# while one background refresh runs, for up to PRICE_STALE_TTL seconds
+PRICE_PROVIDER = {
+    'BACKEND': 'app.price_services.HTTPPriceProvider',
+    'OPTIONS': {'timeout': 5},
+}
+PRICE_CACHE_TTL = 60
+PRICE_STALE_TTL = 3600
+
+# Chain watcher (manage.py watch_chain): one backend per coin, e.g.
+# {'bitcoin': {'BACKEND': 'app.chain_services.MockNodeBackend', 'OPTIONS': {'path': '...'}}}
+CHAIN_BACKENDS = {}
+# Transfers match pending deposits created within this many seconds of the transfer
+CHAIN_MATCH_WINDOW = 48 * 3600
+# Allowed relative difference between a deposit's USD amount and the transfer's USD value
+CHAIN_AMOUNT_TOLERANCE = '0.02'
+
+# Shared address per coin, handed out only when the DepositAddress pool for the coin is empty
+# (load the pool with manage.py load_deposit_addresses)
+DEPOSIT_ADDRESSES = {
+    'bitcoin': 'bc1qgvry4pf374d7wgddslw7gymrfm2geswsde26ct',
+    'ethereum': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',
+    'ripple': 'rGhee3BsGTR9dS1eep4WvcoTEfF7EDGFq2',
+    'stellar': 'GBAFJKIU3S2UKSVGL7RK4PMY3HRHHN4DPGYNX5PHWUQAZRFEJBU7TGI5',
+    'usdt': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Same as ETH
+    'bnb': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',
+    'bnb_tiger': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',
+}
+
+# How long responses to requests with an Idempotency-Key header are replayed (seconds)
+IDEMPOTENCY_TTL = 24 * 3600
+
 # Security
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
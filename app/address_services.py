@@ -0,0 +1,143 @@
+"""
+Deposit address services for QFS Ledger application
+
+Every user is handed their own address per coin from a pre-generated DepositAddress
+pool. Assignment is a conditional UPDATE, so two requests can never take the same
+address. The active (user, coin) -> address mapping is kept in process memory and
+reloaded when the DepositAddressRegistry version changes. The version is bumped in the
+same transaction as every retire, reassignment or removal, so changes made by any
+process are seen on the next lookup, which costs one primary-key read.
+"""
+import random
+import threading
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import DepositAddress, DepositAddressRegistry, DepositTransaction
+
+
+REGISTRY_ID = 1
+
+# Pool addresses tried per assignment attempt; picked at random so concurrent
+# requests do not all race for the lowest id
+ASSIGN_CANDIDATES = 16
+ASSIGN_ATTEMPTS = 5
+
+COINS = {coin for coin, _ in DepositTransaction.COIN_CHOICES}
+
+_registry = {'version': None, 'addresses': {}}
+_registry_lock = threading.Lock()
+
+
+def registry_version() -> int:
+    """The committed registry version: one primary-key lookup"""
+    return DepositAddressRegistry.objects.filter(pk=REGISTRY_ID).values_list('version', flat=True).first() or 0
+
+
+def invalidate_address_registry():
+    """
+    Bump the registry version in the current transaction, so every process reloads the
+    mapping on its first lookup after the change commits
+    """
+    DepositAddressRegistry.objects.bulk_create([DepositAddressRegistry(pk=REGISTRY_ID)], ignore_conflicts=True)
+    DepositAddressRegistry.objects.filter(pk=REGISTRY_ID).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def active_addresses() -> Dict[Tuple[int, str], str]:
+    """{(user_id, coin): address} for assigned addresses, reloaded when the registry version changes"""
+    global _registry
+    version = registry_version()
+    registry = _registry
+    if registry['version'] != version:
+        with _registry_lock:
+            registry = _registry
+            if registry['version'] != version:
+                addresses = {
+                    (user_id, coin): address
+                    for user_id, coin, address in DepositAddress.objects.filter(state='assigned')
+                    .values_list('user_id', 'coin', 'address').iterator(chunk_size=5000)
+                }
+                registry = _registry = {'version': version, 'addresses': addresses}
+    return registry['addresses']
+
+
+def _remember(user_id, coin, address):
+    # Assignments only add entries, so they go straight into this process's mapping;
+    # other processes pick them up on their first lookup for the user
+    with _registry_lock:
+        _registry['addresses'][(user_id, coin)] = address
+
+
+def assign_address(user_id, coin) -> Optional[str]:
+    """
+    Return the user's assigned address for a coin, assigning one from the pool if needed.
+    Returns None when the pool for the coin is empty.
+    """
+    for _ in range(ASSIGN_ATTEMPTS):
+        existing = DepositAddress.objects.filter(
+            user_id=user_id, coin=coin, state='assigned'
+        ).values_list('address', flat=True).first()
+        if existing:
+            return existing
+
+        candidates = list(
+            DepositAddress.objects.filter(coin=coin, state='available')
+            .order_by('id').values_list('id', 'address')[:ASSIGN_CANDIDATES]
+        )
+        if not candidates:
+            return None
+        random.shuffle(candidates)
+        for address_id, address in candidates:
+            try:
+                with transaction.atomic():
+                    claimed = DepositAddress.objects.filter(id=address_id, state='available').update(
+                        state='assigned', user_id=user_id, assigned_at=timezone.now()
+                    )
+            except IntegrityError:
+                # A concurrent request assigned this user an address first; read it back
+                break
+            if claimed:
+                return address
+    raise RuntimeError(f'Could not assign a {coin} deposit address, please retry')
+
+
+def get_deposit_address(user_id, coin) -> Optional[str]:
+    """
+    The address a user should send a coin to. Runs one query (the registry version) once the user has an address.
+    Falls back to the shared settings.DEPOSIT_ADDRESSES entry when the pool is empty,
+    and returns None for unsupported coins.
+    """
+    if coin not in COINS:
+        return None
+    address = active_addresses().get((user_id, coin))
+    if address:
+        return address
+    address = assign_address(user_id, coin)
+    if address:
+        _remember(user_id, coin, address)
+        return address
+    return getattr(settings, 'DEPOSIT_ADDRESSES', {}).get(coin)
+
+
+def load_address_pool(coin, addresses) -> int:
+    """Add addresses to a coin's pool; addresses already registered are skipped. Returns the number added."""
+    if coin not in COINS:
+        raise ValueError(f'Unsupported coin: {coin}')
+    addresses = list(dict.fromkeys(address.strip() for address in addresses if address.strip()))
+    before = DepositAddress.objects.filter(coin=coin).count()
+    DepositAddress.objects.bulk_create(
+        [DepositAddress(coin=coin, address=address) for address in addresses],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return DepositAddress.objects.filter(coin=coin).count() - before
+
+
+def available_counts() -> Dict[str, int]:
+    """Unassigned pool size per coin"""
+    return dict(
+        DepositAddress.objects.filter(state='available').order_by()
+        .values_list('coin').annotate(count=Count('id'))
+    )
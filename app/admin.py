@@ -4,8 +4,13 @@ from django.utils import timezone
 from django.contrib import messages
 from django.db.models import Q
 from django import forms
-from .models import Account, Transaction, JournalEntry, KYCVerification, SupportTicket, SupportReply, Notification, DepositTransaction, Wallet, WalletCopyTracking
-from .email_services import send_deposit_confirmation_email, send_bulk_deposit_confirmation_emails
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import Account, AccountBalance, AccountBalanceSnapshot, PeriodClose, Transaction, JournalEntry, KYCVerification, SupportTicket, SupportReply, Notification, NotificationCounter, DepositTransaction, DepositAddress, ChainTransfer, OutboxEvent, PendingDepositSummary, Wallet, WalletBalance, WalletCopyTracking
+from .email_services import send_bulk_deposit_confirmation_emails
+from .outbox_services import retry_failed_events
+from .address_services import invalidate_address_registry
+from .deposit_services import CONFIRM_BATCH_SIZE, confirm_deposits, review_queue
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
@@ -13,6 +18,34 @@ class AccountAdmin(admin.ModelAdmin):
     list_filter = ['account_type', 'is_active']
     search_fields = ['code', 'name']
 
+@admin.register(AccountBalance)
+class AccountBalanceAdmin(admin.ModelAdmin):
+    list_display = ['account', 'debit_total', 'credit_total', 'net', 'last_entry_id', 'updated_at']
+    list_select_related = ['account']
+    search_fields = ['account__code', 'account__name']
+    readonly_fields = ['account', 'debit_total', 'credit_total', 'net', 'last_entry_id', 'updated_at']
+    
+    def has_add_permission(self, request):
+        """Balances are maintained from journal postings only"""
+        return False
+
+class AccountBalanceSnapshotInline(admin.TabularInline):
+    model = AccountBalanceSnapshot
+    extra = 0
+    fields = ['account', 'debit_total', 'credit_total', 'net']
+    readonly_fields = ['account', 'debit_total', 'credit_total', 'net']
+    can_delete = False
+
+@admin.register(PeriodClose)
+class PeriodCloseAdmin(admin.ModelAdmin):
+    list_display = ['period_end', 'closed_at', 'closed_by']
+    readonly_fields = ['period_end', 'closed_at', 'closed_by']
+    inlines = [AccountBalanceSnapshotInline]
+    
+    def has_add_permission(self, request):
+        """Periods are closed with the close_period command or API so snapshots are built"""
+        return False
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['reference', 'description', 'date', 'user', 'created_at']
@@ -141,6 +174,18 @@ class NotificationAdmin(admin.ModelAdmin):
         return readonly_fields
 
 
+@admin.register(NotificationCounter)
+class NotificationCounterAdmin(admin.ModelAdmin):
+    list_display = ['user', 'unread_count', 'updated_at']
+    search_fields = ['user__username', 'user__email']
+    list_select_related = ['user']
+    readonly_fields = ['user', 'unread_count', 'updated_at']
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+
+
 class DepositTransactionForm(forms.ModelForm):
     """Custom form for DepositTransaction to indicate USD amount"""
     class Meta:
@@ -156,8 +201,11 @@ class DepositTransactionAdmin(admin.ModelAdmin):
     form = DepositTransactionForm
     list_display = ['user', 'coin_type', 'amount_formatted', 'status', 'email_sent_status', 'created_at']
     list_filter = ['coin_type', 'status', 'email_sent', 'created_at']
+    list_select_related = ['user']
+    # Skip the unfiltered COUNT(*) on every changelist load
+    show_full_result_count = False
     search_fields = ['user__username', 'user__email', 'wallet_address']
-    readonly_fields = ['created_at', 'wallet_address', 'email_sent']
+    readonly_fields = ['created_at', 'wallet_address', 'email_sent', 'credited_at']
     actions = ['confirm_deposits_and_send_emails', 'send_confirmation_emails']
     
     fieldsets = (
@@ -168,8 +216,8 @@ class DepositTransactionAdmin(admin.ModelAdmin):
             'fields': ('amount', 'status', 'created_at'),
             'description': 'Amount should be entered in USD (e.g., if user deposits $2000 worth of any crypto, enter 2000.00)'
         }),
-        ('Email Status', {
-            'fields': ('email_sent',)
+        ('Processing Status', {
+            'fields': ('credited_at', 'email_sent')
         }),
     )
     
@@ -204,33 +252,17 @@ class DepositTransactionAdmin(admin.ModelAdmin):
             self.message_user(request, "No pending deposits selected.", messages.WARNING)
             return
         
+        # Set-based confirmation in batches; emails are handed to the outbox worker's batch sender
+        pending_ids = list(pending_deposits.order_by('id').values_list('id', flat=True))
         confirmed_count = 0
-        email_results = {'success': 0, 'failed': 0, 'errors': []}
-        
-        for deposit in pending_deposits:
-            # Confirm the deposit
-            deposit.status = 'confirmed'
-            deposit.confirmed_at = timezone.now()
-            deposit.processed_by = request.user
-            deposit.save()
-            confirmed_count += 1
-            
-            # Send confirmation email
-            if send_deposit_confirmation_email(deposit):
-                email_results['success'] += 1
-            else:
-                email_results['failed'] += 1
-                email_results['errors'].append(f"Deposit #{deposit.id}")
+        for start in range(0, len(pending_ids), CONFIRM_BATCH_SIZE):
+            confirmed_count += len(confirm_deposits(pending_ids[start:start + CONFIRM_BATCH_SIZE], request.user))
         
-        # Show success message
-        message = f"Successfully confirmed {confirmed_count} deposit(s). "
-        message += f"Emails sent: {email_results['success']}, failed: {email_results['failed']}"
-        
-        if email_results['errors']:
-            message += f". Failed emails for: {', '.join(email_results['errors'])}"
-            self.message_user(request, message, messages.WARNING)
-        else:
-            self.message_user(request, message, messages.SUCCESS)
+        self.message_user(
+            request,
+            f"Successfully confirmed {confirmed_count} deposit(s). Wallet credits and emails are being processed.",
+            messages.SUCCESS
+        )
     
     confirm_deposits_and_send_emails.short_description = "Confirm selected deposits and send emails"
     
@@ -260,6 +292,22 @@ class DepositTransactionAdmin(admin.ModelAdmin):
             readonly_fields.extend(['user', 'coin_type'])
         return readonly_fields
     
+    def get_urls(self):
+        urls = [
+            path('review-queue/', self.admin_site.admin_view(self.review_queue_view), name='app_deposittransaction_review_queue'),
+        ]
+        return urls + super().get_urls()
+    
+    def review_queue_view(self, request):
+        """Pending deposits grouped by coin, with totals from PendingDepositSummary"""
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Pending deposit review queue',
+            'opts': self.model._meta,
+            'queue': review_queue(request.GET.get('coin') or None),
+        }
+        return TemplateResponse(request, 'admin/app/deposittransaction/review_queue.html', context)
+    
     def save_model(self, request, obj, form, change):
         if change and 'status' in form.changed_data:
             # If status is being changed, record the admin who processed it
@@ -268,28 +316,86 @@ class DepositTransactionAdmin(admin.ModelAdmin):
                 if obj.status == 'confirmed' and not obj.confirmed_at:
                     obj.confirmed_at = timezone.now()
                     
-                # Send email if deposit is confirmed and email not sent yet
+                # The wallet credit and email are queued by the post_save signal and sent by run_outbox
                 if obj.status == 'confirmed' and not obj.email_sent:
-                    if send_deposit_confirmation_email(obj):
-                        messages.success(request, f"Confirmation email sent to {obj.user.email}")
-                    else:
-                        messages.warning(request, f"Failed to send confirmation email to {obj.user.email}")
+                    messages.info(request, f"Confirmation email to {obj.user.email} queued")
                         
         super().save_model(request, obj, form, change)
 
 
+@admin.register(PendingDepositSummary)
+class PendingDepositSummaryAdmin(admin.ModelAdmin):
+    list_display = ['coin', 'pending_count', 'pending_amount', 'oldest_pending_at', 'updated_at']
+    readonly_fields = ['coin', 'pending_count', 'pending_amount', 'oldest_pending_at', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ChainTransfer)
+class ChainTransferAdmin(admin.ModelAdmin):
+    list_display = ['coin', 'txid', 'amount', 'usd_amount', 'block_time', 'deposit', 'matched_at']
+    list_filter = ['coin', ('deposit', admin.EmptyFieldListFilter)]
+    search_fields = ['txid', 'to_address']
+    list_select_related = ['deposit']
+    readonly_fields = ['coin', 'txid', 'to_address', 'amount', 'usd_amount', 'block_time', 'matched_at', 'created_at']
+    raw_id_fields = ['deposit']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DepositAddress)
+class DepositAddressAdmin(admin.ModelAdmin):
+    list_display = ['address', 'coin', 'state', 'user', 'assigned_at', 'created_at']
+    list_filter = ['coin', 'state']
+    search_fields = ['address', 'user__username', 'user__email']
+    list_select_related = ['user']
+    readonly_fields = ['assigned_at', 'created_at']
+    raw_id_fields = ['user']
+    show_full_result_count = False
+    actions = ['retire_addresses']
+    
+    def retire_addresses(self, request, queryset):
+        """Admin action to stop handing out addresses; their users get a new one on next request"""
+        count = queryset.exclude(state='retired').update(state='retired')
+        # Queryset updates skip the model signals
+        invalidate_address_registry()
+        self.message_user(request, f"{count} address(es) retired.", messages.SUCCESS)
+    retire_addresses.short_description = "Retire selected addresses"
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'topic', 'key', 'status', 'attempts', 'available_at', 'created_at', 'processed_at']
+    list_filter = ['status', 'topic']
+    search_fields = ['key']
+    readonly_fields = ['topic', 'key', 'payload', 'status', 'attempts', 'available_at', 'last_error', 'created_at', 'processed_at']
+    actions = ['retry_events']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def retry_events(self, request, queryset):
+        """Admin action to make failed events due again"""
+        count = retry_failed_events(queryset)
+        self.message_user(request, f"{count} failed event(s) queued for retry.", messages.SUCCESS)
+    retry_events.short_description = "Retry selected failed events"
+
+
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
     list_display = ['user', 'bitcoin_balance_formatted', 'ethereum_balance_formatted', 'ripple_balance_formatted', 'stellar_balance_formatted', 'usdt_balance_formatted', 'bnb_balance_formatted', 'bnb_tiger_balance_formatted', 'updated_at']
     search_fields = ['user__username', 'user__email']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['bitcoin_balance_formatted', 'ethereum_balance_formatted', 'ripple_balance_formatted', 'stellar_balance_formatted', 'usdt_balance_formatted', 'bnb_balance_formatted', 'bnb_tiger_balance_formatted', 'created_at', 'updated_at']
     
     fieldsets = (
         ('User', {
             'fields': ('user',)
         }),
         ('Balances', {
-            'fields': ('bitcoin_balance', 'ethereum_balance', 'ripple_balance', 'stellar_balance', 'usdt_balance', 'bnb_balance', 'bnb_tiger_balance')
+            'description': 'Balances are stored as Wallet Balance rows; edit them there.',
+            'fields': ('bitcoin_balance_formatted', 'ethereum_balance_formatted', 'ripple_balance_formatted', 'stellar_balance_formatted', 'usdt_balance_formatted', 'bnb_balance_formatted', 'bnb_tiger_balance_formatted')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
@@ -324,6 +430,10 @@ class WalletAdmin(admin.ModelAdmin):
         return f"{float(obj.bnb_tiger_balance):.4f}"
     bnb_tiger_balance_formatted.short_description = "BNB Tiger Balance"
     
+    def get_queryset(self, request):
+        # Load every wallet's balance rows in one query instead of one per row
+        return super().get_queryset(request).select_related('user').prefetch_related('user__wallet_balances')
+    
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = list(self.readonly_fields)
         if obj:  # Editing existing object
@@ -331,6 +441,15 @@ class WalletAdmin(admin.ModelAdmin):
         return readonly_fields
 
 
+@admin.register(WalletBalance)
+class WalletBalanceAdmin(admin.ModelAdmin):
+    list_display = ['user', 'coin', 'amount', 'updated_at']
+    list_filter = ['coin']
+    list_select_related = ['user']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['updated_at']
+
+
 @admin.register(WalletCopyTracking)
 class WalletCopyTrackingAdmin(admin.ModelAdmin):
     """Admin interface for Wallet Copy Tracking"""
@@ -0,0 +1,276 @@
+"""
+Chain watcher services for QFS Ledger application
+
+An asyncio watcher polls one backend per coin for transfers to the addresses of
+pending deposits, records them as ChainTransfer rows (idempotent on coin + txid),
+matches unmatched transfers to pending deposits by address, USD amount and time
+window, and confirms the matches through deposit_services.confirm_deposits. Only
+transfers to addresses assigned to one user from the DepositAddress pool are matched.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import List, NamedTuple, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from .models import ChainTransfer, DepositAddress, DepositTransaction
+from .deposit_services import CONFIRM_BATCH_SIZE, apply_pending_deltas, confirm_deposits
+
+
+class Transfer(NamedTuple):
+    coin: str
+    txid: str
+    to_address: str
+    amount: Decimal
+    block_time: datetime
+    usd_amount: Optional[Decimal] = None
+
+
+class ChainBackend:
+    """
+    Base backend. fetch_transfers returns transfers to any of addresses after cursor,
+    plus the cursor to pass next time (None on the first call).
+    """
+
+    async def fetch_transfers(self, coin: str, addresses, cursor=None) -> Tuple[List[Transfer], object]:
+        raise NotImplementedError
+
+
+class MockNodeBackend(ChainBackend):
+    """
+    Local stand-in node that replays a JSON fixture of transfers, for offline testing.
+
+    Fixture: {"transfers": [{"coin", "txid", "to", "amount", "usd_amount", "timestamp" | "seconds_ago"}]}.
+    "seconds_ago" is relative to when the fixture is loaded, so a fixture can be replayed at any time.
+    """
+
+    def __init__(self, path, batch_size=100, latency=0.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.latency = latency
+        self._transfers = None
+
+    def load(self) -> List[Transfer]:
+        if self._transfers is None:
+            with open(self.path, encoding='utf-8') as f:
+                rows = json.load(f)['transfers']
+            now = timezone.now()
+            self._transfers = [
+                Transfer(
+                    coin=row['coin'],
+                    txid=row['txid'],
+                    to_address=row['to'],
+                    amount=Decimal(str(row['amount'])),
+                    block_time=(
+                        parse_datetime(row['timestamp']) if 'timestamp' in row
+                        else now - timedelta(seconds=row.get('seconds_ago', 0))
+                    ),
+                    usd_amount=Decimal(str(row['usd_amount'])) if row.get('usd_amount') is not None else None,
+                )
+                for row in rows
+            ]
+        return self._transfers
+
+    async def fetch_transfers(self, coin, addresses, cursor=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        addresses = set(addresses)
+        position = cursor or 0
+        transfers = [transfer for transfer in self.load() if transfer.coin == coin]
+        batch = transfers[position:position + self.batch_size]
+        return [transfer for transfer in batch if transfer.to_address in addresses], position + len(batch)
+
+
+def get_backends(coins=None) -> dict:
+    """Instantiate the configured backend for each coin in settings.CHAIN_BACKENDS"""
+    configured = getattr(settings, 'CHAIN_BACKENDS', {})
+    return {
+        coin: import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        for coin, config in configured.items()
+        if coins is None or coin in coins
+    }
+
+
+def match_window() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'CHAIN_MATCH_WINDOW', 48 * 3600))
+
+
+def amount_tolerance() -> Decimal:
+    return Decimal(str(getattr(settings, 'CHAIN_AMOUNT_TOLERANCE', '0.02')))
+
+
+def watched_addresses(coin) -> List[str]:
+    """Deposit addresses with pending deposits for a coin"""
+    return list(
+        DepositTransaction.objects.filter(status='pending', coin_type=coin)
+        .order_by().values_list('wallet_address', flat=True).distinct()
+    )
+
+
+def record_transfers(transfers: List[Transfer]) -> int:
+    """
+    Store transfers, valuing them in USD with the price oracle when the backend did not.
+    Transfers already recorded are ignored. Returns the number of transfers passed in.
+    """
+    if not transfers:
+        return 0
+    prices = {}
+    if any(transfer.usd_amount is None for transfer in transfers):
+        from .price_services import get_prices
+        prices = get_prices()['prices']
+
+    rows = []
+    for transfer in transfers:
+        usd_amount = transfer.usd_amount
+        if usd_amount is None and transfer.coin in prices:
+            try:
+                usd_amount = (transfer.amount * Decimal(prices[transfer.coin])).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                usd_amount = None
+        rows.append(ChainTransfer(
+            coin=transfer.coin,
+            txid=transfer.txid,
+            to_address=transfer.to_address,
+            amount=transfer.amount,
+            usd_amount=usd_amount,
+            block_time=transfer.block_time,
+        ))
+    ChainTransfer.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def _amount_matches(deposit_amount, usd_amount, tolerance) -> bool:
+    return abs(deposit_amount - usd_amount) <= deposit_amount * tolerance
+
+
+def find_matches(transfers, deposits, window, tolerance) -> list:
+    """
+    Pair transfers with deposits. A deposit matches a transfer to its address within the time
+    window when its USD amount is within tolerance, or, failing that, when it has no amount.
+    Either way it must be the only such candidate: ambiguous transfers are left unmatched for
+    manual review rather than guessed. Each deposit is used once.
+
+    Returns:
+        list of (transfer, deposit) pairs
+    """
+    matches, used = [], set()
+    for transfer in transfers:
+        if transfer.usd_amount is None:
+            continue
+        candidates = [
+            deposit for deposit in deposits
+            if deposit.id not in used
+            and deposit.wallet_address == transfer.to_address
+            and abs(deposit.created_at - transfer.block_time) <= window
+        ]
+        by_amount = [
+            deposit for deposit in candidates
+            if deposit.amount and _amount_matches(deposit.amount, transfer.usd_amount, tolerance)
+        ]
+        open_amount = [deposit for deposit in candidates if not deposit.amount]
+        chosen = by_amount or open_amount
+        if len(chosen) == 1:
+            used.add(chosen[0].id)
+            matches.append((transfer, chosen[0]))
+    return matches
+
+
+def match_transfers(coin, limit=CONFIRM_BATCH_SIZE) -> int:
+    """
+    Match one batch of unmatched transfers for a coin and confirm the deposits they fund.
+    Returns the number of deposits confirmed.
+    """
+    window = match_window()
+    # Only an address assigned to one user identifies the depositor: transfers to shared or
+    # retired addresses are left for manual review and, like transfers too old to match a
+    # new deposit, must not fill the batch
+    assigned = DepositAddress.objects.filter(coin=coin, state='assigned')
+    transfers = list(
+        ChainTransfer.objects.filter(
+            coin=coin, deposit__isnull=True, usd_amount__isnull=False, block_time__gte=timezone.now() - window,
+            to_address__in=assigned.values('address'),
+        ).order_by('block_time', 'id')[:limit]
+    )
+    if not transfers:
+        return 0
+    owners = dict(
+        assigned.filter(address__in={transfer.to_address for transfer in transfers}).values_list('address', 'user_id')
+    )
+    deposits = [
+        deposit for deposit in DepositTransaction.objects.filter(
+            status='pending',
+            coin_type=coin,
+            wallet_address__in=set(owners),
+            created_at__gte=transfers[0].block_time - window,
+            created_at__lte=transfers[-1].block_time + window,
+        ).order_by('created_at')
+        if owners[deposit.wallet_address] == deposit.user_id
+    ]
+    matches = find_matches(transfers, deposits, window, amount_tolerance())
+    if not matches:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        priced = []
+        for transfer, deposit in matches:
+            transfer.deposit = deposit
+            transfer.matched_at = now
+            if not deposit.amount:
+                deposit.amount = transfer.usd_amount
+                priced.append(deposit)
+        DepositTransaction.objects.bulk_update(priced, ['amount'])
+        # bulk_update skips signals; count the new amounts into the pending totals before confirming
+        apply_pending_deltas({coin: (0, sum(deposit.amount for deposit in priced))})
+        ChainTransfer.objects.bulk_update([transfer for transfer, _ in matches], ['deposit', 'matched_at'])
+        confirmed = confirm_deposits([deposit.id for _, deposit in matches])
+    return len(confirmed)
+
+
+async def poll_coin(coin, backend, cursor=None):
+    """Fetch and record new transfers for one coin; returns the backend's next cursor"""
+    addresses = await sync_to_async(watched_addresses)(coin)
+    if not addresses:
+        return cursor
+    transfers, cursor = await backend.fetch_transfers(coin, addresses, cursor)
+    await sync_to_async(record_transfers)(transfers)
+    return cursor
+
+
+async def watch(backends: dict, interval=15.0, once=False, on_cycle=None):
+    """
+    Poll every coin's backend concurrently, then match and confirm in batches; repeat every interval.
+    A coin whose polling or matching fails is skipped for that cycle; on_cycle(confirmed_by_coin,
+    errors_by_coin) is called after each cycle.
+    """
+    cursors = {coin: None for coin in backends}
+    while True:
+        results = await asyncio.gather(
+            *(poll_coin(coin, backend, cursors[coin]) for coin, backend in backends.items()),
+            return_exceptions=True,
+        )
+        errors = {}
+        for coin, result in zip(backends, results):
+            if isinstance(result, Exception):
+                errors[coin] = result
+            else:
+                cursors[coin] = result
+
+        confirmed = {}
+        for coin in backends:
+            # One coin failing to match must not stop the others or the watcher
+            try:
+                confirmed[coin] = await sync_to_async(match_transfers)(coin)
+            except Exception as e:
+                confirmed[coin] = 0
+                errors[coin] = e
+        if on_cycle:
+            on_cycle(confirmed, errors)
+        if once:
+            return confirmed
+        await asyncio.sleep(interval)
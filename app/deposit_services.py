@@ -0,0 +1,281 @@
+"""
+Deposit services for QFS Ledger application
+"""
+import uuid
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Min, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import DepositTransaction, Notification, PendingDepositSummary, Wallet, WalletBalance
+from .notification_services import create_notifications
+from .outbox_services import enqueue, register_handler
+
+
+DEPOSIT_CONFIRMED = 'deposit.confirmed'
+DEPOSIT_EMAIL_BATCH = 'deposit.email_batch'
+
+# Deposits confirmed per transaction by confirm_deposits callers
+CONFIRM_BATCH_SIZE = 500
+
+
+def enqueue_deposit_confirmation(deposit: DepositTransaction):
+    """Record that a confirmed deposit needs crediting, a notification and an email"""
+    return enqueue(DEPOSIT_CONFIRMED, deposit.id, {'deposit_id': deposit.id})
+
+
+def credit_confirmed_deposit(deposit: DepositTransaction) -> bool:
+    """
+    Create the notification and credit the wallet for a confirmed deposit, exactly once.
+
+    The deposit is claimed by setting credited_at with a conditional UPDATE in the same
+    transaction as the credit, so retries and concurrent workers cannot credit twice.
+
+    Returns:
+        bool: True if this call credited the deposit, False if it was already credited
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        claimed = DepositTransaction.objects.filter(
+            id=deposit.id, status='confirmed', credited_at__isnull=True
+        ).update(credited_at=now)
+        if not claimed:
+            return False
+
+        # ON CONFLICT DO NOTHING on (deposit, type): never a second notification for the deposit
+        create_notifications([confirmation_notification(deposit, now)])
+
+        if deposit.amount and deposit.amount > 0:
+            wallet, _ = Wallet.objects.get_or_create(user=deposit.user)
+            wallet.add_balance(deposit.coin_type, deposit.amount)
+
+        if not deposit.confirmed_at:
+            DepositTransaction.objects.filter(id=deposit.id, confirmed_at__isnull=True).update(confirmed_at=now)
+        deposit.credited_at = now
+        return True
+
+
+def confirmation_notification(deposit: DepositTransaction, created_at) -> Notification:
+    return Notification(
+        user_id=deposit.user_id,
+        deposit_id=deposit.id,
+        type='deposit_confirmed',
+        title=f'Deposit #{deposit.id} Confirmed',
+        message=f'Your {deposit.get_coin_type_display()} deposit of ${deposit.amount or 0:.2f} USD has been confirmed and credited to your wallet.',
+        created_at=created_at
+    )
+
+
+def credit_wallets(credits: dict, now=None):
+    """
+    Add {(user_id, coin): amount} to wallet balances with one UPDATE for the whole batch
+    """
+    credits = {pair: amount for pair, amount in credits.items() if amount}
+    if not credits:
+        return
+    now = now or timezone.now()
+    WalletBalance.objects.bulk_create(
+        [WalletBalance(user_id=user_id, coin=coin) for user_id, coin in credits],
+        ignore_conflicts=True,
+    )
+    pairs = Q()
+    whens = []
+    for (user_id, coin), amount in credits.items():
+        pairs |= Q(user_id=user_id, coin=coin)
+        whens.append(When(user_id=user_id, coin=coin, then=Value(amount)))
+    WalletBalance.objects.filter(pairs).update(
+        amount=F('amount') + Case(*whens, default=Value(0), output_field=DecimalField(max_digits=15, decimal_places=2)),
+        updated_at=now,
+    )
+    # Bumping updated_at moves every process's cached balances for these users on to a new key
+    Wallet.objects.filter(user_id__in={user_id for user_id, _ in credits}).update(updated_at=now)
+
+
+def confirm_deposits(deposit_ids, processed_by=None) -> list:
+    """
+    Confirm pending deposits as a set, in one transaction and a constant number of queries:
+    one UPDATE of status/confirmed_at/processed_by/credited_at, one UPDATE crediting every
+    (user, coin) total, one bulk insert of notifications and one outbox event that hands the
+    emails to the batch sender.
+
+    Returns:
+        list: the confirmed DepositTransaction instances
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        deposits = list(
+            DepositTransaction.objects.select_for_update()
+            .filter(id__in=list(deposit_ids), status='pending')
+            .order_by('id')
+        )
+        if not deposits:
+            return []
+        ids = [deposit.id for deposit in deposits]
+
+        updated = DepositTransaction.objects.filter(id__in=ids, status='pending').update(
+            status='confirmed',
+            confirmed_at=Coalesce(F('confirmed_at'), Value(now)),
+            processed_by=processed_by,
+            credited_at=now,
+        )
+        if updated != len(deposits):
+            raise RuntimeError('Deposits changed while being confirmed; nothing was confirmed, please retry')
+
+        credits = defaultdict(int)
+        pending_deltas = defaultdict(lambda: (0, 0))
+        for deposit in deposits:
+            if deposit.amount and deposit.amount > 0:
+                credits[(deposit.user_id, deposit.coin_type)] += deposit.amount
+            count, amount = pending_deltas[deposit.coin_type]
+            pending_deltas[deposit.coin_type] = (count - 1, amount - (deposit.amount or 0))
+        credit_wallets(credits, now)
+        apply_pending_deltas(pending_deltas)
+
+        create_notifications([confirmation_notification(deposit, now) for deposit in deposits])
+        enqueue(DEPOSIT_EMAIL_BATCH, uuid.uuid4().hex, {'deposit_ids': ids})
+
+        for deposit in deposits:
+            deposit.status = 'confirmed'
+            deposit.confirmed_at = deposit.confirmed_at or now
+            deposit.processed_by = processed_by
+            deposit.credited_at = now
+        return deposits
+
+
+def pending_contribution(status, coin_type, amount) -> dict:
+    """What one deposit adds to the pending summaries: {coin: (count, amount)}"""
+    if status != 'pending':
+        return {}
+    # Unsaved instances may still hold the raw request value (e.g. a string)
+    amount = DepositTransaction._meta.get_field('amount').to_python(amount)
+    return {coin_type: (1, amount or 0)}
+
+
+def pending_delta(before: dict, after: dict) -> dict:
+    """Summary change when a deposit goes from contribution before to contribution after"""
+    deltas = {}
+    for coin in set(before) | set(after):
+        old_count, old_amount = before.get(coin, (0, 0))
+        new_count, new_amount = after.get(coin, (0, 0))
+        deltas[coin] = (new_count - old_count, new_amount - old_amount)
+    return deltas
+
+
+def apply_pending_deltas(deltas: dict):
+    """
+    Add {coin: (count, amount)} to the pending summaries with one UPDATE per coin.
+    The oldest pending date is re-read through the (status, coin_type, created_at) index.
+    """
+    deltas = {coin: delta for coin, delta in deltas.items() if delta != (0, 0)}
+    if not deltas:
+        return
+    PendingDepositSummary.objects.bulk_create(
+        [PendingDepositSummary(coin=coin) for coin in deltas], ignore_conflicts=True
+    )
+    now = timezone.now()
+    for coin, (count, amount) in deltas.items():
+        oldest = DepositTransaction.objects.filter(
+            status='pending', coin_type=coin
+        ).order_by('created_at').values('created_at')[:1]
+        PendingDepositSummary.objects.filter(coin=coin).update(
+            pending_count=F('pending_count') + count,
+            pending_amount=F('pending_amount') + amount,
+            oldest_pending_at=Subquery(oldest),
+            updated_at=now,
+        )
+
+
+def rebuild_pending_summaries() -> int:
+    """Recompute every coin's pending summary from the deposits table"""
+    totals = {
+        row['coin_type']: row
+        for row in DepositTransaction.objects.filter(status='pending').order_by().values('coin_type').annotate(
+            count=Count('id'), amount=Sum('amount'), oldest=Min('created_at')
+        )
+    }
+    now = timezone.now()
+    summaries = [
+        PendingDepositSummary(
+            coin=coin,
+            pending_count=totals.get(coin, {}).get('count', 0),
+            pending_amount=totals.get(coin, {}).get('amount') or 0,
+            oldest_pending_at=totals.get(coin, {}).get('oldest'),
+            updated_at=now,
+        )
+        for coin, _ in DepositTransaction.COIN_CHOICES
+    ]
+    with transaction.atomic():
+        PendingDepositSummary.objects.all().delete()
+        PendingDepositSummary.objects.bulk_create(summaries)
+    return len(summaries)
+
+
+def review_queue(coin=None, limit=50) -> list:
+    """
+    Pending deposits grouped by coin, oldest first, with the cached per-coin totals.
+    Costs one summary query plus one indexed query per coin with pending work.
+    """
+    coins = [coin] if coin else [choice for choice, _ in DepositTransaction.COIN_CHOICES]
+    labels = dict(DepositTransaction.COIN_CHOICES)
+    now = timezone.now()
+    queue = []
+    for summary in PendingDepositSummary.objects.filter(coin__in=coins, pending_count__gt=0).order_by('coin'):
+        deposits = (
+            DepositTransaction.objects.filter(status='pending', coin_type=summary.coin)
+            .select_related('user')
+            .order_by('created_at')[:limit]
+        )
+        queue.append({
+            'coin': summary.coin,
+            'coin_display': labels.get(summary.coin, summary.coin),
+            'pending_count': summary.pending_count,
+            'pending_amount': summary.pending_amount,
+            'oldest_pending_at': summary.oldest_pending_at,
+            'oldest_age_seconds': int((now - summary.oldest_pending_at).total_seconds()) if summary.oldest_pending_at else None,
+            'deposits': [
+                {
+                    'id': deposit.id,
+                    'user_id': deposit.user_id,
+                    'username': deposit.user.username,
+                    'email': deposit.user.email,
+                    'amount': deposit.amount,
+                    'wallet_address': deposit.wallet_address,
+                    'created_at': deposit.created_at,
+                    'age_seconds': int((now - deposit.created_at).total_seconds()),
+                }
+                for deposit in deposits
+            ],
+        })
+    return queue
+
+
+@register_handler(DEPOSIT_EMAIL_BATCH)
+def handle_deposit_email_batch(payload: dict):
+    """Outbox handler: send confirmation emails for a batch; a retry only resends the unsent ones"""
+    from .email_services import send_bulk_deposit_confirmation_emails
+
+    deposits = list(
+        DepositTransaction.objects.select_related('user')
+        .filter(id__in=payload['deposit_ids'], status='confirmed', email_sent=False)
+        .exclude(user__email='')
+    )
+    results = send_bulk_deposit_confirmation_emails(deposits)
+    if results['failed']:
+        raise RuntimeError(f"{results['failed']} of {results['total']} confirmation emails were not sent")
+
+
+@register_handler(DEPOSIT_CONFIRMED)
+def handle_deposit_confirmed(payload: dict):
+    """Outbox handler: credit the deposit once, then send the confirmation email (retried until sent)"""
+    from .email_services import send_deposit_confirmation_email
+
+    deposit = DepositTransaction.objects.select_related('user').filter(id=payload['deposit_id']).first()
+    if deposit is None or deposit.status != 'confirmed':
+        # Deleted or un-confirmed before the worker got to it
+        return
+
+    credit_confirmed_deposit(deposit)
+
+    if not deposit.email_sent and deposit.user.email:
+        if not send_deposit_confirmation_email(deposit):
+            raise RuntimeError(f'Confirmation email for deposit #{deposit.id} was not sent')
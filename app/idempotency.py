@@ -0,0 +1,144 @@
+"""
+Idempotency-Key support for QFS Ledger API views
+
+A client that retries a POST sends the same Idempotency-Key header. The first request
+with a key claims it by inserting an IdempotencyKey row, unique on (user, key), runs the
+view and stores the rendered response on the row for IDEMPOTENCY_TTL seconds; repeats
+replay the stored response without running the view. A duplicate that arrives while
+the first is still running waits for it instead of racing it. The claim lives in the
+database, so duplicates reaching different worker processes see the same one.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# How long an in-flight claim lives if the worker dies, and how long duplicates wait for it
+IN_FLIGHT_TIMEOUT = 60
+WAIT_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+
+def idempotency_ttl() -> int:
+    return getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600)
+
+
+def request_fingerprint(request) -> str:
+    """Hash of method, path and body, so a key reused for a different request is detected"""
+    try:
+        body = request.body
+    except Exception:
+        # Body stream already consumed; fall back to the parsed data
+        data = request.data
+        data = {key: data.getlist(key) for key in data} if hasattr(data, 'getlist') else data
+        body = json.dumps(data, sort_keys=True, default=str).encode()
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _replay(entry) -> Response:
+    response = Response(json.loads(entry['response_body']), status=entry['status_code'])
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def _claim(user_id, key_hash, fingerprint) -> bool:
+    """Insert the in-flight row for (user, key); False when another request holds it"""
+    now = timezone.now()
+    # An expired row (replay window over, or a dead worker's lease) no longer blocks the key
+    IdempotencyKey.objects.filter(user_id=user_id, key=key_hash, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user_id=user_id, key=key_hash, fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=IN_FLIGHT_TIMEOUT),
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _entry(user_id, key_hash):
+    return IdempotencyKey.objects.filter(
+        user_id=user_id, key=key_hash, expires_at__gt=timezone.now()
+    ).values('fingerprint', 'state', 'status_code', 'response_body').first()
+
+
+def purge_expired_keys() -> int:
+    """Delete keys whose replay window or in-flight lease has ended"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def idempotent(view_func):
+    """
+    Make a DRF function view idempotent per (user, Idempotency-Key).
+    Apply it below @api_view/@permission_classes so request.user is authenticated.
+    """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({
+                'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.pk
+        key_hash = hashlib.sha256(key.encode()).hexdigest()
+        fingerprint = request_fingerprint(request)
+
+        # The unique (user, key) insert is atomic: exactly one request claims the key
+        if not _claim(user_id, key_hash, fingerprint):
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            entry = _entry(user_id, key_hash)
+            while entry and entry['fingerprint'] == fingerprint and entry['state'] == 'in_flight' and time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                entry = _entry(user_id, key_hash)
+            if entry is None:
+                # The first request failed and released the key; run this one normally
+                return wrapper(request, *args, **kwargs)
+            if entry['fingerprint'] != fingerprint:
+                return Response({
+                    'error': f'{HEADER} was already used for a different request'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if entry['state'] == 'in_flight':
+                return Response({
+                    'error': 'A request with this Idempotency-Key is still being processed'
+                }, status=status.HTTP_409_CONFLICT)
+            return _replay(entry)
+
+        claimed = IdempotencyKey.objects.filter(user_id=user_id, key=key_hash)
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            claimed.delete()
+            raise
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            # Let the client retry server errors with the same key
+            claimed.delete()
+        else:
+            claimed.update(
+                state='done',
+                status_code=response.status_code,
+                response_body=JSONRenderer().render(response.data).decode(),
+                expires_at=timezone.now() + timedelta(seconds=idempotency_ttl()),
+            )
+        return response
+
+    return wrapper
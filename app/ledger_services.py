@@ -0,0 +1,774 @@
+"""
+Ledger services for QFS Ledger application
+"""
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Q, RowRange, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .models import (
+    Account, AccountBalance, AccountBalanceSnapshot, AccountClosure, PeriodClose, Transaction, JournalEntry
+)
+
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+MAX_BULK_ENTRIES = 20000
+ENTRY_TYPES = {choice[0] for choice in JournalEntry.ENTRY_TYPES}
+
+
+def money(value) -> Decimal:
+    """
+    Normalise an aggregated amount to cents (SQLite sums decimals as floats).
+    """
+    return Decimal(value or 0).quantize(CENT)
+
+
+def entry_amounts(entry_type: str, amount) -> tuple[Decimal, Decimal]:
+    """
+    Split a journal entry amount into its (debit, credit) pair.
+    """
+    amount = Decimal(amount or 0)
+    if entry_type == 'DEBIT':
+        return amount, ZERO
+    return ZERO, amount
+
+
+def apply_balance_deltas(deltas: dict, create_missing: bool = True) -> None:
+    """
+    Apply aggregated postings to the AccountBalance projection.
+
+    Args:
+        deltas: Mapping of account_id -> (debit, credit, last_entry_id)
+        create_missing: Create projection rows for accounts that have none yet
+    """
+    with transaction.atomic():
+        for account_id, (debit, credit, last_entry_id) in deltas.items():
+            updates = {
+                'debit_total': F('debit_total') + debit,
+                'credit_total': F('credit_total') + credit,
+                'net': F('net') + (debit - credit),
+                'updated_at': timezone.now(),
+            }
+            if last_entry_id:
+                updates['last_entry_id'] = Greatest(Coalesce(F('last_entry_id'), Value(0)), Value(last_entry_id))
+
+            updated = AccountBalance.objects.filter(account_id=account_id).update(**updates)
+            if not updated and create_missing:
+                AccountBalance.objects.get_or_create(account_id=account_id)
+                AccountBalance.objects.filter(account_id=account_id).update(**updates)
+
+
+def post_entry_balance(entry: JournalEntry, reverse: bool = False) -> None:
+    """
+    Apply (or reverse) a single journal entry on its account balance.
+    """
+    debit, credit = entry_amounts(entry.entry_type, entry.amount)
+    if reverse:
+        apply_balance_deltas({entry.account_id: (-debit, -credit, None)}, create_missing=False)
+    else:
+        apply_balance_deltas({entry.account_id: (debit, credit, entry.id)})
+
+
+def aggregate_journal_totals(entries=None) -> dict:
+    """
+    Compute per-account totals straight from the journal with a single GROUP BY.
+
+    Returns:
+        dict: account_id -> (debit, credit, last_entry_id)
+    """
+    if entries is None:
+        entries = JournalEntry.objects.all()
+
+    rows = entries.order_by().values('account').annotate(
+        debit=Coalesce(Sum('amount', filter=Q(entry_type='DEBIT')), Value(ZERO)),
+        credit=Coalesce(Sum('amount', filter=Q(entry_type='CREDIT')), Value(ZERO)),
+        last_entry_id=Max('id'),
+    )
+    return {
+        row['account']: (money(row['debit']), money(row['credit']), row['last_entry_id'])
+        for row in rows
+    }
+
+
+def rebuild_account_balances() -> int:
+    """
+    Rebuild the AccountBalance projection from scratch.
+
+    Returns:
+        int: Number of projection rows written
+    """
+    totals = aggregate_journal_totals()
+    with transaction.atomic():
+        AccountBalance.objects.all().delete()
+        AccountBalance.objects.bulk_create([
+            AccountBalance(
+                account_id=account_id,
+                debit_total=debit,
+                credit_total=credit,
+                net=debit - credit,
+                last_entry_id=last_entry_id,
+            )
+            for account_id, (debit, credit, last_entry_id) in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+def verify_account_balances() -> list[str]:
+    """
+    Compare the AccountBalance projection against the journal.
+
+    Returns:
+        list: Human readable description of every mismatch (empty when consistent)
+    """
+    expected = aggregate_journal_totals()
+    stored = {
+        row['account_id']: row
+        for row in AccountBalance.objects.values('account_id', 'debit_total', 'credit_total', 'net')
+    }
+
+    problems = []
+    for account_id in sorted(set(expected) | set(stored)):
+        debit, credit, _ = expected.get(account_id, (ZERO, ZERO, None))
+        row = stored.get(account_id)
+        if row is None:
+            problems.append(f"Account {account_id}: missing balance row")
+            continue
+        if (row['debit_total'], row['credit_total'], row['net']) != (debit, credit, debit - credit):
+            problems.append(
+                f"Account {account_id}: stored debit={row['debit_total']} credit={row['credit_total']} net={row['net']}, "
+                f"journal debit={debit} credit={credit} net={debit - credit}"
+            )
+    return problems
+
+
+
+def merge_deltas(entries) -> dict:
+    """
+    Aggregate journal entries into per-account balance deltas.
+    """
+    deltas = defaultdict(lambda: [ZERO, ZERO, None])
+    for entry in entries:
+        debit, credit = entry_amounts(entry.entry_type, entry.amount)
+        delta = deltas[entry.account_id]
+        delta[0] += debit
+        delta[1] += credit
+        if entry.id and (delta[2] is None or entry.id > delta[2]):
+            delta[2] = entry.id
+    return {account_id: tuple(delta) for account_id, delta in deltas.items()}
+
+
+def _parse_amount(value):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not amount.is_finite() or amount <= 0 or amount.as_tuple().exponent < -2 or amount >= Decimal('1e13'):
+        return None
+    return amount
+
+
+def validate_posting(item, account_ids) -> tuple[dict, dict]:
+    """
+    Validate one transaction of a bulk posting.
+
+    Args:
+        item: Raw transaction payload with nested 'entries'
+        account_ids: Set of existing account ids
+
+    Returns:
+        tuple: (errors, cleaned) - errors is empty when the transaction is valid
+    """
+    errors = {}
+    if not isinstance(item, dict):
+        return {'non_field_errors': ['Transaction must be an object']}, {}
+
+    reference = item.get('reference')
+    if not reference or not isinstance(reference, str):
+        errors['reference'] = ['Reference is required']
+    elif len(reference) > 50:
+        errors['reference'] = ['Reference cannot exceed 50 characters']
+
+    description = item.get('description')
+    if not description or not isinstance(description, str):
+        errors['description'] = ['Description is required']
+
+    try:
+        posting_date = date.fromisoformat(str(item.get('date')))
+    except ValueError:
+        posting_date = None
+        errors['date'] = ['Date must be in YYYY-MM-DD format']
+
+    entries = item.get('entries')
+    cleaned_entries = []
+    if not isinstance(entries, list) or len(entries) < 2:
+        errors['entries'] = ['At least two entries are required']
+    else:
+        entry_errors = {}
+        total_debit = total_credit = ZERO
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                entry_errors[index] = ['Entry must be an object']
+                continue
+            account_id = entry.get('account')
+            entry_type = entry.get('entry_type')
+            amount = _parse_amount(entry.get('amount'))
+            problems = []
+            if isinstance(account_id, bool) or not isinstance(account_id, int) or account_id not in account_ids:
+                problems.append('Unknown account')
+            if entry_type not in ENTRY_TYPES:
+                problems.append('Entry type must be DEBIT or CREDIT')
+            if amount is None:
+                problems.append('Amount must be a positive number with at most 2 decimal places')
+            if problems:
+                entry_errors[index] = problems
+                continue
+            if entry_type == 'DEBIT':
+                total_debit += amount
+            else:
+                total_credit += amount
+            cleaned_entries.append((account_id, entry_type, amount))
+
+        if entry_errors:
+            errors['entries'] = entry_errors
+        elif total_debit != total_credit:
+            errors['entries'] = [f'Debits ({total_debit}) must equal credits ({total_credit})']
+
+    if errors:
+        return errors, {}
+    return {}, {
+        'reference': reference,
+        'description': description,
+        'date': posting_date,
+        'entries': cleaned_entries,
+    }
+
+
+def validate_postings(items) -> tuple[list, list]:
+    """
+    Validate a batch of transactions, checking references against the payload and the database.
+
+    Returns:
+        tuple: (errors per item, cleaned postings per item)
+    """
+    account_ids = set()
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get('entries'), list):
+            account_ids.update(
+                entry.get('account') for entry in item['entries']
+                if isinstance(entry, dict) and isinstance(entry.get('account'), int)
+            )
+    account_ids = set(Account.objects.filter(id__in=account_ids).values_list('id', flat=True))
+
+    results = [validate_posting(item, account_ids) for item in items]
+    errors = [result[0] for result in results]
+    cleaned = [result[1] for result in results]
+
+    references = [posting['reference'] for posting in cleaned if posting]
+    existing = set(Transaction.objects.filter(reference__in=references).values_list('reference', flat=True))
+    closed = closed_through()
+    seen = set()
+    for index, posting in enumerate(cleaned):
+        if not posting:
+            continue
+        reference = posting['reference']
+        if reference in existing or reference in seen:
+            errors[index] = {'reference': ['Transaction with this reference already exists']}
+            cleaned[index] = {}
+        elif closed and posting['date'] <= closed:
+            errors[index] = {'date': [f'Period is closed through {closed}']}
+            cleaned[index] = {}
+        seen.add(reference)
+    return errors, cleaned
+
+
+def create_postings(user, postings) -> list[Transaction]:
+    """
+    Write validated postings with bulk inserts and update AccountBalance once per account.
+
+    Args:
+        user: User recorded on every transaction
+        postings: Cleaned postings from validate_postings
+
+    Returns:
+        list: Created Transaction instances in input order
+    """
+    with transaction.atomic():
+        transactions = Transaction.objects.bulk_create([
+            Transaction(
+                reference=posting['reference'],
+                description=posting['description'],
+                date=posting['date'],
+                user=user,
+            )
+            for posting in postings
+        ], batch_size=500)
+
+        entries = JournalEntry.objects.bulk_create([
+            JournalEntry(transaction_id=txn.id, account_id=account_id, entry_type=entry_type, amount=amount)
+            for txn, posting in zip(transactions, postings)
+            for account_id, entry_type, amount in posting['entries']
+        ], batch_size=500)
+
+        apply_balance_deltas(merge_deltas(entries))
+    return transactions
+
+
+def link_account(account: Account) -> None:
+    """
+    Insert closure rows for a newly created account: itself plus every ancestor of its parent.
+    """
+    links = [AccountClosure(ancestor_id=account.id, descendant_id=account.id, depth=0)]
+    if account.parent_id:
+        links.extend(
+            AccountClosure(ancestor_id=ancestor_id, descendant_id=account.id, depth=depth + 1)
+            for ancestor_id, depth in AccountClosure.objects.filter(
+                descendant_id=account.parent_id
+            ).values_list('ancestor_id', 'depth')
+        )
+    AccountClosure.objects.bulk_create(links)
+
+
+def check_account_move(account: Account, new_parent_id) -> None:
+    """
+    Reject moving an account underneath itself or one of its descendants.
+    """
+    if new_parent_id and AccountClosure.objects.filter(ancestor_id=account.id, descendant_id=new_parent_id).exists():
+        raise ValidationError('An account cannot be moved under itself or one of its sub-accounts')
+
+
+def move_account(account: Account) -> None:
+    """
+    Re-link an account's whole subtree after its parent changed.
+    """
+    with transaction.atomic():
+        subtree = list(AccountClosure.objects.filter(ancestor_id=account.id).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+
+        # Drop links from the old ancestors into the subtree, keep links inside it
+        AccountClosure.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+        if account.parent_id:
+            ancestors = list(AccountClosure.objects.filter(descendant_id=account.parent_id).values_list('ancestor_id', 'depth'))
+            AccountClosure.objects.bulk_create([
+                AccountClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, depth in subtree
+            ], batch_size=1000)
+
+
+def rebuild_account_closure() -> int:
+    """
+    Rebuild the closure table from Account.parent.
+
+    Returns:
+        int: Number of closure rows written
+    """
+    parents = dict(Account.objects.values_list('id', 'parent_id'))
+    links = []
+    for account_id in parents:
+        node, depth, visited = account_id, 0, set()
+        while node is not None and node not in visited:
+            visited.add(node)
+            links.append(AccountClosure(ancestor_id=node, descendant_id=account_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    with transaction.atomic():
+        AccountClosure.objects.all().delete()
+        AccountClosure.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def subtree_accounts(account_id):
+    """
+    All accounts under account_id (itself included) with their depth, in one indexed query.
+    """
+    return Account.objects.filter(ancestor_links__ancestor_id=account_id).annotate(
+        depth=F('ancestor_links__depth')
+    ).order_by('code')
+
+
+def ancestor_accounts(account_id):
+    """
+    The ancestor chain of account_id from the root down, in one indexed query.
+    """
+    return Account.objects.filter(descendant_links__descendant_id=account_id).annotate(
+        depth=F('descendant_links__depth')
+    ).order_by('-depth')
+
+
+def _rollup_sum(field, condition=None):
+    condition = condition or Q()
+    return Coalesce(Sum(field, filter=condition), Value(ZERO))
+
+
+def trial_balance(date_from=None, date_to=None) -> dict:
+    """
+    Build a trial balance with totals rolled up the account hierarchy.
+
+    Without a date range the AccountBalance projection is read (one row per
+    account); with a range the journal is aggregated with a single GROUP BY.
+    Rollups join the closure table so every level is summed in the database.
+    """
+    links = AccountClosure.objects.order_by().values('ancestor_id')
+    if date_from or date_to:
+        entries = JournalEntry.objects.all()
+        if date_from:
+            entries = entries.filter(transaction__date__gte=date_from)
+        if date_to:
+            entries = entries.filter(transaction__date__lte=date_to)
+        totals = aggregate_journal_totals(entries)
+
+        prefix = 'descendant__journalentry__'
+        period = Q()
+        if date_from:
+            period &= Q(**{f'{prefix}transaction__date__gte': date_from})
+        if date_to:
+            period &= Q(**{f'{prefix}transaction__date__lte': date_to})
+        # Filtering before annotate puts the range in the WHERE clause, so only the period's
+        # entries are joined and summed; accounts without any drop out and default to zero
+        rolled_rows = links.filter(period).annotate(
+            debit=_rollup_sum(f'{prefix}amount', Q(**{f'{prefix}entry_type': 'DEBIT'})),
+            credit=_rollup_sum(f'{prefix}amount', Q(**{f'{prefix}entry_type': 'CREDIT'})),
+        )
+    else:
+        totals = {
+            row['account_id']: (row['debit_total'], row['credit_total'], row['last_entry_id'])
+            for row in AccountBalance.objects.values('account_id', 'debit_total', 'credit_total', 'last_entry_id')
+        }
+        rolled_rows = links.annotate(
+            debit=_rollup_sum('descendant__balance__debit_total'),
+            credit=_rollup_sum('descendant__balance__credit_total'),
+        )
+    rolled = {row['ancestor_id']: (money(row['debit']), money(row['credit'])) for row in rolled_rows}
+
+    rows = []
+    total_debit = total_credit = ZERO
+    for account in Account.objects.order_by('code').values('id', 'code', 'name', 'account_type', 'parent_id', 'is_active'):
+        debit, credit, *_ = totals.get(account['id'], (ZERO, ZERO, None))
+        total_debit += debit
+        total_credit += credit
+        rollup_debit, rollup_credit = rolled.get(account['id'], (ZERO, ZERO))
+        rows.append({
+            **account,
+            'debit': debit,
+            'credit': credit,
+            'balance': debit - credit,
+            'rollup_debit': rollup_debit,
+            'rollup_credit': rollup_credit,
+            'rollup_balance': rollup_debit - rollup_credit,
+        })
+
+    return {
+        'from': date_from,
+        'to': date_to,
+        'accounts': rows,
+        'total_debit': total_debit,
+        'total_credit': total_credit,
+        'is_balanced': total_debit == total_credit,
+    }
+
+
+def general_ledger(account: Account, date_from=None, date_to=None) -> dict:
+    """
+    Opening, period and closing totals for an account and its sub-accounts.
+
+    Opening balances start from the latest period-close snapshot before date_from,
+    as balance_as_of does, so only entries after that close are read from the
+    journal. Every sub-account's rolled-up totals come from conditional GROUP BYs
+    over the closure table.
+    """
+    subtree = list(subtree_accounts(account.id).values('id', 'code', 'name', 'account_type', 'parent_id', 'depth'))
+    links = AccountClosure.objects.filter(ancestor_id__in=[row['id'] for row in subtree]).order_by().values('ancestor_id')
+
+    prefix = 'descendant__journalentry__'
+    debit = Q(**{f'{prefix}entry_type': 'DEBIT'})
+    credit = Q(**{f'{prefix}entry_type': 'CREDIT'})
+    read = Q()
+    period = Q()
+    aggregates = {}
+    snapshots = {}
+    if date_from:
+        snapshot_end = PeriodClose.objects.filter(
+            period_end__lt=date_from
+        ).order_by('-period_end').values_list('period_end', flat=True).first()
+        if snapshot_end:
+            snapshots = {
+                row['ancestor_id']: money(row['net'])
+                for row in links.filter(descendant__snapshots__period_end=snapshot_end).annotate(
+                    net=_rollup_sum('descendant__snapshots__net')
+                )
+            }
+            read = Q(**{f'{prefix}transaction__date__gt': snapshot_end})
+        period = Q(**{f'{prefix}transaction__date__gte': date_from})
+        opening = Q(**{f'{prefix}transaction__date__lt': date_from})
+        aggregates['opening_debit'] = _rollup_sum(f'{prefix}amount', opening & debit)
+        aggregates['opening_credit'] = _rollup_sum(f'{prefix}amount', opening & credit)
+    if date_to:
+        read &= Q(**{f'{prefix}transaction__date__lte': date_to})
+    aggregates['debit'] = _rollup_sum(f'{prefix}amount', period & debit)
+    aggregates['credit'] = _rollup_sum(f'{prefix}amount', period & credit)
+
+    # Filtering before annotate keeps entries outside the read range out of the join
+    rolled = {
+        row['ancestor_id']: {key: money(value) for key, value in row.items() if key != 'ancestor_id'}
+        for row in links.filter(read).annotate(**aggregates)
+    }
+
+    result = []
+    for row in subtree:
+        totals = rolled.get(row['id'], {})
+        opening_balance = (
+            snapshots.get(row['id'], ZERO) + totals.get('opening_debit', ZERO) - totals.get('opening_credit', ZERO)
+        )
+        period_debit = totals.get('debit', ZERO)
+        period_credit = totals.get('credit', ZERO)
+        result.append({
+            **row,
+            'opening_balance': opening_balance,
+            'debit': period_debit,
+            'credit': period_credit,
+            'closing_balance': opening_balance + period_debit - period_credit,
+        })
+
+    return {
+        'account': account.id,
+        'from': date_from,
+        'to': date_to,
+        'accounts': result,
+    }
+
+
+def closed_through():
+    """
+    End date of the latest closed period, or None when nothing has been closed.
+    """
+    return PeriodClose.objects.order_by('-period_end').values_list('period_end', flat=True).first()
+
+
+def ensure_period_open(posting_date) -> None:
+    """
+    Reject postings dated inside a closed period so snapshots stay valid.
+    """
+    if isinstance(posting_date, str):
+        posting_date = date.fromisoformat(posting_date)
+    closed = closed_through()
+    if closed and posting_date and posting_date <= closed:
+        raise ValidationError(f'Period is closed through {closed}; postings dated {posting_date} are not allowed')
+
+
+def close_period(period_end, user=None) -> PeriodClose:
+    """
+    Freeze per-account closing balances at period_end.
+
+    Each snapshot is the previous snapshot plus the journal movement since it,
+    so closing a period only aggregates that period's entries.
+    """
+    with transaction.atomic():
+        previous = PeriodClose.objects.select_for_update().order_by('-period_end').first()
+        if previous and period_end <= previous.period_end:
+            raise ValidationError(f'Periods are already closed through {previous.period_end}')
+
+        totals = {}
+        if previous:
+            totals = {
+                row['account_id']: (row['debit_total'], row['credit_total'])
+                for row in previous.snapshots.values('account_id', 'debit_total', 'credit_total')
+            }
+        entries = JournalEntry.objects.filter(transaction__date__lte=period_end)
+        if previous:
+            entries = entries.filter(transaction__date__gt=previous.period_end)
+        for account_id, (debit, credit, _) in aggregate_journal_totals(entries).items():
+            prior_debit, prior_credit = totals.get(account_id, (ZERO, ZERO))
+            totals[account_id] = (prior_debit + debit, prior_credit + credit)
+
+        period = PeriodClose.objects.create(period_end=period_end, closed_by=user)
+        AccountBalanceSnapshot.objects.bulk_create([
+            AccountBalanceSnapshot(
+                period=period,
+                account_id=account_id,
+                period_end=period_end,
+                debit_total=debit,
+                credit_total=credit,
+                net=debit - credit,
+            )
+            for account_id, (debit, credit) in totals.items()
+        ], batch_size=1000)
+    return period
+
+
+def balance_as_of(account_id, as_of) -> dict:
+    """
+    Balance of one account at the end of as_of: nearest snapshot plus the entries after it.
+    """
+    snapshot = AccountBalanceSnapshot.objects.filter(
+        account_id=account_id, period_end__lte=as_of
+    ).order_by('-period_end').values('period_end', 'debit_total', 'credit_total').first()
+
+    entries = JournalEntry.objects.filter(account_id=account_id, transaction__date__lte=as_of)
+    debit = credit = ZERO
+    if snapshot:
+        entries = entries.filter(transaction__date__gt=snapshot['period_end'])
+        debit, credit = snapshot['debit_total'], snapshot['credit_total']
+
+    movement = entries.aggregate(
+        debit=_rollup_sum('amount', Q(entry_type='DEBIT')),
+        credit=_rollup_sum('amount', Q(entry_type='CREDIT')),
+    )
+    debit += money(movement['debit'])
+    credit += money(movement['credit'])
+    return {
+        'account': account_id,
+        'as_of': as_of,
+        'snapshot_period_end': snapshot['period_end'] if snapshot else None,
+        'debit_total': debit,
+        'credit_total': credit,
+        'net': debit - credit,
+    }
+
+
+JOURNAL_EXPORT_FIELDS = [
+    'entry_id', 'transaction_reference', 'date', 'account_code', 'account_name',
+    'entry_type', 'amount', 'description',
+]
+
+
+def iter_journal_rows(date_from=None, date_to=None, chunk_size=2000):
+    """
+    Stream journal entries as tuples in JOURNAL_EXPORT_FIELDS order using a server-side iterator.
+    """
+    entries = JournalEntry.objects.all()
+    if date_from:
+        entries = entries.filter(transaction__date__gte=date_from)
+    if date_to:
+        entries = entries.filter(transaction__date__lte=date_to)
+    return entries.order_by('transaction__date', 'id').values_list(
+        'id', 'transaction__reference', 'transaction__date', 'account__code', 'account__name',
+        'entry_type', 'amount', 'transaction__description',
+    ).iterator(chunk_size=chunk_size)
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_journal_csv(rows, batch_size=500):
+    """
+    Encode journal rows as CSV text chunks (header first).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(JOURNAL_EXPORT_FIELDS)
+    yield buffer.getvalue()
+    for batch in _batched(rows, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def iter_journal_ndjson(rows, batch_size=500):
+    """
+    Encode journal rows as newline-delimited JSON text chunks.
+    """
+    for batch in _batched(rows, batch_size):
+        yield ''.join(
+            json.dumps(dict(zip(JOURNAL_EXPORT_FIELDS, row)), default=str) + '\n'
+            for row in batch
+        )
+
+
+def gzip_stream(chunks):
+    """
+    Gzip-compress a stream of text chunks on the fly.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def account_statement(account_id, date_from=None, date_to=None, position=None, page_size=50) -> dict:
+    """
+    One page of an account statement with running balances from a SQL window function.
+
+    The running balance is seeded with the opening balance (from the nearest
+    period-close snapshot) on the first page and with the balance carried in
+    the keyset position on later pages, so every page costs the same.
+
+    Args:
+        position: None for the first page, else {'date', 'id', 'balance'} of the last row shown
+    """
+    entries = JournalEntry.objects.filter(account_id=account_id)
+    if date_from:
+        entries = entries.filter(transaction__date__gte=date_from)
+    if date_to:
+        entries = entries.filter(transaction__date__lte=date_to)
+
+    if position:
+        after_date = date.fromisoformat(position['date'])
+        entries = entries.filter(
+            Q(transaction__date__gt=after_date) | Q(transaction__date=after_date, id__gt=int(position['id']))
+        )
+        opening = money(position['balance'])
+    elif date_from:
+        opening = balance_as_of(account_id, date_from - timedelta(days=1))['net']
+    else:
+        opening = ZERO
+
+    signed_amount = Case(
+        When(entry_type='DEBIT', then=F('amount')),
+        default=-F('amount'),
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    )
+    rows = list(entries.annotate(
+        running=Window(
+            Sum(signed_amount),
+            order_by=[F('transaction__date').asc(), F('id').asc()],
+            frame=RowRange(start=None, end=0),
+        ),
+    ).order_by('transaction__date', 'id').values(
+        'id', 'transaction__date', 'transaction__reference', 'transaction__description',
+        'entry_type', 'amount', 'running',
+    )[:page_size + 1])
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    lines = [
+        {
+            'id': row['id'],
+            'date': row['transaction__date'],
+            'reference': row['transaction__reference'],
+            'description': row['transaction__description'],
+            'entry_type': row['entry_type'],
+            'amount': row['amount'],
+            'running_balance': opening + money(row['running']),
+        }
+        for row in rows
+    ]
+
+    next_position = None
+    if has_more and lines:
+        last = lines[-1]
+        next_position = {'date': last['date'].isoformat(), 'id': last['id'], 'balance': str(last['running_balance'])}
+
+    return {
+        'opening_balance': opening,
+        'entries': lines,
+        'next_position': next_position,
+    }
@@ -0,0 +1,30 @@
+from datetime import date, timedelta
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from app.ledger_services import close_period
+
+
+class Command(BaseCommand):
+    help = 'Close the ledger through a date and snapshot per-account closing balances (defaults to last month end)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Period end date in YYYY-MM-DD format')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                period_end = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        else:
+            period_end = timezone.localdate().replace(day=1) - timedelta(days=1)
+
+        try:
+            period = close_period(period_end)
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Closed period through {period.period_end} with {period.snapshots.count()} account snapshot(s)"
+        ))
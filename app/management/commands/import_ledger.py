@@ -0,0 +1,157 @@
+import csv
+import json
+import os
+import sys
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from app.models import Account, Transaction
+from app.ledger_services import validate_postings, create_postings
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical transactions from CSV or NDJSON. Each row is one journal entry with '
+        'reference, date, description, account_code, entry_type and amount; rows of the same '
+        'transaction must be contiguous.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--user', required=True, help='Username recorded on the imported transactions')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format (default: from file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Transactions written per database transaction')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true', help='Skip rows already committed according to the checkpoint')
+        parser.add_argument('--skip-existing', action='store_true', help='Skip transactions whose reference already exists')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        checkpoint_path = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        if options['resume'] and not checkpoint_path:
+            raise CommandError('--resume needs --checkpoint when reading from stdin')
+
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        self.user = user
+        self.batch_size = max(1, options['batch_size'])
+        self.skip_existing = options['skip_existing']
+        self.checkpoint_path = checkpoint_path
+        self.account_ids = dict(Account.objects.values_list('code', 'id'))
+
+        start_row = self.read_checkpoint() if options['resume'] else 0
+        if start_row:
+            self.stdout.write(f'Resuming after row {start_row}')
+
+        self.rows_done = start_row
+        self.rows_imported = 0
+        self.transactions_imported = 0
+        self.started = time.monotonic()
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = self.read_rows(stream, import_format)
+            self.import_rows(rows, start_row)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.transactions_imported} transactions ({self.rows_imported} entries) '
+            f'in {elapsed:.1f}s - {self.rows_imported / elapsed:.0f} rows/sec'
+        ))
+
+    def read_rows(self, stream, import_format):
+        if import_format == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f'Line {line_number}: invalid JSON ({e})')
+
+    def import_rows(self, rows, start_row):
+        """Group contiguous rows into transactions and flush them in batches"""
+        batch, current, row_number = [], None, 0
+        for row_number, row in enumerate(rows, start=1):
+            if row_number <= start_row:
+                continue
+            reference = (row.get('reference') or '').strip()
+            if current is None or reference != current['reference']:
+                if current is not None:
+                    batch.append(current)
+                    if len(batch) >= self.batch_size:
+                        self.flush(batch, row_number - 1)
+                        batch = []
+                current = {
+                    'reference': reference,
+                    'description': row.get('description'),
+                    'date': row.get('date'),
+                    'entries': [],
+                }
+            code = str(row.get('account_code') or '').strip()
+            current['entries'].append({
+                'account': self.account_ids.get(code, code or None),
+                'entry_type': (row.get('entry_type') or '').strip().upper(),
+                'amount': row.get('amount'),
+            })
+
+        if current is not None:
+            batch.append(current)
+        if batch:
+            self.flush(batch, row_number)
+
+    def flush(self, batch, last_row):
+        """Validate and write one batch atomically, then advance the checkpoint"""
+        if self.skip_existing:
+            existing = set(Transaction.objects.filter(
+                reference__in=[item['reference'] for item in batch]
+            ).values_list('reference', flat=True))
+            batch = [item for item in batch if item['reference'] not in existing]
+
+        entry_count = sum(len(item['entries']) for item in batch)
+        if batch:
+            errors, postings = validate_postings(batch)
+            failures = [(item['reference'], item_errors) for item, item_errors in zip(batch, errors) if item_errors]
+            if failures:
+                for reference, item_errors in failures[:20]:
+                    self.stderr.write(f'{reference or "<no reference>"}: {json.dumps(item_errors)}')
+                raise CommandError(
+                    f'{len(failures)} invalid transaction(s) in batch ending at row {last_row}; '
+                    f'nothing from this batch was written. Fix the input and rerun with --resume.'
+                )
+            create_postings(self.user, postings)
+
+        self.rows_done = last_row
+        self.rows_imported += entry_count
+        self.transactions_imported += len(batch)
+        self.write_checkpoint()
+
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(
+            f'Committed through row {last_row}: {self.transactions_imported} transactions, '
+            f'{self.rows_imported / elapsed:.0f} rows/sec'
+        )
+
+    def read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            return int(json.load(f).get('rows', 0))
+
+    def write_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rows': self.rows_done}, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.address_services import available_counts, load_address_pool
+
+
+class Command(BaseCommand):
+    help = 'Add pre-generated deposit addresses (one per line) to the pool for a coin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('coin', help='Coin type, e.g. bitcoin')
+        parser.add_argument('path', help='Text file with one address per line')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as f:
+                added = load_address_pool(options['coin'], f.read().splitlines())
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        available = available_counts().get(options['coin'], 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {added} {options['coin']} addresses; {available} available for assignment"
+        ))
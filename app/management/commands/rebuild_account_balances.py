@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.ledger_services import rebuild_account_balances, verify_account_balances
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the AccountBalance projection from the journal and verify it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify the projection against the journal, do not rebuild it',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = rebuild_account_balances()
+            self.stdout.write(f"Rebuilt {count} account balance(s)")
+
+        problems = verify_account_balances()
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f"{len(problems)} account balance(s) do not match the journal")
+
+        self.stdout.write(self.style.SUCCESS('Account balances match the journal'))
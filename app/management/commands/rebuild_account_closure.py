@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from app.ledger_services import rebuild_account_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the AccountClosure table from Account.parent'
+
+    def handle(self, *args, **options):
+        count = rebuild_account_closure()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt account closure with {count} link(s)"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from app.notification_services import rebuild_notification_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user unread notification counters used by the unread badge'
+
+    def handle(self, *args, **options):
+        count = rebuild_notification_counters()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt unread counters for {count} users"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from app.deposit_services import rebuild_pending_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-coin pending deposit totals used by the review queue'
+
+    def handle(self, *args, **options):
+        count = rebuild_pending_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} pending deposit summaries"))
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from app.outbox_services import DEFAULT_MAX_ATTEMPTS, process_due_events
+
+
+class Command(BaseCommand):
+    help = 'Process outbox events (deposit credits, notifications, emails) with retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the events due now and exit')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events claimed per batch')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when no events are due')
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help='Attempts before an event is marked failed')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        totals = {'processed': 0, 'failed': 0}
+        try:
+            while True:
+                close_old_connections()
+                results = process_due_events(batch_size, options['max_attempts'])
+                for name, count in results.items():
+                    totals[name] += count
+                if results['processed'] or results['failed']:
+                    self.stdout.write(f"Processed {results['processed']} event(s), {results['failed']} failed")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox worker done: {totals['processed']} processed, {totals['failed']} failed"
+        ))
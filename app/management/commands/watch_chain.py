@@ -0,0 +1,43 @@
+import asyncio
+from django.core.management.base import BaseCommand, CommandError
+from app.models import DepositTransaction
+from app.chain_services import MockNodeBackend, get_backends, watch
+
+
+class Command(BaseCommand):
+    help = 'Watch the configured chain backends and confirm pending deposits that incoming transfers pay for'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--coin', action='append', help='Only watch this coin (repeatable; default: every configured coin)')
+        parser.add_argument('--interval', type=float, default=15.0, help='Seconds between polling cycles')
+        parser.add_argument('--once', action='store_true', help='Run a single polling cycle and exit')
+        parser.add_argument('--mock', metavar='FIXTURE', help='Replay transfers from a JSON fixture instead of the configured backends')
+
+    def handle(self, *args, **options):
+        coins = options['coin']
+        known = {coin for coin, _ in DepositTransaction.COIN_CHOICES}
+        unknown = set(coins or []) - known
+        if unknown:
+            raise CommandError(f"Unknown coin(s): {', '.join(sorted(unknown))}")
+
+        if options['mock']:
+            node = MockNodeBackend(options['mock'])
+            backends = {coin: node for coin in (coins or sorted(known))}
+        else:
+            backends = get_backends(coins)
+        if not backends:
+            raise CommandError('No chain backends configured (settings.CHAIN_BACKENDS); use --mock to replay a fixture')
+
+        self.stdout.write(f"Watching {', '.join(sorted(backends))}")
+        try:
+            asyncio.run(watch(backends, options['interval'], options['once'], self.report))
+        except KeyboardInterrupt:
+            pass
+
+    def report(self, confirmed, errors):
+        for coin, error in errors.items():
+            self.stderr.write(f'{coin}: cycle failed: {error}')
+        total = sum(confirmed.values())
+        if total:
+            details = ', '.join(f'{coin}: {count}' for coin, count in sorted(confirmed.items()) if count)
+            self.stdout.write(self.style.SUCCESS(f'Confirmed {total} deposit(s) ({details})'))
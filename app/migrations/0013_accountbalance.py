@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-17 05:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, Q, Sum
+
+
+def backfill_account_balances(apps, schema_editor):
+    JournalEntry = apps.get_model('app', 'JournalEntry')
+    AccountBalance = apps.get_model('app', 'AccountBalance')
+    rows = JournalEntry.objects.order_by().values('account').annotate(
+        debit=Sum('amount', filter=Q(entry_type='DEBIT')),
+        credit=Sum('amount', filter=Q(entry_type='CREDIT')),
+        last_entry_id=Max('id'),
+    )
+    AccountBalance.objects.bulk_create([
+        AccountBalance(
+            account_id=row['account'],
+            debit_total=row['debit'] or 0,
+            credit_total=row['credit'] or 0,
+            net=(row['debit'] or 0) - (row['credit'] or 0),
+            last_entry_id=row['last_entry_id'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_update_wallet_and_deposit_usd_precision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalance',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='app.account')),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('net', models.DecimalField(decimal_places=2, default=0, help_text='Debit total minus credit total', max_digits=20)),
+                ('last_entry_id', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Account Balance',
+                'verbose_name_plural': 'Account Balances',
+            },
+        ),
+        migrations.RunPython(backfill_account_balances, migrations.RunPython.noop),
+    ]
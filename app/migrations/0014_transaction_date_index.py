@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_accountbalance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-17 05:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_account_closure(apps, schema_editor):
+    Account = apps.get_model('app', 'Account')
+    AccountClosure = apps.get_model('app', 'AccountClosure')
+    parents = dict(Account.objects.values_list('id', 'parent_id'))
+    links = []
+    for account_id in parents:
+        node, depth, visited = account_id, 0, set()
+        while node is not None and node not in visited:
+            visited.add(node)
+            links.append(AccountClosure(ancestor_id=node, descendant_id=account_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    AccountClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_transaction_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(help_text='Number of levels between ancestor and descendant (0 for the account itself)')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='app.account')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='app.account')),
+            ],
+            options={
+                'verbose_name': 'Account Closure',
+                'verbose_name_plural': 'Account Closures',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='account_closure_desc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_account_closure_link')],
+            },
+        ),
+        migrations.RunPython(backfill_account_closure, migrations.RunPython.noop),
+    ]
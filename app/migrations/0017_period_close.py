@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 05:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_transaction_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateField(unique=True)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_periods', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Period Close',
+                'verbose_name_plural': 'Period Closes',
+                'ordering': ['-period_end'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AccountBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateField()),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('net', models.DecimalField(decimal_places=2, default=0, help_text='Debit total minus credit total', max_digits=20)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='app.account')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='app.periodclose')),
+            ],
+            options={
+                'verbose_name': 'Account Balance Snapshot',
+                'verbose_name_plural': 'Account Balance Snapshots',
+                'constraints': [models.UniqueConstraint(fields=('account', 'period_end'), name='unique_account_period_snapshot')],
+            },
+        ),
+    ]
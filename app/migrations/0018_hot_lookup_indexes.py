@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-17 05:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_period_close'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='walletcopytracking',
+            name='copied_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='deposittransaction',
+            index=models.Index(fields=['user', 'created_at'], name='deposit_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deposittransaction',
+            index=models.Index(fields=['status', 'email_sent'], name='deposit_status_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['user', 'created_at'], name='supportticket_user_created_idx'),
+        ),
+        # register_user and forgot_password look users up by email, which auth_user does not index
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS app_auth_user_email_idx ON auth_user (email)',
+            'DROP INDEX IF EXISTS app_auth_user_email_idx',
+        ),
+    ]
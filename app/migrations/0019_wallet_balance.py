@@ -0,0 +1,86 @@
+# Generated by Django 5.1.15 on 2026-10-17 05:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+COINS = ['bitcoin', 'ethereum', 'ripple', 'stellar', 'usdt', 'bnb', 'bnb_tiger']
+
+
+def copy_wallet_columns_to_rows(apps, schema_editor):
+    Wallet = apps.get_model('app', 'Wallet')
+    WalletBalance = apps.get_model('app', 'WalletBalance')
+    fields = [f'{coin}_balance' for coin in COINS]
+    rows = []
+    for wallet in Wallet.objects.values('user_id', *fields).iterator(chunk_size=2000):
+        rows.extend(
+            WalletBalance(user_id=wallet['user_id'], coin=coin, amount=wallet[f'{coin}_balance'])
+            for coin in COINS
+            if wallet[f'{coin}_balance']
+        )
+    WalletBalance.objects.bulk_create(rows, batch_size=1000)
+
+
+def copy_rows_to_wallet_columns(apps, schema_editor):
+    Wallet = apps.get_model('app', 'Wallet')
+    WalletBalance = apps.get_model('app', 'WalletBalance')
+    for row in WalletBalance.objects.filter(coin__in=COINS).iterator(chunk_size=2000):
+        Wallet.objects.filter(user_id=row.user_id).update(**{f'{row.coin}_balance': row.amount})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('coin', models.CharField(choices=[('bitcoin', 'Bitcoin (BTC)'), ('ethereum', 'Ethereum (ETH)'), ('ripple', 'Ripple (XRP)'), ('stellar', 'Stellar (XLM)'), ('usdt', 'Tether (USDT)'), ('bnb', 'BNB (BNB)'), ('bnb_tiger', 'BNB Tiger')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, help_text='Balance in USD', max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Wallet Balance',
+                'verbose_name_plural': 'Wallet Balances',
+                'ordering': ['user', 'coin'],
+                'indexes': [models.Index(fields=['coin', '-amount'], name='walletbalance_coin_amount_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'coin'), name='unique_wallet_balance_user_coin')],
+            },
+        ),
+        migrations.RunPython(copy_wallet_columns_to_rows, copy_rows_to_wallet_columns),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='bitcoin_balance',
+        ),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='bnb_balance',
+        ),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='bnb_tiger_balance',
+        ),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='ethereum_balance',
+        ),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='ripple_balance',
+        ),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='stellar_balance',
+        ),
+        migrations.RemoveField(
+            model_name='wallet',
+            name='usdt_balance',
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:01
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce, Now
+
+
+def mark_confirmed_deposits_credited(apps, schema_editor):
+    # Deposits confirmed before the outbox were credited inline by the old signal handler
+    DepositTransaction = apps.get_model('app', 'DepositTransaction')
+    DepositTransaction.objects.filter(status='confirmed', credited_at__isnull=True).update(
+        credited_at=Coalesce(F('confirmed_at'), Now())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_backfill_user_wallets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deposittransaction',
+            name='credited_at',
+            field=models.DateTimeField(blank=True, help_text='When the wallet was credited; set exactly once', null=True),
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=100)),
+                ('key', models.CharField(help_text='Deduplication key within the topic', max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Not processed before this time (retry backoff / worker lease)')),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Outbox Event',
+                'verbose_name_plural': 'Outbox Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx')],
+                'constraints': [models.UniqueConstraint(fields=('topic', 'key'), name='unique_outbox_topic_key')],
+            },
+        ),
+        migrations.RunPython(mark_confirmed_deposits_credited, migrations.RunPython.noop),
+    ]
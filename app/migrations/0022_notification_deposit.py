@@ -0,0 +1,58 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:04
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+DEPOSIT_TITLE = re.compile(r'Deposit #(\d+)')
+
+
+def link_notifications_to_deposits(apps, schema_editor):
+    """Fill Notification.deposit from titles like 'Deposit #42 Confirmed', keeping the oldest per (deposit, type)"""
+    Notification = apps.get_model('app', 'Notification')
+    DepositTransaction = apps.get_model('app', 'DepositTransaction')
+    candidates = (
+        Notification.objects.filter(deposit__isnull=True, title__contains='Deposit #')
+        .order_by('created_at', 'id')
+        .values_list('id', 'user_id', 'type', 'title')
+    )
+    matches = []
+    for notification_id, user_id, notification_type, title in candidates.iterator(chunk_size=2000):
+        match = DEPOSIT_TITLE.search(title)
+        if match:
+            matches.append((notification_id, user_id, notification_type, int(match.group(1))))
+
+    deposit_users = dict(DepositTransaction.objects.values_list('id', 'user_id').iterator(chunk_size=2000))
+    links = {}
+    for notification_id, user_id, notification_type, deposit_id in matches:
+        if deposit_users.get(deposit_id) == user_id:
+            links.setdefault((deposit_id, notification_type), notification_id)
+    updates = [
+        Notification(id=notification_id, deposit_id=deposit_id)
+        for (deposit_id, _), notification_id in links.items()
+    ]
+    Notification.objects.bulk_update(updates, ['deposit'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_deposit_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='deposit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='app.deposittransaction'),
+        ),
+        migrations.RunPython(link_notifications_to_deposits, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('deposit__isnull', False)), fields=('deposit', 'type'), name='unique_deposit_notification_type'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_notification_deposit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('coin', models.CharField(choices=[('bitcoin', 'Bitcoin (BTC)'), ('ethereum', 'Ethereum (ETH)'), ('ripple', 'Ripple (XRP)'), ('stellar', 'Stellar (XLM)'), ('usdt', 'Tether (USDT)'), ('bnb', 'BNB (BNB)'), ('bnb_tiger', 'BNB Tiger')], max_length=20)),
+                ('txid', models.CharField(max_length=128)),
+                ('to_address', models.CharField(max_length=255)),
+                ('amount', models.DecimalField(decimal_places=10, help_text='Amount in coin units', max_digits=30)),
+                ('usd_amount', models.DecimalField(blank=True, decimal_places=2, help_text='USD value when seen', max_digits=15, null=True)),
+                ('block_time', models.DateTimeField()),
+                ('matched_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Chain Transfer',
+                'verbose_name_plural': 'Chain Transfers',
+                'ordering': ['-block_time'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='deposittransaction',
+            index=models.Index(fields=['status', 'coin_type', 'created_at'], name='deposit_status_coin_idx'),
+        ),
+        migrations.AddField(
+            model_name='chaintransfer',
+            name='deposit',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chain_transfer', to='app.deposittransaction'),
+        ),
+        migrations.AddIndex(
+            model_name='chaintransfer',
+            index=models.Index(condition=models.Q(('deposit__isnull', True)), fields=['coin', 'block_time'], name='chain_transfer_unmatched_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='chaintransfer',
+            constraint=models.UniqueConstraint(fields=('coin', 'txid'), name='unique_chain_transfer_coin_txid'),
+        ),
+    ]
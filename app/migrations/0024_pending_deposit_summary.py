@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def backfill_pending_summaries(apps, schema_editor):
+    DepositTransaction = apps.get_model('app', 'DepositTransaction')
+    PendingDepositSummary = apps.get_model('app', 'PendingDepositSummary')
+    rows = DepositTransaction.objects.filter(status='pending').order_by().values('coin_type').annotate(
+        count=Count('id'), amount=Sum('amount'), oldest=Min('created_at')
+    )
+    PendingDepositSummary.objects.bulk_create([
+        PendingDepositSummary(
+            coin=row['coin_type'],
+            pending_count=row['count'],
+            pending_amount=row['amount'] or 0,
+            oldest_pending_at=row['oldest'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_chain_transfer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingDepositSummary',
+            fields=[
+                ('coin', models.CharField(choices=[('bitcoin', 'Bitcoin (BTC)'), ('ethereum', 'Ethereum (ETH)'), ('ripple', 'Ripple (XRP)'), ('stellar', 'Stellar (XLM)'), ('usdt', 'Tether (USDT)'), ('bnb', 'BNB (BNB)'), ('bnb_tiger', 'BNB Tiger')], max_length=20, primary_key=True, serialize=False)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=0, help_text='USD total of pending deposits', max_digits=20)),
+                ('oldest_pending_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Pending Deposit Summary',
+                'verbose_name_plural': 'Pending Deposit Summaries',
+                'ordering': ['coin'],
+            },
+        ),
+        migrations.RunPython(backfill_pending_summaries, migrations.RunPython.noop),
+    ]
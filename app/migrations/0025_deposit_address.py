@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_pending_deposit_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('coin', models.CharField(choices=[('bitcoin', 'Bitcoin (BTC)'), ('ethereum', 'Ethereum (ETH)'), ('ripple', 'Ripple (XRP)'), ('stellar', 'Stellar (XLM)'), ('usdt', 'Tether (USDT)'), ('bnb', 'BNB (BNB)'), ('bnb_tiger', 'BNB Tiger')], max_length=20)),
+                ('address', models.CharField(max_length=255)),
+                ('state', models.CharField(choices=[('available', 'Available'), ('assigned', 'Assigned'), ('retired', 'Retired')], default='available', max_length=10)),
+                ('assigned_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='deposit_addresses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Deposit Address',
+                'verbose_name_plural': 'Deposit Addresses',
+                'ordering': ['coin', 'id'],
+                'indexes': [models.Index(fields=['coin', 'state', 'id'], name='deposit_address_pool_idx')],
+                'constraints': [models.UniqueConstraint(fields=('coin', 'address'), name='unique_deposit_address_coin_address'), models.UniqueConstraint(condition=models.Q(('state', 'assigned')), fields=('user', 'coin'), name='unique_deposit_address_user_coin')],
+            },
+        ),
+    ]
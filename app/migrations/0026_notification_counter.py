@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_notification_counters(apps, schema_editor):
+    Notification = apps.get_model('app', 'Notification')
+    NotificationCounter = apps.get_model('app', 'NotificationCounter')
+    rows = Notification.objects.filter(is_read=False).order_by().values('user_id').annotate(count=Count('id'))
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=row['user_id'], unread_count=row['count']) for row in rows.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_deposit_address'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Notification Counter',
+                'verbose_name_plural': 'Notification Counters',
+            },
+        ),
+        migrations.RunPython(backfill_notification_counters, migrations.RunPython.noop),
+    ]
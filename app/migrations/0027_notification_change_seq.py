@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_notification_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, help_text="User's change sequence when this notification was last created or changed"),
+        ),
+        migrations.AddField(
+            model_name='notificationcounter',
+            name='last_seq',
+            field=models.BigIntegerField(default=0, help_text="Advanced on every change to the user's notifications"),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'change_seq', 'id'], name='notification_user_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-17 06:50
+
+from django.db import migrations, models
+
+
+def create_registry_row(apps, schema_editor):
+    DepositAddressRegistry = apps.get_model('app', 'DepositAddressRegistry')
+    DepositAddressRegistry.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_deposit_address_user_set_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositAddressRegistry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Deposit Address Registry',
+                'verbose_name_plural': 'Deposit Address Registry',
+            },
+        ),
+        migrations.RunPython(create_registry_row, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from decimal import Decimal
 import os
 
@@ -61,15 +62,45 @@ class Account(models.Model):
     
     def __str__(self):
         return f"{self.code} - {self.name}"
+    
+    def save(self, *args, **kwargs):
+        # AccountClosure rows are maintained from the save signals
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class AccountClosure(models.Model):
+    """Closure table for the Account.parent hierarchy: one row per (ancestor, descendant) pair"""
+    ancestor = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(help_text="Number of levels between ancestor and descendant (0 for the account itself)")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_account_closure_link'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='account_closure_desc_idx'),
+        ]
+        verbose_name = "Account Closure"
+        verbose_name_plural = "Account Closures"
+    
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
 
 class Transaction(models.Model):
     """Ledger Transactions"""
     reference = models.CharField(max_length=50, unique=True)
     description = models.TextField()
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='transaction_created_id_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.reference} - {self.description}"
 
@@ -87,6 +118,68 @@ class JournalEntry(models.Model):
     
     def __str__(self):
         return f"{self.account.code} - {self.entry_type} - {self.amount}"
+    
+    def save(self, *args, **kwargs):
+        # The AccountBalance projection is updated from the save signals, so
+        # wrap them in the same transaction as the entry itself
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class AccountBalance(models.Model):
+    """Per-account running totals maintained incrementally from JournalEntry postings"""
+    account = models.OneToOneField(Account, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    debit_total = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    credit_total = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=20, decimal_places=2, default=0, help_text="Debit total minus credit total")
+    last_entry_id = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Account Balance"
+        verbose_name_plural = "Account Balances"
+    
+    def __str__(self):
+        return f"{self.account.code} - {self.net}"
+
+
+class PeriodClose(models.Model):
+    """Closed accounting period - postings dated on or before period_end are rejected"""
+    period_end = models.DateField(unique=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='closed_periods')
+    
+    class Meta:
+        ordering = ['-period_end']
+        verbose_name = "Period Close"
+        verbose_name_plural = "Period Closes"
+    
+    def __str__(self):
+        return f"Closed through {self.period_end}"
+
+
+class AccountBalanceSnapshot(models.Model):
+    """Frozen closing balance of an account at the end of a closed period"""
+    period = models.ForeignKey(PeriodClose, on_delete=models.CASCADE, related_name='snapshots')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='snapshots')
+    period_end = models.DateField()  # Copied from period so as-of lookups stay on one index
+    debit_total = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    credit_total = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=20, decimal_places=2, default=0, help_text="Debit total minus credit total")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'period_end'], name='unique_account_period_snapshot'),
+        ]
+        verbose_name = "Account Balance Snapshot"
+        verbose_name_plural = "Account Balance Snapshots"
+    
+    def __str__(self):
+        return f"{self.account.code} @ {self.period_end} - {self.net}"
 
 
 class SupportTicket(models.Model):
@@ -128,6 +221,9 @@ class SupportTicket(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='supportticket_user_created_idx'),
+        ]
         verbose_name = "Support Ticket"
         verbose_name_plural = "Support Tickets"
     
@@ -182,17 +278,39 @@ class Notification(models.Model):
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     support_ticket = models.ForeignKey(SupportTicket, on_delete=models.CASCADE, null=True, blank=True)
+    deposit = models.ForeignKey('DepositTransaction', on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
     created_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
+    change_seq = models.BigIntegerField(default=0, help_text="User's change sequence when this notification was last created or changed")
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_read_idx'),
+            models.Index(fields=['user', 'change_seq', 'id'], name='notification_user_seq_idx'),
+        ]
+        constraints = [
+            # At most one notification of each type per deposit
+            models.UniqueConstraint(
+                fields=['deposit', 'type'],
+                condition=models.Q(deposit__isnull=False),
+                name='unique_deposit_notification_type',
+            ),
+        ]
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
     
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is not None:
+            # The pre_save signal stamps change_seq on every save
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+        # The counter update made by the pre_save signal must commit or roll back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
     def mark_as_read(self):
         if not self.is_read:
             self.is_read = True
@@ -201,6 +319,25 @@ class Notification(models.Model):
             self.save()
 
 
+class NotificationCounter(models.Model):
+    """
+    Per-user count of unread notifications for the badge, and the sequence number of the
+    user's latest notification change for delta sync.
+    Maintained whenever a notification is created, read or deleted instead of counted per request.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread_count = models.IntegerField(default=0)
+    last_seq = models.BigIntegerField(default=0, help_text="Advanced on every change to the user's notifications")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Notification Counter"
+        verbose_name_plural = "Notification Counters"
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.unread_count} unread"
+
+
 class DepositTransaction(models.Model):
     """Deposit Transaction Model for handling cryptocurrency deposits"""
     STATUS_CHOICES = [
@@ -228,10 +365,16 @@ class DepositTransaction(models.Model):
     email_sent = models.BooleanField(default=False)  # Track if confirmation email was sent
     created_at = models.DateTimeField(auto_now_add=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
+    credited_at = models.DateTimeField(null=True, blank=True, help_text="When the wallet was credited; set exactly once")
     processed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='processed_deposits')
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='deposit_user_created_idx'),
+            models.Index(fields=['status', 'email_sent'], name='deposit_status_email_idx'),
+            models.Index(fields=['status', 'coin_type', 'created_at'], name='deposit_status_coin_idx'),
+        ]
         verbose_name = "Deposit Transaction"
         verbose_name_plural = "Deposit Transactions"
     
@@ -240,20 +383,169 @@ class DepositTransaction(models.Model):
         return f"{self.user.username} - {amount_str} - {self.status}"
 
 
+class PendingDepositSummary(models.Model):
+    """
+    Running totals of pending deposits per coin for the admin review queue.
+    Maintained on every deposit status change instead of counted per request.
+    """
+    coin = models.CharField(max_length=20, choices=DepositTransaction.COIN_CHOICES, primary_key=True)
+    pending_count = models.IntegerField(default=0)
+    pending_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0, help_text="USD total of pending deposits")
+    oldest_pending_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['coin']
+        verbose_name = "Pending Deposit Summary"
+        verbose_name_plural = "Pending Deposit Summaries"
+    
+    def __str__(self):
+        return f"{self.coin}: {self.pending_count} pending"
+
+
+class DepositAddress(models.Model):
+    """
+    Deposit address from the pre-generated pool. Each user is assigned their own address
+    per coin, so incoming funds identify the depositor.
+    """
+    STATE_CHOICES = [
+        ('available', 'Available'),
+        ('assigned', 'Assigned'),
+        ('retired', 'Retired'),
+    ]
+    
+    coin = models.CharField(max_length=20, choices=DepositTransaction.COIN_CHOICES)
+    address = models.CharField(max_length=255)
+    # Addresses of deleted users are retired first (see signals), so they are never reissued
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='deposit_addresses')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='available')
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['coin', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['coin', 'address'], name='unique_deposit_address_coin_address'),
+            models.UniqueConstraint(
+                fields=['user', 'coin'], condition=models.Q(state='assigned'), name='unique_deposit_address_user_coin'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['coin', 'state', 'id'], name='deposit_address_pool_idx'),
+        ]
+        verbose_name = "Deposit Address"
+        verbose_name_plural = "Deposit Addresses"
+    
+    def __str__(self):
+        return f"{self.coin}:{self.address} ({self.state})"
+
+
+class DepositAddressRegistry(models.Model):
+    """
+    Single row versioning the assigned address mapping. Bumped in the same transaction as
+    every retire, reassignment or removal, so each process reloads its cached mapping.
+    """
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Deposit Address Registry"
+        verbose_name_plural = "Deposit Address Registry"
+    
+    def __str__(self):
+        return f"Deposit address registry v{self.version}"
+
+
+class ChainTransfer(models.Model):
+    """Incoming on-chain transfer seen by the chain watcher, matched to at most one deposit"""
+    coin = models.CharField(max_length=20, choices=DepositTransaction.COIN_CHOICES)
+    txid = models.CharField(max_length=128)
+    to_address = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=30, decimal_places=10, help_text="Amount in coin units")
+    usd_amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, help_text="USD value when seen")
+    block_time = models.DateTimeField()
+    deposit = models.OneToOneField(DepositTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='chain_transfer')
+    matched_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-block_time']
+        constraints = [
+            models.UniqueConstraint(fields=['coin', 'txid'], name='unique_chain_transfer_coin_txid'),
+        ]
+        indexes = [
+            models.Index(fields=['coin', 'block_time'], condition=models.Q(deposit__isnull=True), name='chain_transfer_unmatched_idx'),
+        ]
+        verbose_name = "Chain Transfer"
+        verbose_name_plural = "Chain Transfers"
+    
+    def __str__(self):
+        return f"{self.coin}:{self.txid} {self.amount}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Side effect recorded in the same database transaction as the change that caused it,
+    then carried out by the run_outbox worker
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    topic = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, help_text="Deduplication key within the topic")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not processed before this time (retry backoff / worker lease)")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'key'], name='unique_outbox_topic_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
+        verbose_name = "Outbox Event"
+        verbose_name_plural = "Outbox Events"
+    
+    def __str__(self):
+        return f"{self.topic}:{self.key} ({self.status})"
+
+
+class CoinBalance:
+    """Read-only Wallet attribute exposing one coin's WalletBalance amount (e.g. wallet.bitcoin_balance)"""
+    
+    def __init__(self, coin):
+        self.coin = coin
+    
+    def __get__(self, wallet, owner=None):
+        if wallet is None:
+            return self
+        return wallet.get_balance(self.coin)
+
+
 class Wallet(models.Model):
     """User Wallet Model for tracking cryptocurrency balances in USD"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
-    # Store balances in USD equivalent (2 decimal places for currency)
-    bitcoin_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Bitcoin balance in USD")
-    ethereum_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Ethereum balance in USD")
-    ripple_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Ripple balance in USD")
-    stellar_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Stellar balance in USD")
-    usdt_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="USDT balance in USD")
-    bnb_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="BNB balance in USD")
-    bnb_tiger_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="BNB Tiger balance in USD")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Balances live in WalletBalance rows; these keep the old per-coin attributes working
+    bitcoin_balance = CoinBalance('bitcoin')
+    ethereum_balance = CoinBalance('ethereum')
+    ripple_balance = CoinBalance('ripple')
+    stellar_balance = CoinBalance('stellar')
+    usdt_balance = CoinBalance('usdt')
+    bnb_balance = CoinBalance('bnb')
+    bnb_tiger_balance = CoinBalance('bnb_tiger')
+    
     class Meta:
         verbose_name = "User Wallet"
         verbose_name_plural = "User Wallets"
@@ -261,27 +553,91 @@ class Wallet(models.Model):
     def __str__(self):
         return f"{self.user.username} - Wallet"
     
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_balances', None)
+        super().refresh_from_db(*args, **kwargs)
+    
+    def balances(self):
+        """All coin balances as {coin: amount}, loaded once per instance (uses prefetched user__wallet_balances)"""
+        if '_balances' not in self.__dict__:
+            prefetched = None
+            if self._meta.get_field('user').is_cached(self):
+                prefetched = getattr(self.user, '_prefetched_objects_cache', {}).get('wallet_balances')
+            if prefetched is not None:
+                rows = [(row.coin, row.amount) for row in prefetched]
+            else:
+                rows = WalletBalance.objects.filter(user_id=self.user_id).values_list('coin', 'amount')
+            balances = {coin: Decimal('0.00') for coin in WalletBalance.COINS}
+            balances.update(rows)
+            self.__dict__['_balances'] = balances
+        return self.__dict__['_balances']
+    
     def get_balance(self, coin_type):
         """Get balance for a specific coin type"""
-        balance_field = f"{coin_type}_balance"
-        return getattr(self, balance_field, 0)
+        return self.balances().get(coin_type, 0)
+    
+    def _check_coin(self, coin_type):
+        if coin_type not in WalletBalance.COINS:
+            raise ValueError(f"Unknown coin type: {coin_type}")
+    
+    def _balance_changed(self):
+        from .wallet_services import invalidate_wallet_cache
+        self.__dict__.pop('_balances', None)
+        invalidate_wallet_cache(self.user_id)
     
     def add_balance(self, coin_type, amount):
-        """Add amount to specific coin balance"""
-        balance_field = f"{coin_type}_balance"
-        current_balance = getattr(self, balance_field, 0)
-        setattr(self, balance_field, current_balance + amount)
-        self.save()
+        """
+        Atomically add amount to a coin balance with a single UPDATE.
+        Concurrent credits never overwrite each other. Returns True if the balance row was updated.
+        """
+        self._check_coin(coin_type)
+        WalletBalance.objects.get_or_create(user_id=self.user_id, coin=coin_type)
+        updated = WalletBalance.objects.filter(user_id=self.user_id, coin=coin_type).update(
+            amount=models.F('amount') + amount, updated_at=timezone.now()
+        )
+        if updated:
+            self._balance_changed()
+        return bool(updated)
     
     def subtract_balance(self, coin_type, amount):
-        """Subtract amount from specific coin balance"""
-        balance_field = f"{coin_type}_balance"
-        current_balance = getattr(self, balance_field, 0)
-        if current_balance >= amount:
-            setattr(self, balance_field, current_balance - amount)
-            self.save()
-            return True
-        return False
+        """
+        Atomically subtract amount from a coin balance if it covers the amount.
+        Uses a conditional UPDATE (WHERE amount >= amount), so concurrent debits cannot overdraw.
+        Returns True if the debit was applied.
+        """
+        self._check_coin(coin_type)
+        updated = WalletBalance.objects.filter(user_id=self.user_id, coin=coin_type, amount__gte=amount).update(
+            amount=models.F('amount') - amount, updated_at=timezone.now()
+        )
+        if updated:
+            self._balance_changed()
+        return bool(updated)
+
+
+class WalletBalance(models.Model):
+    """One user's balance in one coin, in USD"""
+    COIN_CHOICES = DepositTransaction.COIN_CHOICES
+    COINS = [coin for coin, _ in COIN_CHOICES]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wallet_balances')
+    coin = models.CharField(max_length=20, choices=COIN_CHOICES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Balance in USD")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['user', 'coin']
+        verbose_name = "Wallet Balance"
+        verbose_name_plural = "Wallet Balances"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'coin'], name='unique_wallet_balance_user_coin'),
+        ]
+        indexes = [
+            # Per-coin totals and top holders
+            models.Index(fields=['coin', '-amount'], name='walletbalance_coin_amount_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.get_coin_display()}: {self.amount}"
 
 
 class WalletCopyTracking(models.Model):
@@ -301,7 +657,7 @@ class WalletCopyTracking(models.Model):
     wallet_address = models.CharField(max_length=255)
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField(blank=True, null=True)
-    copied_at = models.DateTimeField(auto_now_add=True)
+    copied_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
     class Meta:
         ordering = ['-copied_at']
@@ -310,3 +666,33 @@ class WalletCopyTracking(models.Model):
     
     def __str__(self):
         return f"{self.user.username} copied {self.get_coin_type_display()} address at {self.copied_at}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's Idempotency-Key and the response it was answered with. The unique
+    (user, key) row is the claim, so duplicates reaching any worker see the same one.
+    """
+    STATE_CHOICES = [
+        ('in_flight', 'In flight'),
+        ('done', 'Done'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64, help_text="SHA-256 of the Idempotency-Key header")
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of method, path and body")
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='in_flight')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True, help_text="Rendered JSON response replayed to repeats")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True, help_text="In-flight lease end, or end of the replay window once done")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_user_key'),
+        ]
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+    
+    def __str__(self):
+        return f"{self.user_id}:{self.key[:12]} ({self.state})"
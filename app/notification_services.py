@@ -0,0 +1,219 @@
+"""
+Notification services for QFS Ledger application
+
+Each user's unread count is kept in a NotificationCounter row, adjusted with F()
+updates whenever notifications are created, read or deleted, so the unread badge is
+one primary-key lookup instead of a count of the notifications table.
+
+The same row holds the user's change sequence (last_seq). Every change advances it
+and stamps the changed notifications with the new value (change_seq), so clients can
+sync with ?since=<cursor> and poll with a weak ETag built from last_seq. The counter
+UPDATE locks the user's row until commit, so one user's sequence numbers become
+visible in order.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from .models import Notification, NotificationCounter
+
+
+# Default and largest page of a ?since= delta
+DELTA_PAGE_SIZE = 100
+MAX_DELTA_PAGE_SIZE = 500
+
+
+def get_counter_state(user_id) -> dict:
+    """
+    {'unread_count', 'last_seq'} for a user: one counter row read by primary key.
+    Read from the database every time, so changes made by any process are seen at once.
+    """
+    state = NotificationCounter.objects.filter(user_id=user_id).values('unread_count', 'last_seq').first()
+    # No row yet means no notification since the counters were backfilled
+    return state or {'unread_count': 0, 'last_seq': 0}
+
+
+def get_unread_count(user_id) -> int:
+    return get_counter_state(user_id)['unread_count']
+
+
+def notification_etag(user_id, last_seq) -> str:
+    return f'W/"{user_id}-{last_seq}"'
+
+
+def unread_contribution(user_id, is_read) -> dict:
+    """What one notification adds to the counters: {user_id: count}"""
+    return {} if is_read or user_id is None else {user_id: 1}
+
+
+def unread_delta(before: dict, after: dict) -> dict:
+    return {user_id: after.get(user_id, 0) - before.get(user_id, 0) for user_id in set(before) | set(after)}
+
+
+def adjust_unread_counts(deltas: dict):
+    """
+    Add {user_id: delta} to the unread counters with one UPDATE for the whole batch
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # A missing row counts as zero, so only increments need one; decrements never insert
+    # (which also keeps cascade deletes from recreating the counter of a deleted user)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id, delta in deltas.items() if delta > 0], ignore_conflicts=True
+    )
+    NotificationCounter.objects.filter(user_id__in=list(deltas)).update(unread_count=_unread_change(deltas))
+
+
+def record_changes(deltas: dict, create=True) -> dict:
+    """
+    Advance the change sequence of every user in {user_id: unread delta} and apply the
+    unread deltas, with one UPDATE for the whole batch. Call inside a transaction and stamp
+    the changed notifications with the returned sequence numbers.
+
+    Returns:
+        dict: {user_id: new last_seq} (users without a counter row are left out when create is False)
+    """
+    if not deltas:
+        return {}
+    if create:
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in deltas], ignore_conflicts=True
+        )
+    changes = {'last_seq': F('last_seq') + 1}
+    if any(deltas.values()):
+        changes['unread_count'] = _unread_change(deltas)
+    counters = NotificationCounter.objects.filter(user_id__in=list(deltas))
+    counters.update(**changes)
+    return dict(counters.values_list('user_id', 'last_seq'))
+
+
+def _unread_change(deltas: dict):
+    whens = [When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items() if delta]
+    return F('unread_count') + Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def create_notifications(notifications: list):
+    """
+    bulk_create notifications, skipping any that would repeat a deposit's notification
+    of the same type. bulk_create sends no signals, so the inserted ones are counted and
+    stamped with their users' next change sequence here.
+    """
+    with transaction.atomic():
+        existing = set()
+        linked = [notification for notification in notifications if notification.deposit_id]
+        if linked:
+            existing = set(
+                Notification.objects.filter(
+                    deposit_id__in={notification.deposit_id for notification in linked},
+                    type__in={notification.type for notification in linked},
+                ).values_list('deposit_id', 'type')
+            )
+        new = [
+            notification for notification in notifications
+            if not notification.deposit_id or (notification.deposit_id, notification.type) not in existing
+        ]
+        deltas = defaultdict(int)
+        for notification in new:
+            deltas[notification.user_id] += 0 if notification.is_read else 1
+        sequences = record_changes(deltas)
+        for notification in new:
+            notification.change_seq = sequences[notification.user_id]
+        Notification.objects.bulk_create(new, ignore_conflicts=True)
+
+
+def mark_notifications_read(user_id, notification_ids=None) -> int:
+    """
+    Mark a user's unread notifications (all of them, or those in notification_ids) as read
+    with one UPDATE, and take the rows it changed off the counter.
+
+    Returns:
+        int: the number of notifications marked read
+    """
+    with transaction.atomic():
+        sequence = record_changes({user_id: 0})[user_id]
+        unread = Notification.objects.filter(user_id=user_id, is_read=False)
+        if notification_ids is not None:
+            unread = unread.filter(id__in=list(notification_ids))
+        # Only rows this UPDATE flips are counted, so concurrent calls cannot decrement twice
+        count = unread.update(is_read=True, read_at=timezone.now(), change_seq=sequence)
+        adjust_unread_counts({user_id: -count})
+    return count
+
+
+def latest_sequence(user_id) -> int:
+    """The user's committed change sequence"""
+    return NotificationCounter.objects.filter(user_id=user_id).values_list('last_seq', flat=True).first() or 0
+
+
+def notifications_since(user_id, position: dict, limit=DELTA_PAGE_SIZE, latest=None):
+    """
+    Notifications created or changed after a sync position, in change order.
+
+    A position is {'seq': n} once everything up to sequence n has been seen, or
+    {'seq': n, 'id': i} part way through the notifications changed at sequence n.
+    latest is the user's committed sequence read before the page (read here when not given).
+    Raises ValueError for a malformed position.
+
+    Returns:
+        (notifications, next_position, has_more)
+    """
+    try:
+        seq = int(position['seq'])
+        after_id = int(position['id']) if position.get('id') is not None else None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    # Read before the page so rows changed meanwhile are re-sent rather than skipped
+    if latest is None:
+        latest = latest_sequence(user_id)
+    changed = Notification.objects.filter(user_id=user_id).select_related('support_ticket')
+    if after_id is None:
+        changed = changed.filter(change_seq__gt=seq)
+    else:
+        changed = changed.filter(Q(change_seq=seq, id__gt=after_id) | Q(change_seq__gt=seq))
+    notifications = list(changed.order_by('change_seq', 'id')[:limit + 1])
+
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+    if has_more:
+        last = notifications[-1]
+        next_position = {'seq': last.change_seq, 'id': last.id}
+    else:
+        seen = notifications[-1].change_seq if notifications else seq
+        next_position = {'seq': max(seen, latest)}
+    return notifications, next_position, has_more
+
+
+def serialize_notification(notification) -> dict:
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'message': notification.message,
+        'is_read': notification.is_read,
+        'support_ticket_id': notification.support_ticket.ticket_id if notification.support_ticket else None,
+        'created_at': notification.created_at.isoformat(),
+        'read_at': notification.read_at.isoformat() if notification.read_at else None,
+        'change_seq': notification.change_seq,
+    }
+
+
+def rebuild_notification_counters() -> int:
+    """Recompute every user's unread count from the notifications table, keeping change sequences"""
+    with transaction.atomic():
+        # Sequences only ever move forward, or synced clients would miss changes
+        sequences = dict(NotificationCounter.objects.select_for_update().values_list('user_id', 'last_seq'))
+        counts = dict(
+            Notification.objects.filter(is_read=False).order_by()
+            .values_list('user_id').annotate(count=Count('id'))
+        )
+        NotificationCounter.objects.all().delete()
+        counters = NotificationCounter.objects.bulk_create(
+            [
+                NotificationCounter(user_id=user_id, unread_count=counts.get(user_id, 0), last_seq=sequences.get(user_id, 0))
+                for user_id in set(counts) | set(sequences)
+            ],
+            batch_size=1000,
+        )
+    return len(counters)
@@ -0,0 +1,102 @@
+"""
+Outbox services for QFS Ledger application
+
+Side effects (notifications, wallet credits, email) are written as OutboxEvent rows
+in the same transaction as the change that causes them. The run_outbox worker claims
+due events, runs the handler registered for the topic and retries failures with
+exponential backoff.
+"""
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxEvent
+
+
+HANDLERS: Dict[str, Callable[[dict], None]] = {}
+
+DEFAULT_MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+# A claimed event is hidden from other workers this long; if the worker dies it becomes due again
+LEASE_SECONDS = 300
+
+
+def register_handler(topic: str):
+    """Decorator registering the function that carries out events of a topic"""
+    def decorator(func):
+        HANDLERS[topic] = func
+        return func
+    return decorator
+
+
+def enqueue(topic: str, key, payload: dict = None) -> OutboxEvent:
+    """
+    Record an event in the current transaction. Enqueueing the same (topic, key) again is a no-op.
+    """
+    event, _ = OutboxEvent.objects.get_or_create(topic=topic, key=str(key), defaults={'payload': payload or {}})
+    return event
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+def claim_events(limit: int = 100) -> list:
+    """
+    Claim up to limit due events for this worker.
+    Each claim is a conditional UPDATE, so two workers never process the same event at once.
+    """
+    now = timezone.now()
+    candidates = list(
+        OutboxEvent.objects.filter(status='pending', available_at__lte=now)
+        .order_by('available_at', 'id')
+        .values_list('id', 'available_at')[:limit]
+    )
+    lease_until = now + timedelta(seconds=LEASE_SECONDS)
+    claimed_ids = [
+        event_id for event_id, available_at in candidates
+        if OutboxEvent.objects.filter(id=event_id, status='pending', available_at=available_at).update(
+            available_at=lease_until, attempts=F('attempts') + 1
+        )
+    ]
+    return list(OutboxEvent.objects.filter(id__in=claimed_ids).order_by('id'))
+
+
+def process_event(event: OutboxEvent, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+    """Run the handler for one claimed event and record the outcome. Returns True on success."""
+    handler = HANDLERS.get(event.topic)
+    try:
+        if handler is None:
+            raise LookupError(f'No outbox handler registered for {event.topic}')
+        handler(event.payload)
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        if event.attempts >= max_attempts:
+            OutboxEvent.objects.filter(id=event.id).update(status='failed', last_error=error)
+        else:
+            OutboxEvent.objects.filter(id=event.id).update(
+                available_at=timezone.now() + retry_delay(event.attempts), last_error=error
+            )
+        return False
+
+    OutboxEvent.objects.filter(id=event.id).update(status='done', processed_at=timezone.now(), last_error='')
+    return True
+
+
+def process_due_events(limit: int = 100, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+    """Claim and process one batch of due events"""
+    results = {'processed': 0, 'failed': 0}
+    for event in claim_events(limit):
+        if process_event(event, max_attempts):
+            results['processed'] += 1
+        else:
+            results['failed'] += 1
+    return results
+
+
+def retry_failed_events(queryset=None) -> int:
+    """Make failed events due again, e.g. after fixing the mail server"""
+    queryset = OutboxEvent.objects.all() if queryset is None else queryset
+    return queryset.filter(status='failed').update(status='pending', attempts=0, available_at=timezone.now())
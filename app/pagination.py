@@ -0,0 +1,32 @@
+from django.core import signing
+from rest_framework.pagination import CursorPagination
+
+
+# Cursors carry server state (e.g. a statement's running balance), so they are signed
+CURSOR_SALT = 'app.pagination.cursor'
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor (keyset) pagination on (created_at, id) so deep pages cost the same as the first page"""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def encode_cursor(position: dict, scope: str = '') -> str:
+    """
+    Encode a keyset position as an opaque, signed URL-safe cursor.
+    scope binds the cursor to what it pages through, e.g. one account's statement.
+    """
+    return signing.dumps(position, salt=f'{CURSOR_SALT}:{scope}', compress=True)
+
+
+def decode_cursor(cursor: str, scope: str = '') -> dict:
+    """Decode a cursor produced by encode_cursor, raising ValueError when it is malformed or tampered with"""
+    try:
+        position = signing.loads(cursor, salt=f'{CURSOR_SALT}:{scope}')
+    except signing.BadSignature:
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, dict):
+        raise ValueError('Invalid cursor')
+    return position
@@ -0,0 +1,208 @@
+"""
+Price services for QFS Ledger application
+
+Coin prices in USD come from a pluggable provider (settings.PRICE_PROVIDER) and
+are cached in-process and in the Django cache. Reads never wait on the provider:
+a fresh quote is returned as-is, and a stale one is returned while a single
+background refresh fetches a new one (stale-while-revalidate).
+"""
+import json
+import logging
+import threading
+import time
+import urllib.request
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from .models import DepositTransaction
+
+
+logger = logging.getLogger(__name__)
+
+COINS = [coin for coin, _ in DepositTransaction.COIN_CHOICES]
+
+PRICE_CACHE_KEY = 'coin-prices'
+REFRESH_LOCK_KEY = 'coin-prices:refreshing'
+
+DEFAULT_PROVIDER = {
+    'BACKEND': 'app.price_services.HTTPPriceProvider',
+    'OPTIONS': {},
+}
+
+
+class PriceProviderError(Exception):
+    """Raised when a provider cannot return prices"""
+
+
+class PriceProvider:
+    """Base provider: fetch() returns {coin: Decimal USD price} for the coins it knows"""
+
+    def fetch(self, coins) -> Dict[str, Decimal]:
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_prices(data, coins, ids=None) -> Dict[str, Decimal]:
+        """
+        Read {id: price} or CoinGecko-style {id: {'usd': price}} into {coin: Decimal}.
+        Coins missing from the payload are left out.
+        """
+        ids = ids or {}
+        prices = {}
+        for coin in coins:
+            value = data.get(ids.get(coin, coin))
+            if isinstance(value, dict):
+                value = value.get('usd')
+            if value is None:
+                continue
+            try:
+                prices[coin] = Decimal(str(value))
+            except InvalidOperation:
+                raise PriceProviderError(f'Invalid price for {coin}: {value!r}')
+        return prices
+
+
+class HTTPPriceProvider(PriceProvider):
+    """
+    Fetch prices from a JSON HTTP endpoint (CoinGecko's simple price API by default).
+    The URL may contain {ids}, which is replaced with the comma-separated provider ids.
+    """
+
+    DEFAULT_URL = 'https://api.coingecko.com/api/v3/simple/price?ids={ids}&vs_currencies=usd'
+    DEFAULT_IDS = {
+        'bitcoin': 'bitcoin',
+        'ethereum': 'ethereum',
+        'ripple': 'ripple',
+        'stellar': 'stellar',
+        'usdt': 'tether',
+        'bnb': 'binancecoin',
+        'bnb_tiger': 'bnb-tiger-inu',
+    }
+
+    def __init__(self, url=None, ids=None, timeout=5):
+        self.url = url or self.DEFAULT_URL
+        self.ids = {**self.DEFAULT_IDS, **(ids or {})}
+        self.timeout = timeout
+
+    def fetch(self, coins) -> Dict[str, Decimal]:
+        url = self.url.replace('{ids}', ','.join(self.ids.get(coin, coin) for coin in coins))
+        request = urllib.request.Request(url, headers={'Accept': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.loads(response.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise PriceProviderError(f'Price request to {url} failed: {e}')
+        if not isinstance(data, dict):
+            raise PriceProviderError('Price response is not a JSON object')
+        return self.parse_prices(data, coins, self.ids)
+
+
+class FixturePriceProvider(PriceProvider):
+    """Read prices from a JSON file of {coin: price}, for development and tests"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, coins) -> Dict[str, Decimal]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise PriceProviderError(f'Cannot read price fixture {self.path}: {e}')
+        return self.parse_prices(data, coins)
+
+
+def get_provider() -> PriceProvider:
+    config = getattr(settings, 'PRICE_PROVIDER', DEFAULT_PROVIDER)
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def price_ttl() -> float:
+    return getattr(settings, 'PRICE_CACHE_TTL', 60)
+
+
+def price_stale_ttl() -> float:
+    return getattr(settings, 'PRICE_STALE_TTL', 3600)
+
+
+# Last quote seen by this process, so fresh reads skip the shared cache
+_local_quote: Optional[dict] = None
+_refresh_lock = threading.Lock()
+_refresh_thread: Optional[threading.Thread] = None
+
+
+def _load_quote() -> Optional[dict]:
+    global _local_quote
+    now = time.time()
+    if _local_quote and now - _local_quote['fetched_at'] < price_ttl():
+        return _local_quote
+    shared = cache.get(PRICE_CACHE_KEY)
+    if shared and (not _local_quote or shared['fetched_at'] > _local_quote['fetched_at']):
+        _local_quote = shared
+    return _local_quote
+
+
+def refresh_prices() -> Optional[dict]:
+    """
+    Fetch prices from the provider and store them in both caches.
+    Returns the new quote, or None if the provider failed (the previous quote is kept).
+    """
+    global _local_quote
+    try:
+        prices = get_provider().fetch(COINS)
+    except PriceProviderError as e:
+        logger.warning("Price refresh failed: %s", e)
+        return None
+    quote = {'prices': {coin: str(price) for coin, price in prices.items()}, 'fetched_at': time.time()}
+    _local_quote = quote
+    cache.set(PRICE_CACHE_KEY, quote, price_stale_ttl())
+    return quote
+
+
+def _refresh_in_background():
+    try:
+        refresh_prices()
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+
+
+def schedule_refresh() -> bool:
+    """
+    Start a background refresh unless one is already running in this process or another.
+    Returns True if this call started it.
+    """
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return False
+        # cache.add is atomic, so only one process wins the refresh
+        if not cache.add(REFRESH_LOCK_KEY, True, timeout=max(30, price_ttl())):
+            return False
+        _refresh_thread = threading.Thread(target=_refresh_in_background, name='price-refresh', daemon=True)
+        _refresh_thread.start()
+        return True
+
+
+def get_prices() -> dict:
+    """
+    Current USD prices without waiting on the provider.
+
+    Returns:
+        {'prices': {coin: str price}, 'fetched_at': epoch seconds or None, 'stale': bool}.
+        Prices are empty until the first refresh completes.
+    """
+    quote = _load_quote()
+    age = time.time() - quote['fetched_at'] if quote else None
+    if quote is None or age >= price_ttl():
+        schedule_refresh()
+    if quote is None or age >= price_stale_ttl():
+        return {'prices': {}, 'fetched_at': None, 'stale': True}
+    return {'prices': quote['prices'], 'fetched_at': quote['fetched_at'], 'stale': age >= price_ttl()}
+
+
+def reset_price_cache():
+    """Forget cached quotes (used by tests)"""
+    global _local_quote
+    _local_quote = None
+    cache.delete_many([PRICE_CACHE_KEY, REFRESH_LOCK_KEY])
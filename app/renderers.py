@@ -0,0 +1,25 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+class StreamingExportRenderer(BaseRenderer):
+    """
+    Lets `?format=` select an export format on views that return their own
+    StreamingHttpResponse. Only error payloads are rendered here, as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, default=str).encode(self.charset)
+
+
+class CSVExportRenderer(StreamingExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONExportRenderer(StreamingExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
@@ -1,5 +1,6 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import Account, Transaction, JournalEntry, KYCVerification, DepositTransaction, Wallet
+from .models import Account, AccountBalance, Transaction, JournalEntry, KYCVerification, DepositTransaction, Wallet
 
 
 class KYCVerificationSerializer(serializers.ModelSerializer):
@@ -51,10 +52,24 @@ class KYCStatusSerializer(serializers.ModelSerializer):
         model = KYCVerification
         fields = ['status', 'document_type', 'submitted_at', 'reviewed_at', 'admin_notes']
 
+class AccountBalanceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AccountBalance
+        fields = ['debit_total', 'credit_total', 'net', 'last_entry_id', 'updated_at']
+
 class AccountSerializer(serializers.ModelSerializer):
+    balance = serializers.SerializerMethodField()
+    
     class Meta:
         model = Account
         fields = '__all__'
+    
+    def get_balance(self, obj):
+        """Read the materialized balance instead of summing journal entries"""
+        try:
+            return AccountBalanceSerializer(obj.balance).data
+        except AccountBalance.DoesNotExist:
+            return None
 
 class JournalEntrySerializer(serializers.ModelSerializer):
     account_name = serializers.CharField(source='account.name', read_only=True)
@@ -63,6 +78,18 @@ class JournalEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = JournalEntry
         fields = ['id', 'account', 'account_name', 'account_code', 'entry_type', 'amount']
+    
+    def validate(self, attrs):
+        """Reject edits to entries on transactions inside a closed period"""
+        from .ledger_services import ensure_period_open
+        
+        # transaction is not writable here, so only an existing entry has one
+        if self.instance is not None:
+            try:
+                ensure_period_open(self.instance.transaction.date)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({'transaction': e.messages})
+        return attrs
 
 class TransactionSerializer(serializers.ModelSerializer):
     entries = JournalEntrySerializer(many=True, read_only=True)
@@ -71,6 +98,18 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = ['id', 'reference', 'description', 'date', 'user', 'user_name', 'entries', 'created_at']
+    
+    def validate_date(self, value):
+        """Reject postings dated inside a closed period"""
+        from .ledger_services import ensure_period_open
+        
+        try:
+            ensure_period_open(value)
+            if self.instance is not None:
+                ensure_period_open(self.instance.date)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return value
 
 
 class DepositTransactionSerializer(serializers.ModelSerializer):
@@ -1,72 +1,190 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.utils import timezone
-from .models import DepositTransaction, Notification, Wallet
+from django.contrib.auth.models import User
+from .models import DepositAddress, DepositTransaction, Notification, Wallet, WalletBalance, JournalEntry, Account, Transaction
+from .ledger_services import (
+    post_entry_balance, link_account, check_account_move, move_account, closed_through, ensure_period_open
+)
+from .wallet_services import invalidate_wallet_cache
+from .address_services import invalidate_address_registry
+from .notification_services import record_changes, unread_contribution, unread_delta
+from .deposit_services import enqueue_deposit_confirmation, pending_contribution, pending_delta, apply_pending_deltas
+
+
+@receiver(pre_save, sender=DepositTransaction)
+def capture_previous_deposit(sender, instance, **kwargs):
+    """
+    Remember what the stored version contributed to the pending summaries
+    """
+    instance._previous_pending = {}
+    if instance.pk:
+        previous = DepositTransaction.objects.filter(pk=instance.pk).values('status', 'coin_type', 'amount').first()
+        if previous:
+            instance._previous_pending = pending_contribution(previous['status'], previous['coin_type'], previous['amount'])
+
+
+@receiver(post_save, sender=DepositTransaction)
+def update_pending_summary_on_save(sender, instance, created, **kwargs):
+    """
+    Keep the per-coin pending counters in step with status, coin and amount changes
+    """
+    before = getattr(instance, '_previous_pending', {})
+    after = pending_contribution(instance.status, instance.coin_type, instance.amount)
+    apply_pending_deltas(pending_delta(before, after))
+    instance._previous_pending = after
+
+
+@receiver(post_delete, sender=DepositTransaction)
+def update_pending_summary_on_delete(sender, instance, **kwargs):
+    apply_pending_deltas(pending_delta(pending_contribution(instance.status, instance.coin_type, instance.amount), {}))
 
 
 @receiver(post_save, sender=DepositTransaction)
 def handle_deposit_status_change(sender, instance, created, **kwargs):
     """
-    Handle deposit status changes: create notification, credit wallet, set timestamps
-    """
-    if not created:  # Only for updates, not new creations
-        # Check if status changed to confirmed
-        if instance.status == 'confirmed':
-            print(f"DEBUG: Processing confirmed deposit #{instance.id} for user {instance.user.username}")
-            
-            # Check if notification already exists for this deposit
-            existing_notification = Notification.objects.filter(
-                user=instance.user,
-                type='deposit_confirmed',
-                title__contains=f"Deposit #{instance.id}"
-            ).first()
-            
-            if not existing_notification:
-                print(f"DEBUG: Creating notification for deposit #{instance.id}")
-                # Create new notification
-                Notification.objects.create(
-                    user=instance.user,
-                    type='deposit_confirmed',
-                    title=f'Deposit #{instance.id} Confirmed',
-                    message=f'Your {instance.get_coin_type_display()} deposit of ${instance.amount:.2f} USD has been confirmed and credited to your wallet.',
-                    created_at=timezone.now()
-                )
-                
-                # Credit user wallet
-                if instance.amount and instance.amount > 0:
-                    print(f"DEBUG: Crediting {instance.amount} {instance.coin_type} to user {instance.user.username}")
-                    wallet, wallet_created = Wallet.objects.get_or_create(user=instance.user)
-                    print(f"DEBUG: Wallet {'created' if wallet_created else 'found'} for user {instance.user.username}")
-                    
-                    # Get balance before
-                    old_balance = wallet.get_balance(instance.coin_type)
-                    print(f"DEBUG: Old {instance.coin_type} balance: {old_balance}")
-                    
-                    # Add balance
-                    wallet.add_balance(instance.coin_type, instance.amount)
-                    
-                    # Get balance after
-                    new_balance = wallet.get_balance(instance.coin_type)
-                    print(f"DEBUG: New {instance.coin_type} balance: {new_balance}")
-                else:
-                    print(f"DEBUG: No amount to credit for deposit #{instance.id}")
-            else:
-                print(f"DEBUG: Notification already exists for deposit #{instance.id}")
-            
-            # Send confirmation email if not already sent
-            if not instance.email_sent:
-                print(f"DEBUG: Sending confirmation email for deposit #{instance.id}")
-                from .email_services import send_deposit_confirmation_email
-                email_sent = send_deposit_confirmation_email(instance)
-                if email_sent:
-                    print(f"DEBUG: Email sent successfully for deposit #{instance.id}")
-                else:
-                    print(f"DEBUG: Failed to send email for deposit #{instance.id}")
-            else:
-                print(f"DEBUG: Email already sent for deposit #{instance.id}")
-            
-            # Set confirmed_at timestamp if not already set
-            if not instance.confirmed_at:
-                print(f"DEBUG: Setting confirmed_at timestamp for deposit #{instance.id}")
-                # Use update to avoid triggering signals again
-                DepositTransaction.objects.filter(id=instance.id).update(confirmed_at=timezone.now())
\ No newline at end of file
+    Queue crediting, notification and email for a confirmed deposit.
+    Only the outbox row is written here, in the saving transaction; the run_outbox worker does the rest.
+    """
+    if not created and instance.status == 'confirmed':
+        if instance.credited_at and instance.email_sent:
+            return
+        enqueue_deposit_confirmation(instance)
+
+
+@receiver(pre_save, sender=JournalEntry)
+def capture_previous_journal_entry(sender, instance, **kwargs):
+    """
+    Remember the stored version of an edited entry so its balance effect can be reversed
+    """
+    instance._previous_entry = None
+    if instance.pk:
+        instance._previous_entry = JournalEntry.objects.filter(pk=instance.pk).only(
+            'account_id', 'entry_type', 'amount', 'transaction_id'
+        ).first()
+    
+    if closed_through():
+        transaction_ids = {instance.transaction_id}
+        if instance._previous_entry is not None:
+            transaction_ids.add(instance._previous_entry.transaction_id)
+        for posting_date in Transaction.objects.filter(pk__in=transaction_ids).values_list('date', flat=True):
+            ensure_period_open(posting_date)
+
+
+@receiver(post_save, sender=JournalEntry)
+def update_account_balance_on_save(sender, instance, created, **kwargs):
+    """
+    Keep AccountBalance in step with each posting
+    """
+    previous = getattr(instance, '_previous_entry', None)
+    if previous is not None:
+        post_entry_balance(previous, reverse=True)
+    post_entry_balance(instance)
+
+
+@receiver(post_delete, sender=JournalEntry)
+def update_account_balance_on_delete(sender, instance, **kwargs):
+    """
+    Reverse a deleted entry from AccountBalance
+    """
+    post_entry_balance(instance, reverse=True)
+
+
+@receiver(pre_save, sender=Account)
+def capture_previous_account_parent(sender, instance, **kwargs):
+    """
+    Remember the stored parent so a move can be detected, and reject cycles
+    """
+    instance._previous_parent_id = None
+    if instance.pk:
+        instance._previous_parent_id = Account.objects.filter(pk=instance.pk).values_list('parent_id', flat=True).first()
+        if instance._previous_parent_id != instance.parent_id:
+            check_account_move(instance, instance.parent_id)
+
+
+@receiver(post_save, sender=Account)
+def update_account_closure(sender, instance, created, **kwargs):
+    """
+    Keep AccountClosure in step with Account.parent
+    """
+    if created:
+        link_account(instance)
+    elif getattr(instance, '_previous_parent_id', None) != instance.parent_id:
+        move_account(instance)
+
+
+@receiver(pre_save, sender=Transaction)
+def reject_closed_period_transaction(sender, instance, **kwargs):
+    """
+    Refuse to create, back-date or edit transactions inside a closed period
+    """
+    ensure_period_open(instance.date)
+    if instance.pk:
+        ensure_period_open(Transaction.objects.filter(pk=instance.pk).values_list('date', flat=True).first())
+
+
+@receiver(pre_delete, sender=Transaction)
+def reject_closed_period_transaction_delete(sender, instance, **kwargs):
+    ensure_period_open(instance.date)
+
+
+@receiver(pre_delete, sender=JournalEntry)
+def reject_closed_period_entry_delete(sender, instance, **kwargs):
+    if closed_through():
+        ensure_period_open(Transaction.objects.filter(pk=instance.transaction_id).values_list('date', flat=True).first())
+
+
+@receiver(post_save, sender=User)
+def create_user_wallet(sender, instance, created, **kwargs):
+    """
+    Give every new user a wallet so balance reads never have to create one
+    """
+    if created:
+        Wallet.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=WalletBalance)
+@receiver(post_delete, sender=WalletBalance)
+def invalidate_wallet_balance_cache(sender, instance, **kwargs):
+    """
+    Move the cached balance payload on when a balance row is edited directly (e.g. in the admin)
+    """
+    invalidate_wallet_cache(instance.user_id)
+
+
+@receiver(pre_delete, sender=User)
+def retire_deleted_user_addresses(sender, instance, **kwargs):
+    """
+    Retire a deleted user's deposit addresses so funds later sent to them are never credited to someone else
+    """
+    if DepositAddress.objects.filter(user=instance).exclude(state='retired').update(state='retired'):
+        invalidate_address_registry()
+
+
+@receiver(post_save, sender=DepositAddress)
+@receiver(post_delete, sender=DepositAddress)
+def invalidate_deposit_address_registry(sender, instance, **kwargs):
+    """
+    Reload the in-process address mapping everywhere when an address is edited, retired or removed
+    """
+    invalidate_address_registry()
+
+
+@receiver(pre_save, sender=Notification)
+def record_notification_change(sender, instance, **kwargs):
+    """
+    Keep the per-user unread counter in step and stamp the notification with the user's next change sequence
+    """
+    before = {}
+    if instance.pk:
+        previous = Notification.objects.filter(pk=instance.pk).values('user_id', 'is_read').first()
+        if previous:
+            before = unread_contribution(previous['user_id'], previous['is_read'])
+    deltas = {instance.user_id: 0, **unread_delta(before, unread_contribution(instance.user_id, instance.is_read))}
+    instance.change_seq = record_changes(deltas)[instance.user_id]
+
+
+@receiver(post_delete, sender=Notification)
+def record_notification_delete(sender, instance, **kwargs):
+    # Never insert a counter here: during a cascade the user row may be going too
+    deltas = {instance.user_id: 0, **unread_delta(unread_contribution(instance.user_id, instance.is_read), {})}
+    record_changes(deltas, create=False)
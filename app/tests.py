@@ -1,3 +1,2160 @@
-from django.test import TestCase
+import json
+import os
+import re
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from django.utils import timezone
+from .models import (
+    Account, AccountBalance, ChainTransfer, DepositAddress, DepositTransaction, JournalEntry, KYCVerification,
+    Notification, NotificationCounter, OutboxEvent, SupportTicket, Transaction, Wallet,
+)
 
-# Create your tests here.
+
+# Full table scans, and full scans of an index or covering index (which still read every entry);
+# scans of a subquery's own result rows are not table scans
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW|\()(\S+)(?:\s+AS\s+\S+)?(?:\s+USING\s+(?:COVERING\s+)?INDEX\s+\S+)?$')
+
+
+class QueryPlanTests(TestCase):
+    """
+    Call each API endpoint through the test client, capture the SQL it runs and fail when
+    EXPLAIN QUERY PLAN shows a full table or full index scan that is not explicitly allowed.
+    """
+
+    # (endpoint, table) pairs that scan by design, with the reason
+    ALLOWED_SCANS = {
+        ('account-list', 'app_account'): 'Lists every account in code order',
+        ('account-tree', 'app_account'): 'Builds the whole chart of accounts',
+        ('transaction-list', 'app_transaction'): 'Page of every transaction, read in index order',
+        ('journalentry-list', 'app_journalentry'): 'Page of the whole journal, read in id order',
+        ('admin_kyc_list', 'app_kycverification'): 'Admin listing of every submission',
+        ('admin_support_tickets', 'app_supportticket'): 'Admin listing of every ticket',
+        ('get_wallet_address', 'app_depositaddress'): 'Reloads the assigned address registry on a version change',
+        ('create_deposit', 'app_depositaddress'): 'Reloads the assigned address registry on a version change',
+        ('create_support_ticket', 'app_supportticket'): 'Next ticket number from the last row by id, stops after one',
+        ('transaction-bulk', 'app_periodclose'): 'Latest close from the end of the period_end index, stops after one',
+        ('close_accounting_period', 'app_journalentry'): 'The first close totals every entry up to period_end',
+        ('close_accounting_period', 'app_periodclose'): 'Latest close from the end of the period_end index, stops after one',
+        ('ledger:closed_through', 'app_periodclose'): 'Latest close from the end of the period_end index, stops after one',
+        ('trial_balance_report', 'app_account'): 'Reports on every account',
+        ('trial_balance_report', 'app_accountbalance'): 'Running totals of every account',
+        ('trial_balance_report', 'app_accountclosure'): 'Rolls every account up its ancestors',
+        ('portfolio_valuation', 'app_walletbalance'): 'Values every wallet balance',
+    }
+
+    # Endpoints that run no query worth planning
+    NO_QUERY = {'api-root', 'api_status', 'coin_prices'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('plan@example.com', 'plan@example.com', 'password', is_staff=True)
+        cls.account = Account.objects.create(name='Assets', code='1000', account_type='ASSET')
+        cls.child = Account.objects.create(name='Cash', code='1100', account_type='ASSET', parent=cls.account)
+        cls.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        cls.txn = Transaction.objects.create(reference='PLAN-1', description='Opening', date=date(2024, 1, 2), user=cls.user)
+        cls.entry = JournalEntry.objects.create(transaction=cls.txn, account=cls.child, entry_type='DEBIT', amount=Decimal('50'))
+        JournalEntry.objects.create(transaction=cls.txn, account=cls.equity, entry_type='CREDIT', amount=Decimal('50'))
+        cls.ticket = SupportTicket.objects.create(user=cls.user, department='general', subject='s', message='m')
+        cls.kyc = KYCVerification.objects.create(user=cls.user, status='pending')
+        cls.notification = Notification.objects.create(user=cls.user, type='general', title='t', message='m')
+        DepositAddress.objects.create(coin='bitcoin', address='bc1qplan')
+        cls.deposit = DepositTransaction.objects.create(
+            user=cls.user, coin_type='bitcoin', amount=Decimal('10'), wallet_address='bc1qplan'
+        )
+        ChainTransfer.objects.create(
+            coin='bitcoin', txid='plan-tx', to_address='bc1qplan', amount=Decimal('0.0001'),
+            usd_amount=Decimal('10'), block_time=timezone.now(),
+        )
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def endpoint_requests(self):
+        """{url name: [(method, path, data[, format])]} covering the query paths of every endpoint"""
+        from django.contrib.auth.tokens import PasswordResetTokenGenerator
+        from django.utils.encoding import force_bytes
+        from django.utils.http import urlsafe_base64_encode
+        from .pagination import encode_cursor
+        account, user = self.account, self.user
+        reset_token = f'{urlsafe_base64_encode(force_bytes(user.pk))}-{PasswordResetTokenGenerator().make_token(user)}'
+        posting = {
+            'reference': 'PLAN-2', 'description': 'Bulk', 'date': '2024-02-01',
+            'entries': [
+                {'account': self.child.id, 'entry_type': 'DEBIT', 'amount': '5'},
+                {'account': self.equity.id, 'entry_type': 'CREDIT', 'amount': '5'},
+            ],
+        }
+        return {
+            'account-list': [('get', '/api/accounts/', None)],
+            'account-detail': [('get', f'/api/accounts/{account.id}/', None)],
+            'account-tree': [('get', '/api/accounts/tree/', None), ('get', f'/api/accounts/tree/?root={account.id}', None)],
+            'account-subtree': [('get', f'/api/accounts/{account.id}/subtree/', None)],
+            'account-ancestors': [('get', f'/api/accounts/{self.child.id}/ancestors/', None)],
+            'account-statement': [('get', f'/api/accounts/{self.child.id}/statement/?from=2024-01-01&page_size=1', None)],
+            'transaction-list': [
+                ('get', '/api/transactions/', None),
+                ('get', '/api/transactions/?pagination=cursor', None),
+            ],
+            'transaction-detail': [('get', f'/api/transactions/{self.txn.id}/', None)],
+            'transaction-bulk': [('post', '/api/transactions/bulk/', {'transactions': [posting]})],
+            'journalentry-list': [('get', '/api/journal-entries/', None)],
+            'journalentry-detail': [('get', f'/api/journal-entries/{self.entry.id}/', None)],
+            'trial_balance_report': [
+                ('get', '/api/reports/trial-balance/', None),
+                ('get', '/api/reports/trial-balance/?from=2024-01-01&to=2024-12-31', None),
+            ],
+            'general_ledger_report': [('get', f'/api/reports/general-ledger/?account={account.code}&from=2024-01-01', None)],
+            'balance_as_of_report': [('get', f'/api/reports/balance-as-of/?account={self.child.code}&date=2024-06-30', None)],
+            'close_accounting_period': [('post', '/api/periods/close/', {'period_end': '2024-01-31'})],
+            'export_journal': [('get', '/api/exports/journal/?format=ndjson&from=2024-01-01', None)],
+            'register_user': [('post', '/api/auth/register/', {'name': 'New', 'email': 'new@example.com', 'password': 'password'})],
+            'login_user': [('post', '/api/auth/login/', {'email': user.email, 'password': 'password'})],
+            'user_profile': [('get', '/api/auth/profile/', None)],
+            'change_password': [('post', '/api/auth/change-password/', {'old_password': 'password', 'new_password': 'password2'})],
+            'forgot_password': [('post', '/api/auth/forgot-password/', {'email': user.email})],
+            'reset_password': [('post', '/api/auth/reset-password/', {'token': reset_token, 'password': 'password2'})],
+            'submit_kyc_document': [('post', '/api/kyc/submit/', {'document_type': 'passport'}, 'multipart')],
+            'kyc_status': [('get', '/api/kyc/status/', None)],
+            'admin_kyc_list': [('get', '/api/admin/kyc/', None)],
+            'admin_kyc_review': [('post', f'/api/admin/kyc/{self.kyc.id}/review/', {'action': 'approve'})],
+            'create_support_ticket': [
+                ('post', '/api/support/create/', {'department': 'general', 'subject': 'Help', 'message': 'Please'}),
+            ],
+            'get_user_support_tickets': [('get', '/api/support/tickets/', None)],
+            'admin_support_tickets': [('get', '/api/support/admin/tickets/', None)],
+            'admin_reply_to_support_ticket': [
+                ('post', '/api/support/admin/reply/', {'ticket_id': self.ticket.id, 'message': 'Done', 'status': 'resolved'}),
+            ],
+            'get_user_notifications': [
+                ('get', '/api/notifications/', None),
+                ('get', f'/api/notifications/?since={encode_cursor({"seq": 0}, f"notifications:{user.id}")}', None),
+                ('get', f'/api/notifications/?since={encode_cursor({"seq": 0, "id": 0}, f"notifications:{user.id}")}', None),
+            ],
+            'notification_unread_count': [('get', '/api/notifications/unread-count/', None)],
+            'mark_notification_as_read': [('post', '/api/notifications/mark-read/', {'notification_id': self.notification.id})],
+            'mark_notifications_read_bulk': [
+                ('post', '/api/notifications/mark-read/bulk/', {'notification_ids': [self.notification.id]}),
+            ],
+            'mark_all_notifications_as_read': [('post', '/api/notifications/mark-all-read/', None)],
+            'get_wallet_address': [('get', '/api/deposits/wallet-address/?coin_type=bitcoin', None)],
+            'create_deposit': [('post', '/api/deposits/create/', {'coin_type': 'bitcoin', 'amount': '25'})],
+            'get_user_deposits': [('get', '/api/deposits/', None)],
+            'deposit_review_queue': [('get', '/api/admin/deposits/review-queue/?coin=bitcoin', None)],
+            'get_wallet_balance': [('get', '/api/wallet/balance/', None)],
+            'track_wallet_copy': [('post', '/api/wallet/track-copy/', {'coin_type': 'bitcoin', 'wallet_address': 'bc1qplan'})],
+            'portfolio_valuation': [('get', '/api/admin/valuation/', None)],
+        }
+
+    def service_calls(self):
+        """Worker hot paths outside the request cycle that share the same indexes"""
+        from .chain_services import match_transfers, watched_addresses
+        from .deposit_services import handle_deposit_email_batch
+        from .ledger_services import closed_through
+        from .outbox_services import claim_events
+        return {
+            'outbox:claim_events': lambda: claim_events(),
+            'outbox:deposit_email_batch': lambda: handle_deposit_email_batch({'deposit_ids': [self.deposit.id]}),
+            'chain:watched_addresses': lambda: watched_addresses('bitcoin'),
+            'chain:match_transfers': lambda: match_transfers('bitcoin'),
+            'ledger:closed_through': lambda: closed_through(),
+        }
+
+    def capture(self, call):
+        """Run call in a rolled-back savepoint and return the SQL it executed"""
+        with CaptureQueriesContext(connection) as captured:
+            with transaction.atomic():
+                result = call()
+                transaction.set_rollback(True)
+        return result, [query['sql'] for query in captured.captured_queries]
+
+    def full_scans(self, sql):
+        if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        return [match.group(1) for match in map(FULL_SCAN.match, details) if match]
+
+    def url_names(self, resolver=None):
+        resolver = resolver or get_resolver('app.urls')
+        names = set()
+        for pattern in resolver.url_patterns:
+            if hasattr(pattern, 'url_patterns'):
+                names |= self.url_names(pattern)
+            elif pattern.name:
+                names.add(pattern.name)
+        return names
+
+    def assert_indexed(self, name, queries):
+        for sql in queries:
+            disallowed = [table for table in self.full_scans(sql) if (name, table) not in self.ALLOWED_SCANS]
+            self.assertEqual(disallowed, [], f'{name}: {sql}')
+
+    def test_every_endpoint_has_a_query_plan_check(self):
+        covered = set(self.endpoint_requests()) | self.NO_QUERY
+        missing = self.url_names() - covered
+        self.assertFalse(missing, f'Add query plan checks for: {sorted(missing)}')
+        unused = {name for name, _ in self.ALLOWED_SCANS} - set(self.endpoint_requests()) - set(self.service_calls())
+        self.assertFalse(unused, f'Allowed scans for unknown endpoints: {sorted(unused)}')
+
+    def test_endpoint_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan format checked against SQLite')
+        from django.core.cache import cache
+        for name, requests in self.endpoint_requests().items():
+            for method, path, data, *options in requests:
+                with self.subTest(endpoint=name, path=path):
+                    # Cold caches, so every request runs its real queries
+                    cache.clear()
+                    request_format = options[0] if options else 'json'
+                    response, queries = self.capture(lambda: getattr(self.client, method)(path, data, format=request_format))
+                    self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+                    if hasattr(response, 'streaming_content'):
+                        # Streaming responses query while the body is read
+                        _, queries = self.capture(lambda: b''.join(response.streaming_content))
+                    self.assertTrue(queries, 'No queries captured')
+                    self.assert_indexed(name, queries)
+
+    def test_service_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan format checked against SQLite')
+        for name, call in self.service_calls().items():
+            with self.subTest(service=name):
+                _, queries = self.capture(call)
+                self.assertTrue(queries, 'No queries captured')
+                self.assert_indexed(name, queries)
+
+
+class WalletConcurrencyTests(TransactionTestCase):
+    """
+    Hammer one wallet from many threads and check no credit or debit is lost.
+    """
+
+    THREADS = 8
+    OPERATIONS = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user('wallet@example.com', 'wallet@example.com', 'password')
+        self.wallet = self.user.wallet
+
+    def run_threads(self, operation):
+        """Run operation OPERATIONS times in each of THREADS threads and collect the results"""
+        results, errors = [], []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            wallet = Wallet.objects.get(pk=self.wallet.pk)
+            barrier.wait()
+            try:
+                for _ in range(self.OPERATIONS):
+                    # SQLite serializes writers; retry when the table is briefly locked
+                    for attempt in range(100):
+                        try:
+                            results.append(operation(wallet))
+                            break
+                        except OperationalError:
+                            time.sleep(0.001 * (attempt + 1))
+                    else:
+                        errors.append('gave up after repeated lock errors')
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_concurrent_credits_are_not_lost(self):
+        results = self.run_threads(lambda wallet: wallet.add_balance('bitcoin', Decimal('1.25')))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(len(results), self.THREADS * self.OPERATIONS)
+        self.assertTrue(all(results))
+        self.assertEqual(self.wallet.bitcoin_balance, Decimal('1.25') * self.THREADS * self.OPERATIONS)
+
+    def test_concurrent_debits_never_overdraw(self):
+        funded = self.THREADS * self.OPERATIONS // 2
+        self.wallet.add_balance('usdt', Decimal(funded))
+
+        results = self.run_threads(lambda wallet: wallet.subtract_balance('usdt', Decimal('1')))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(results.count(True), funded)
+        self.assertEqual(self.wallet.usdt_balance, Decimal('0'))
+
+    def test_unknown_coin_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.wallet.add_balance('dogecoin', Decimal('1'))
+
+
+class WalletBalanceCacheTests(TestCase):
+    """
+    Cached balances follow writes that never run this process's invalidation.
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.user = User.objects.create_user('cache@example.com', 'cache@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def balance(self):
+        return self.client.get('/api/wallet/balance/').json()['wallet']['bitcoin_balance']
+
+    def test_credit_from_another_process_is_seen(self):
+        from .deposit_services import credit_wallets
+        self.assertEqual(self.balance(), '0.00')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.balance(), '0.00')
+
+        # As the outbox worker would: a set-based credit, no on_commit callback in this process
+        credit_wallets({(self.user.id, 'bitcoin'): Decimal('100')})
+        self.assertEqual(self.balance(), '100.00')
+
+
+class WalletCompatibilityTests(TestCase):
+    """
+    The per-coin Wallet attributes and WalletSerializer read WalletBalance rows and look as they did.
+    """
+
+    def setUp(self):
+        from .models import WalletBalance
+        self.users = [User.objects.create(username=f'compat{i}@example.com', email=f'compat{i}@example.com') for i in range(3)]
+        for user in self.users:
+            WalletBalance.objects.create(user=user, coin='bitcoin', amount=Decimal('12.5'))
+            WalletBalance.objects.create(user=user, coin='bnb_tiger', amount=Decimal('0.07'))
+        self.expected = {
+            'bitcoin_balance': '12.50', 'ethereum_balance': '0.00', 'ripple_balance': '0.00', 'stellar_balance': '0.00',
+            'usdt_balance': '0.00', 'bnb_balance': '0.00', 'bnb_tiger_balance': '0.07',
+        }
+
+    def test_coin_attributes_read_the_balance_rows_once(self):
+        from .models import CoinBalance
+        self.assertIsInstance(Wallet.bitcoin_balance, CoinBalance)
+        wallet = Wallet.objects.get(user=self.users[0])
+        with self.assertNumQueries(1):
+            self.assertEqual(wallet.bitcoin_balance, Decimal('12.50'))
+            self.assertEqual(wallet.ethereum_balance, Decimal('0.00'))
+            self.assertEqual(wallet.bnb_tiger_balance, Decimal('0.07'))
+
+        wallet.add_balance('ethereum', Decimal('3'))
+        self.assertEqual(wallet.ethereum_balance, Decimal('3.00'))
+        self.assertTrue(wallet.subtract_balance('bitcoin', Decimal('2.5')))
+        self.assertFalse(wallet.subtract_balance('bitcoin', Decimal('100')))
+        self.assertEqual(wallet.bitcoin_balance, Decimal('10.00'))
+
+    def test_serializer_output_with_and_without_prefetched_balances(self):
+        from .serializers import WalletSerializer
+        plain = Wallet.objects.filter(user__in=self.users).order_by('id')
+        with self.assertNumQueries(1 + len(self.users)):
+            self.assertEqual(WalletSerializer(plain, many=True).data, [self.expected] * len(self.users))
+
+        prefetched = plain.select_related('user').prefetch_related('user__wallet_balances')
+        with self.assertNumQueries(2):
+            self.assertEqual(WalletSerializer(prefetched, many=True).data, [self.expected] * len(self.users))
+
+
+class DeactivatedUserTokenTests(TestCase):
+    """
+    Access tokens of deactivated users are refused on the cached read endpoints too.
+    """
+
+    ENDPOINTS = [
+        '/api/wallet/balance/',
+        '/api/deposits/wallet-address/?coin_type=bitcoin',
+        '/api/notifications/unread-count/',
+        '/api/notifications/',
+    ]
+
+    def test_deactivated_user_is_rejected(self):
+        from rest_framework.test import APIClient
+        from rest_framework_simplejwt.tokens import RefreshToken
+        user = User.objects.create_user('gone@example.com', 'gone@example.com', 'password')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        for endpoint in self.ENDPOINTS:
+            self.assertEqual(client.get(endpoint).status_code, 200, endpoint)
+
+        user.is_active = False
+        user.save()
+        for endpoint in self.ENDPOINTS:
+            self.assertEqual(client.get(endpoint).status_code, 401, endpoint)
+
+
+class PortfolioValuationTests(TestCase):
+    """
+    Scenario valuation over the users x coins balance matrix.
+    """
+
+    def setUp(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest('numpy is not installed')
+
+    def test_scenarios_totals_exposure_and_top_holders(self):
+        from .valuation import BalanceMatrix, value_portfolios
+        alice = User.objects.create_user('alice', 'alice@example.com', 'password')
+        bob = User.objects.create_user('bob', 'bob@example.com', 'password')
+        alice.wallet.add_balance('bitcoin', Decimal('1000'))
+        alice.wallet.add_balance('usdt', Decimal('50'))
+        bob.wallet.add_balance('bitcoin', Decimal('100'))
+        bob.wallet.add_balance('ethereum', Decimal('2000'))
+
+        matrix = BalanceMatrix.load()
+        results = value_portfolios(matrix, {'btc_down_20': {'bitcoin': -0.2}}, top_n=1)
+
+        self.assertEqual(len(matrix), 2)
+        self.assertEqual(results['baseline']['total'], 3150.0)
+        self.assertEqual(results['btc_down_20']['total'], 2930.0)
+        self.assertEqual(results['btc_down_20']['exposure']['bitcoin'], 880.0)
+        self.assertEqual(results['btc_down_20']['top_holders'], [{'user_id': bob.id, 'value': 2080.0}])
+
+    def test_unknown_coin_is_rejected(self):
+        from .valuation import scenario_vector
+        with self.assertRaises(ValueError):
+            scenario_vector({'dogecoin': -0.5})
+
+    def test_benchmark_one_million_wallets(self):
+        import numpy as np
+        from .valuation import COINS, BalanceMatrix, value_portfolios
+        wallets = 1_000_000
+        rng = np.random.default_rng(42)
+        user_ids = np.repeat(np.arange(1, wallets + 1), len(COINS))
+        coin_indexes = np.tile(np.arange(len(COINS)), wallets)
+        amounts = rng.uniform(0, 10_000, wallets * len(COINS)).round(2)
+        scenarios = {f'{coin}_down_20': {coin: -0.2} for coin in COINS}
+
+        started = time.perf_counter()
+        matrix = BalanceMatrix.from_rows(user_ids, coin_indexes, amounts)
+        results = value_portfolios(matrix, scenarios, top_n=100)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(matrix), wallets)
+        self.assertAlmostEqual(results['baseline']['total'], amounts.sum(), delta=1)
+        self.assertLess(elapsed, 10, f'Valuing {wallets} wallets took {elapsed:.2f}s')
+
+    def test_benchmark_load(self):
+        from .valuation import COINS, BalanceMatrix
+        wallets = 50_000
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO auth_user (id, username, password, email, first_name, last_name, is_superuser, is_staff, is_active, date_joined) '
+                "VALUES (%s, %s, '', '', '', '', 0, 0, 1, %s)",
+                [(user_id, f'load{user_id}', now) for user_id in range(1_000_001, 1_000_001 + wallets)],
+            )
+            cursor.executemany(
+                'INSERT INTO app_walletbalance (user_id, coin, amount, updated_at) VALUES (%s, %s, %s, %s)',
+                [
+                    (user_id, coin, str(Decimal(index + 1) / 4), now)
+                    for user_id in range(1_000_001, 1_000_001 + wallets)
+                    for index, coin in enumerate(COINS)
+                ],
+            )
+
+        started = time.perf_counter()
+        matrix = BalanceMatrix.load(chunk_size=40_000)
+        elapsed = time.perf_counter() - started
+
+        rows = wallets * len(COINS)
+        self.assertEqual(matrix.amounts.shape, (wallets, len(COINS)))
+        self.assertEqual(list(matrix.amounts[0]), [(index + 1) / 4 for index in range(len(COINS))])
+        # Reading rows from SQLite dominates: about 2.5s per million rows here, so ~18s for 7M
+        self.assertLess(elapsed, 5, f'Loading {rows} balance rows took {elapsed:.2f}s')
+
+
+class PriceOracleTests(TestCase):
+    """
+    Price service against a local stand-in HTTP provider.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.hits = 0
+        cls.hits_lock = threading.Lock()
+        cls.release = threading.Event()
+        test_case = cls
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with test_case.hits_lock:
+                    test_case.hits += 1
+                    price = 60000 + test_case.hits
+                test_case.release.wait(5)
+                body = json.dumps({'bitcoin': {'usd': price}, 'tether': {'usd': 1}}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.provider = {
+            'BACKEND': 'app.price_services.HTTPPriceProvider',
+            'OPTIONS': {'url': f'http://127.0.0.1:{cls.server.server_port}/price?ids={{ids}}'},
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from . import price_services
+        self.prices = price_services
+        price_services.reset_price_cache()
+        type(self).hits = 0
+        self.release.set()
+
+    def wait_for_refresh(self):
+        thread = self.prices._refresh_thread
+        if thread is not None:
+            thread.join(5)
+
+    def test_cold_read_does_not_wait_and_refreshes_in_background(self):
+        with override_settings(PRICE_PROVIDER=self.provider):
+            self.release.clear()
+            quote = self.prices.get_prices()
+            self.assertEqual(quote['prices'], {})
+            self.release.set()
+            self.wait_for_refresh()
+            quote = self.prices.get_prices()
+        self.assertFalse(quote['stale'])
+        self.assertEqual(quote['prices'], {'bitcoin': '60001', 'usdt': '1'})
+
+    def test_stale_quote_is_served_while_one_refresh_runs(self):
+        with override_settings(PRICE_PROVIDER=self.provider, PRICE_CACHE_TTL=0.05):
+            self.prices.refresh_prices()
+            time.sleep(0.1)
+            self.release.clear()
+            results = []
+            readers = [threading.Thread(target=lambda: results.append(self.prices.get_prices())) for _ in range(20)]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+            self.release.set()
+            self.wait_for_refresh()
+
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(quote['stale'] and quote['prices']['bitcoin'] == '60001' for quote in results))
+        # One initial fetch plus exactly one collapsed background refresh
+        self.assertEqual(self.hits, 2)
+
+    def test_fixture_provider(self):
+        import tempfile
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'ethereum': '3000.5'}, f)
+        self.addCleanup(os.unlink, f.name)
+        provider = {'BACKEND': 'app.price_services.FixturePriceProvider', 'OPTIONS': {'path': f.name}}
+        with override_settings(PRICE_PROVIDER=provider):
+            self.assertEqual(self.prices.refresh_prices()['prices'], {'ethereum': '3000.5'})
+            response = self.client.get('/api/prices/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['prices'], {'ethereum': '3000.5'})
+
+    def test_failed_refresh_is_logged(self):
+        provider = {'BACKEND': 'app.price_services.FixturePriceProvider', 'OPTIONS': {'path': '/nonexistent/prices.json'}}
+        with override_settings(PRICE_PROVIDER=provider):
+            with self.assertLogs('app.price_services', 'WARNING') as logs:
+                self.assertIsNone(self.prices.refresh_prices())
+        self.assertIn('Price refresh failed: Cannot read price fixture', logs.output[0])
+
+
+class ChainWatcherTests(TransactionTestCase):
+    """
+    Replay the shipped mock node fixture through the chain watcher.
+    """
+
+    def assign(self, user, *pairs):
+        """Assign user the pool addresses given as address, coin, address, coin, ..."""
+        for address, coin in zip(pairs[::2], pairs[1::2]):
+            DepositAddress.objects.create(coin=coin, address=address, user=user, state='assigned', assigned_at=timezone.now())
+
+    def test_mock_node_transfers_confirm_matching_deposits(self):
+        import asyncio
+        from pathlib import Path
+        from .chain_services import MockNodeBackend, watch
+        user = User.objects.create_user('chain@example.com', 'chain@example.com', 'password')
+        bitcoin = 'bc1qgvry4pf374d7wgddslw7gymrfm2geswsde26ct'
+        evm = '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f'
+        self.assign(user, bitcoin, 'bitcoin', evm, 'ethereum', evm, 'usdt')
+        paid = DepositTransaction.objects.create(user=user, coin_type='bitcoin', amount=Decimal('650'), wallet_address=bitcoin)
+        unpaid = DepositTransaction.objects.create(user=user, coin_type='bitcoin', amount=Decimal('999'), wallet_address=bitcoin)
+        open_amount = DepositTransaction.objects.create(user=user, coin_type='ethereum', wallet_address=evm)
+        near_amount = DepositTransaction.objects.create(user=user, coin_type='usdt', amount=Decimal('249'), wallet_address=evm)
+
+        node = MockNodeBackend(Path(__file__).parent / 'mock_chain' / 'transfers.json')
+        backends = {coin: node for coin in ('bitcoin', 'ethereum', 'usdt')}
+        confirmed = asyncio.run(watch(backends, once=True))
+        # Replaying the same transfers is a no-op
+        asyncio.run(watch(backends, once=True))
+
+        self.assertEqual(confirmed, {'bitcoin': 1, 'ethereum': 1, 'usdt': 1})
+        for deposit in (paid, unpaid, open_amount, near_amount):
+            deposit.refresh_from_db()
+        self.assertEqual([paid.status, unpaid.status, open_amount.status, near_amount.status],
+                         ['confirmed', 'pending', 'confirmed', 'confirmed'])
+        self.assertEqual(open_amount.amount, Decimal('1500.00'))
+        self.assertEqual(paid.chain_transfer.txid, 'mock-btc-0001')
+        self.assertEqual(ChainTransfer.objects.count(), 4)
+        self.assertEqual(user.wallet.get_balance('bitcoin'), Decimal('650.00'))
+
+    def test_matching_failure_is_reported_and_other_coins_continue(self):
+        import asyncio
+        from pathlib import Path
+        from unittest import mock
+        from . import chain_services
+        from .chain_services import MockNodeBackend, watch
+        user = User.objects.create_user('chain-fail@example.com', 'chain-fail@example.com', 'password')
+        self.assign(
+            user, 'bc1qgvry4pf374d7wgddslw7gymrfm2geswsde26ct', 'bitcoin', '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f', 'ethereum'
+        )
+        paid = DepositTransaction.objects.create(
+            user=user, coin_type='bitcoin', amount=Decimal('650'), wallet_address='bc1qgvry4pf374d7wgddslw7gymrfm2geswsde26ct'
+        )
+        DepositTransaction.objects.create(user=user, coin_type='ethereum', wallet_address='0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f')
+        match_transfers = chain_services.match_transfers
+
+        def failing_match(coin, *args, **kwargs):
+            if coin == 'ethereum':
+                raise RuntimeError('matching exploded')
+            return match_transfers(coin, *args, **kwargs)
+
+        node = MockNodeBackend(Path(__file__).parent / 'mock_chain' / 'transfers.json')
+        cycles = []
+        with mock.patch.object(chain_services, 'match_transfers', failing_match):
+            confirmed = asyncio.run(watch(
+                {'ethereum': node, 'bitcoin': node}, once=True, on_cycle=lambda *cycle: cycles.append(cycle)
+            ))
+
+        self.assertEqual(confirmed, {'ethereum': 0, 'bitcoin': 1})
+        self.assertEqual(list(cycles[0][1]), ['ethereum'])
+        self.assertIn('matching exploded', str(cycles[0][1]['ethereum']))
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, 'confirmed')
+
+
+class ChainMatchingTests(TestCase):
+    """
+    Transfers are only matched when exactly one deposit of the address's owner fits them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='match@example.com', email='match@example.com')
+        self.other = User.objects.create(username='other@example.com', email='other@example.com')
+        DepositAddress.objects.create(
+            coin='bitcoin', address='bc1qowned', user=self.user, state='assigned', assigned_at=timezone.now()
+        )
+
+    def deposit(self, user, address, amount=None):
+        return DepositTransaction.objects.create(
+            user=user, coin_type='bitcoin', wallet_address=address, amount=Decimal(amount) if amount else None
+        )
+
+    def transfer(self, address, usd_amount, txid='tx-1'):
+        from .chain_services import Transfer, record_transfers
+        record_transfers([Transfer('bitcoin', txid, address, Decimal('0.01'), timezone.now(), Decimal(usd_amount))])
+
+    def statuses(self, *deposits):
+        return [DepositTransaction.objects.get(pk=deposit.pk).status for deposit in deposits]
+
+    def test_ambiguous_amount_match_is_left_for_review(self):
+        from .chain_services import match_transfers
+        first, second = self.deposit(self.user, 'bc1qowned', '100'), self.deposit(self.user, 'bc1qowned', '101')
+        self.transfer('bc1qowned', '100.50')
+
+        self.assertEqual(match_transfers('bitcoin'), 0)
+        self.assertEqual(self.statuses(first, second), ['pending', 'pending'])
+
+        # Once one of them is dealt with by hand the transfer matches the other
+        first.status = 'rejected'
+        first.save()
+        self.assertEqual(match_transfers('bitcoin'), 1)
+        self.assertEqual(self.statuses(second), ['confirmed'])
+
+    def test_transfer_to_shared_address_is_not_confirmed(self):
+        from .chain_services import match_transfers
+        shared = self.deposit(self.other, 'bc1qshared', '100')
+        self.transfer('bc1qshared', '100')
+
+        self.assertEqual(match_transfers('bitcoin'), 0)
+        self.assertEqual(self.statuses(shared), ['pending'])
+
+    def test_deposit_of_another_user_at_an_assigned_address_is_not_confirmed(self):
+        from .chain_services import match_transfers
+        foreign = self.deposit(self.other, 'bc1qowned', '100')
+        self.transfer('bc1qowned', '100')
+
+        self.assertEqual(match_transfers('bitcoin'), 0)
+        self.assertEqual(self.statuses(foreign), ['pending'])
+        self.assertEqual(self.other.wallet.get_balance('bitcoin'), Decimal('0'))
+
+
+class PendingDepositSummaryTests(TestCase):
+    """
+    The per-coin pending totals follow every deposit change, and the review queues read them.
+    """
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.admin = User.objects.create(username='queue-admin@example.com', email='queue-admin@example.com', is_staff=True)
+        self.user = User.objects.create(username='queued@example.com', email='queued@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def deposit(self, coin='bitcoin', amount='10', address='bc1qqueue'):
+        return DepositTransaction.objects.create(
+            user=self.user, coin_type=coin, amount=Decimal(amount) if amount else None, wallet_address=address
+        )
+
+    def summary(self, coin):
+        from .models import PendingDepositSummary
+        return PendingDepositSummary.objects.filter(coin=coin).values_list(
+            'pending_count', 'pending_amount', 'oldest_pending_at'
+        ).first()
+
+    def assert_matches_rebuild(self):
+        from .deposit_services import rebuild_pending_summaries
+        from .models import PendingDepositSummary
+        maintained = {coin: self.summary(coin) or (0, Decimal('0'), None) for coin, _ in DepositTransaction.COIN_CHOICES}
+        rebuild_pending_summaries()
+        rebuilt = {summary.coin: (summary.pending_count, summary.pending_amount, summary.oldest_pending_at) for summary in PendingDepositSummary.objects.all()}
+        self.assertEqual(maintained, rebuilt)
+
+    def test_summary_follows_status_amount_and_delete(self):
+        first, second = self.deposit(amount='10'), self.deposit(amount='5')
+        self.assertEqual(self.summary('bitcoin'), (2, Decimal('15'), first.created_at))
+
+        first.amount = Decimal('12')
+        first.save()
+        self.assertEqual(self.summary('bitcoin'), (2, Decimal('17'), first.created_at))
+
+        first.status = 'rejected'
+        first.save()
+        self.assertEqual(self.summary('bitcoin'), (1, Decimal('5'), second.created_at))
+        self.assert_matches_rebuild()
+
+        # Back to pending counts it again
+        first.status = 'pending'
+        first.save()
+        self.assertEqual(self.summary('bitcoin'), (2, Decimal('17'), first.created_at))
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.summary('bitcoin'), (0, Decimal('0'), None))
+        self.assert_matches_rebuild()
+
+    def test_chain_watcher_counts_the_amount_it_fills_in(self):
+        from .chain_services import Transfer, match_transfers, record_transfers
+        DepositAddress.objects.create(
+            coin='bitcoin', address='bc1qqueue', user=self.user, state='assigned', assigned_at=timezone.now()
+        )
+        unpriced = self.deposit(amount=None)
+        self.deposit(coin='ethereum', amount='40', address='0xqueue')
+        self.assertEqual(self.summary('bitcoin')[:2], (1, Decimal('0')))
+
+        record_transfers([Transfer('bitcoin', 'tx-queue', 'bc1qqueue', Decimal('0.01'), timezone.now(), Decimal('250'))])
+        self.assertEqual(match_transfers('bitcoin'), 1)
+
+        self.assertEqual(DepositTransaction.objects.get(pk=unpriced.pk).amount, Decimal('250'))
+        self.assertEqual(self.summary('bitcoin'), (0, Decimal('0'), None))
+        self.assert_matches_rebuild()
+
+    def test_review_queue_endpoint(self):
+        oldest, newest = self.deposit(amount='10'), self.deposit(amount='20')
+        self.deposit(coin='ethereum', amount='30', address='0xqueue')
+
+        body = self.client.get('/api/admin/deposits/review-queue/').json()
+        self.assertEqual(body['pending_count'], 3)
+        self.assertEqual([group['coin'] for group in body['coins']], ['bitcoin', 'ethereum'])
+        bitcoin = body['coins'][0]
+        self.assertEqual((bitcoin['pending_count'], Decimal(str(bitcoin['pending_amount']))), (2, Decimal('30')))
+        self.assertEqual([deposit['id'] for deposit in bitcoin['deposits']], [oldest.id, newest.id])
+
+        limited = self.client.get('/api/admin/deposits/review-queue/?coin=bitcoin&limit=1').json()
+        self.assertEqual(len(limited['coins']), 1)
+        self.assertEqual(limited['coins'][0]['pending_count'], 2)
+        self.assertEqual([deposit['id'] for deposit in limited['coins'][0]['deposits']], [oldest.id])
+
+        self.assertEqual(self.client.get('/api/admin/deposits/review-queue/?coin=dogecoin').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/deposits/review-queue/?limit=all').status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/admin/deposits/review-queue/').status_code, 403)
+
+    def test_admin_review_queue_page(self):
+        from django.urls import reverse
+        deposit = self.deposit(amount='10')
+        self.client.force_login(self.admin)
+        url = reverse('admin:app_deposittransaction_review_queue')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([group['coin'] for group in response.context['queue']], ['bitcoin'])
+        self.assertContains(response, f'#{deposit.id}')
+        self.assertContains(response, '1 pending, $10.00 USD')
+
+        deposit.status = 'rejected'
+        deposit.save()
+        self.assertContains(self.client.get(url), 'No pending deposits.')
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class IdempotencyKeyTests(TransactionTestCase):
+    """
+    Idempotency-Key replays and concurrent duplicates on create_support_ticket.
+    """
+
+    body = {'department': 'general', 'subject': 'Retry', 'message': 'Network dropped'}
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.user = User.objects.create_user('retry@example.com', 'retry@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeat_replays_stored_response(self):
+        first = self.client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-1')
+        repeat = self.client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+        self.assertEqual(SupportTicket.objects.count(), 1)
+
+    def test_repeat_on_another_worker_replays_from_the_database(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        first = self.client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-4')
+        # A second worker shares nothing in memory with the first
+        cache.clear()
+        other_worker = APIClient()
+        other_worker.force_authenticate(User.objects.get(pk=self.user.pk))
+        repeat = other_worker.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-4')
+
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(SupportTicket.objects.count(), 1)
+
+    def test_expired_key_runs_the_view_again_and_is_purged(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import IdempotencyKey
+        self.client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-5')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        again = self.client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-5')
+        self.assertEqual(again.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', again)
+        self.assertEqual(SupportTicket.objects.count(), 2)
+
+    def test_key_reused_for_different_body_is_rejected(self):
+        self.client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-2')
+        other = self.client.post('/api/support/create/', {**self.body, 'subject': 'Other'}, format='json', HTTP_IDEMPOTENCY_KEY='ticket-2')
+        self.assertEqual(other.status_code, 422)
+
+    def test_concurrent_duplicates_create_one_ticket(self):
+        from rest_framework.test import APIClient
+        responses = []
+        barrier = threading.Barrier(6)
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                # The in-memory test database raises table-lock errors under contention
+                for attempt in range(50):
+                    try:
+                        responses.append(client.post('/api/support/create/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='ticket-3'))
+                        break
+                    except OperationalError:
+                        time.sleep(0.001 * (attempt + 1))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), 6)
+        self.assertEqual(SupportTicket.objects.count(), 1)
+        self.assertEqual({response.status_code for response in responses}, {201})
+        self.assertEqual(len({response.json()['ticket_id'] for response in responses}), 1)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Runs the app's migrations from migrate_from to migrate_to around each test's data.
+    Build data with self.apps (the historical models) in setUpBeforeMigration.
+    """
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        from django.db.migrations.executor import MigrationExecutor
+        self.executor = MigrationExecutor(connection)
+        self.leaf = self.executor.loader.graph.leaf_nodes('app')
+        self.migrate([('app', self.migrate_from)])
+        self.apps = self.executor.loader.project_state([('app', self.migrate_from)]).apps
+        self.setUpBeforeMigration(self.apps)
+        self.migrate([('app', self.migrate_to)])
+        self.apps = self.executor.loader.project_state([('app', self.migrate_to)]).apps
+
+    def tearDown(self):
+        self.migrate(self.leaf)
+
+    def migrate(self, targets):
+        from django.db.migrations.executor import MigrationExecutor
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(targets)
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+
+class NotificationDepositMigrationTests(MigrationTestCase):
+    """
+    0022 links old deposit notifications to their deposit by title, once per (deposit, type).
+    """
+
+    migrate_from = '0021_deposit_outbox'
+    migrate_to = '0022_notification_deposit'
+
+    def setUpBeforeMigration(self, apps):
+        from datetime import timedelta
+        HistoricalUser = apps.get_model('auth', 'User')
+        Deposit = apps.get_model('app', 'DepositTransaction')
+        OldNotification = apps.get_model('app', 'Notification')
+        owner = HistoricalUser.objects.create(username='legacy@example.com', email='legacy@example.com')
+        stranger = HistoricalUser.objects.create(username='stranger@example.com', email='stranger@example.com')
+        deposit = Deposit.objects.create(user=owner, coin_type='bitcoin', amount=Decimal('10'), wallet_address='bc1q')
+        other = Deposit.objects.create(user=owner, coin_type='ethereum', amount=Decimal('20'), wallet_address='0x')
+        start = timezone.now()
+
+        def notify(user, notification_type, title, minutes):
+            notification = OldNotification.objects.create(user=user, type=notification_type, title=title, message='m')
+            OldNotification.objects.filter(pk=notification.pk).update(created_at=start + timedelta(minutes=minutes))
+            return notification.pk
+
+        self.ids = {
+            'newer_duplicate': notify(owner, 'deposit_confirmed', f'Deposit #{deposit.id} Confirmed', 5),
+            'oldest': notify(owner, 'deposit_confirmed', f'Deposit #{deposit.id} Confirmed', 1),
+            'other_type': notify(owner, 'general', f'Re: Deposit #{deposit.id} received', 2),
+            'other_deposit': notify(owner, 'deposit_confirmed', f'Deposit #{other.id} Confirmed', 3),
+            'wrong_user': notify(stranger, 'deposit_confirmed', f'Deposit #{other.id} Confirmed', 0),
+            'missing_deposit': notify(owner, 'deposit_confirmed', 'Deposit #999999 Confirmed', 4),
+            'no_number': notify(owner, 'deposit_confirmed', 'Deposit confirmed', 6),
+        }
+        self.deposits = {'deposit': deposit.id, 'other': other.id}
+
+    def test_titles_are_linked_to_the_owners_deposit_once(self):
+        links = dict(self.apps.get_model('app', 'Notification').objects.values_list('id', 'deposit_id'))
+        self.assertEqual({name: links[pk] for name, pk in self.ids.items()}, {
+            'oldest': self.deposits['deposit'],
+            'newer_duplicate': None,
+            'other_type': self.deposits['deposit'],
+            'other_deposit': self.deposits['other'],
+            'wrong_user': None,
+            'missing_deposit': None,
+            'no_number': None,
+        })
+
+
+class WalletBalanceMigrationTests(MigrationTestCase):
+    """
+    0019 moves the per-coin Wallet columns into WalletBalance rows, and back when reversed.
+    """
+
+    migrate_from = '0018_hot_lookup_indexes'
+    migrate_to = '0019_wallet_balance'
+
+    def setUpBeforeMigration(self, apps):
+        HistoricalUser = apps.get_model('auth', 'User')
+        OldWallet = apps.get_model('app', 'Wallet')
+        self.funded = HistoricalUser.objects.create(username='funded@example.com', email='funded@example.com')
+        self.empty = HistoricalUser.objects.create(username='empty@example.com', email='empty@example.com')
+        OldWallet.objects.create(user=self.funded, bitcoin_balance=Decimal('12.50'), usdt_balance=Decimal('3.00'))
+        OldWallet.objects.create(user=self.empty)
+
+    def test_columns_become_rows_and_back(self):
+        Balance = self.apps.get_model('app', 'WalletBalance')
+        self.assertEqual(
+            set(Balance.objects.values_list('user_id', 'coin', 'amount')),
+            {(self.funded.id, 'bitcoin', Decimal('12.50')), (self.funded.id, 'usdt', Decimal('3.00'))},
+        )
+        Balance.objects.filter(user_id=self.funded.id, coin='usdt').update(amount=Decimal('4.25'))
+        Balance.objects.create(user_id=self.empty.id, coin='ripple', amount=Decimal('1.10'))
+
+        self.migrate([('app', self.migrate_from)])
+        OldWallet = self.executor.loader.project_state([('app', self.migrate_from)]).apps.get_model('app', 'Wallet')
+        columns = ['bitcoin_balance', 'usdt_balance', 'ripple_balance', 'ethereum_balance']
+        self.assertEqual(
+            {wallet['user_id']: tuple(wallet[column] for column in columns) for wallet in OldWallet.objects.values('user_id', *columns)},
+            {
+                self.funded.id: (Decimal('12.50'), Decimal('4.25'), Decimal('0.00'), Decimal('0.00')),
+                self.empty.id: (Decimal('0.00'), Decimal('0.00'), Decimal('1.10'), Decimal('0.00')),
+            },
+        )
+
+
+class DepositAddressTests(TransactionTestCase):
+    """
+    Pool assignment is one address per user and coin, and lookups after it only read the registry version.
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .address_services import load_address_pool
+        cache.clear()
+        self.users = [User.objects.create(username=f'pool{i}@example.com', email=f'pool{i}@example.com') for i in range(8)]
+        load_address_pool('bitcoin', [f'bc1qpool{i:04d}' for i in range(20)])
+
+    def test_lookup_after_assignment_reads_only_the_version(self):
+        from .address_services import get_deposit_address
+        user = self.users[0]
+        address = get_deposit_address(user.id, 'bitcoin')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_deposit_address(user.id, 'bitcoin'), address)
+        self.assertTrue(address.startswith('bc1qpool'))
+        self.assertIsNone(get_deposit_address(user.id, 'dogecoin'))
+
+    def test_retired_address_is_replaced(self):
+        from .address_services import get_deposit_address
+        user = self.users[0]
+        first = get_deposit_address(user.id, 'bitcoin')
+        record = DepositAddress.objects.get(address=first)
+        record.state = 'retired'
+        record.save()
+
+        second = get_deposit_address(user.id, 'bitcoin')
+        self.assertNotEqual(first, second)
+
+    def test_deleting_a_user_retires_their_addresses(self):
+        from .address_services import get_deposit_address
+        user, other = self.users[0], self.users[1]
+        address = get_deposit_address(user.id, 'bitcoin')
+
+        user.delete()
+        record = DepositAddress.objects.get(address=address)
+        self.assertIsNone(record.user_id)
+        self.assertEqual(record.state, 'retired')
+        # Never handed to anyone else
+        self.assertNotEqual(get_deposit_address(other.id, 'bitcoin'), address)
+
+    def test_empty_pool_falls_back_to_shared_address(self):
+        from django.conf import settings
+        from .address_services import get_deposit_address
+        self.assertEqual(get_deposit_address(self.users[0].id, 'ripple'), settings.DEPOSIT_ADDRESSES['ripple'])
+
+    def test_concurrent_requests_get_distinct_addresses(self):
+        from .address_services import get_deposit_address
+        results = []
+        barrier = threading.Barrier(len(self.users) * 2)
+
+        def request(user):
+            barrier.wait()
+            try:
+                # SQLite serializes writers; retry when the table is briefly locked
+                for attempt in range(100):
+                    try:
+                        results.append((user.id, get_deposit_address(user.id, 'bitcoin')))
+                        break
+                    except OperationalError:
+                        time.sleep(0.001 * (attempt + 1))
+            finally:
+                connections.close_all()
+
+        # Two concurrent requests per user
+        threads = [threading.Thread(target=request, args=(user,)) for user in self.users for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        by_user = {}
+        for user_id, address in results:
+            by_user.setdefault(user_id, set()).add(address)
+        self.assertEqual(len(results), len(threads))
+        self.assertTrue(all(len(addresses) == 1 for addresses in by_user.values()))
+        self.assertEqual(len({addresses.pop() for addresses in by_user.values()}), len(self.users))
+        self.assertEqual(DepositAddress.objects.filter(state='assigned').count(), len(self.users))
+
+
+class DepositAddressRegistryTests(TestCase):
+    """
+    A registry change made by another process is seen without this process's cache or on_commit hooks.
+    """
+
+    def test_change_from_another_process_is_seen(self):
+        from .address_services import get_deposit_address, invalidate_address_registry, load_address_pool
+        user = User.objects.create(username='registry@example.com', email='registry@example.com')
+        load_address_pool('bitcoin', ['bc1qregistry1', 'bc1qregistry2'])
+        first = get_deposit_address(user.id, 'bitcoin')
+
+        # As the admin process would: a queryset retire and its version bump. In a TestCase no
+        # on_commit callback runs, so only what was written to the database can be seen
+        DepositAddress.objects.filter(address=first).update(state='retired')
+        invalidate_address_registry()
+
+        second = get_deposit_address(user.id, 'bitcoin')
+        self.assertNotEqual(second, first)
+        self.assertEqual(DepositAddress.objects.get(address=second).user_id, user.id)
+
+
+class UnreadNotificationCountTests(TestCase):
+    """
+    The unread counter follows creates, reads, deletes and bulk-created deposit notifications.
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.user = User.objects.create_user('badge@example.com', 'badge@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, **kwargs):
+        return Notification.objects.create(user=self.user, type='general', title='t', message='m', **kwargs)
+
+    def unread(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pass
+        return self.client.get('/api/notifications/unread-count/').json()['unread_count']
+
+    def test_second_notification_for_a_deposit_and_type_is_dropped(self):
+        from .deposit_services import confirmation_notification
+        from .notification_services import create_notifications
+        deposit = DepositTransaction.objects.create(user=self.user, coin_type='bitcoin', amount=Decimal('10'), wallet_address='bc1q')
+        create_notifications([confirmation_notification(deposit, timezone.now())])
+        create_notifications([
+            confirmation_notification(deposit, timezone.now()),
+            Notification(user=self.user, deposit=deposit, type='general', title='Deposit note', message='m'),
+        ])
+
+        self.assertEqual(
+            sorted(Notification.objects.filter(deposit=deposit).values_list('type', flat=True)),
+            ['deposit_confirmed', 'general'],
+        )
+        self.assertEqual(self.unread(), 2)
+
+    def test_counter_follows_notification_changes(self):
+        first, second = self.notify(), self.notify()
+        self.notify(is_read=True)
+        self.assertEqual(self.unread(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.mark_as_read()
+            first.mark_as_read()
+        self.assertEqual(self.unread(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.unread(), 0)
+
+    def test_count_is_one_row_lookup_and_never_stale(self):
+        self.notify()
+        self.assertEqual(self.unread(), 1)
+        # Written as another process would: no on_commit callback runs here
+        self.notify()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/notifications/unread-count/').json()['unread_count'], 2)
+
+    def test_confirmed_deposits_count_once(self):
+        from django.utils import timezone
+        from .deposit_services import confirm_deposits, confirmation_notification
+        from .notification_services import create_notifications
+        deposits = [
+            DepositTransaction.objects.create(user=self.user, coin_type='bitcoin', amount=Decimal('10'), wallet_address='bc1q')
+            for _ in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm_deposits([deposit.id for deposit in deposits])
+            # A repeated notification for the same deposit is skipped and not counted
+            create_notifications([confirmation_notification(deposits[0], timezone.now())])
+        self.assertEqual(self.unread(), 3)
+
+        from .notification_services import rebuild_notification_counters
+        rebuild_notification_counters()
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread_count, 3)
+
+    def test_mark_all_read_is_one_update_and_reports_the_count(self):
+        for _ in range(5):
+            self.notify()
+        self.notify(is_read=True)
+        self.assertEqual(self.unread(), 5)
+
+        # Advancing the change sequence (3), one UPDATE of the notifications and one of the
+        # unread count, inside a savepoint; not one query per row
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(7):
+            response = self.client.post('/api/notifications/mark-all-read/')
+        self.assertEqual(response.json()['marked_count'], 5)
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual(Notification.objects.filter(user=self.user, read_at__isnull=False).count(), 5)
+
+    def test_bulk_mark_read_only_touches_own_unread_notifications(self):
+        mine = [self.notify() for _ in range(4)]
+        other_user = User.objects.create(username='other@example.com', email='other@example.com')
+        theirs = Notification.objects.create(user=other_user, type='general', title='t', message='m')
+
+        response = self.client.post(
+            '/api/notifications/mark-read/bulk/',
+            {'notification_ids': [mine[0].id, mine[1].id, mine[1].id, theirs.id]},
+            format='json',
+        )
+        self.assertEqual(response.json()['marked_count'], 2)
+        self.assertEqual(self.unread(), 2)
+        theirs.refresh_from_db()
+        self.assertFalse(theirs.is_read)
+
+        response = self.client.post('/api/notifications/mark-read/bulk/', {'notification_ids': ['x']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class NotificationDeltaSyncTests(TestCase):
+    """
+    ?since= cursors return only changed notifications, and unchanged polls get 304 from the ETag.
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+        cache.clear()
+        self.user = User.objects.create_user('sync@example.com', 'sync@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, title='t'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(user=self.user, type='general', title=title, message='m')
+
+    def poll(self, since=None, etag=None, limit=None):
+        params = {key: value for key, value in {'since': since, 'limit': limit}.items() if value is not None}
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/notifications/', params, **headers)
+
+    def titles(self, response):
+        return [notification['title'] for notification in response.json()['notifications']]
+
+    def test_since_returns_only_new_and_read_notifications(self):
+        first = self.notify('first')
+        self.notify('second')
+        full = self.poll()
+        self.assertEqual(sorted(self.titles(full)), ['first', 'second'])
+
+        third = self.notify('third')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.mark_as_read()
+        delta = self.poll(since=full.json()['next_cursor'])
+        self.assertEqual(self.titles(delta), ['third', 'first'])
+        self.assertTrue(delta.json()['notifications'][1]['is_read'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/notifications/mark-read/bulk/', {'notification_ids': [third.id]}, format='json')
+        delta = self.poll(since=delta.json()['next_cursor'])
+        self.assertEqual(self.titles(delta), ['third'])
+
+        self.assertEqual(self.titles(self.poll(since=delta.json()['next_cursor'])), [])
+
+    def test_unchanged_poll_is_not_modified_without_queries(self):
+        self.notify()
+        full = self.poll()
+        etag, cursor = full['ETag'], full.json()['next_cursor']
+        self.assertTrue(etag.startswith('W/'))
+
+        # One counter row lookup per poll; the notifications table is not read
+        with self.assertNumQueries(2):
+            self.assertEqual(self.poll(etag=etag).status_code, 304)
+            self.assertEqual(self.poll(since=cursor, etag=etag).status_code, 304)
+
+        self.notify('new')
+        changed = self.poll(since=cursor, etag=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(self.titles(changed), ['new'])
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_etag_follows_changes_made_by_other_processes(self):
+        self.notify()
+        full = self.poll()
+        etag, cursor = full['ETag'], full.json()['next_cursor']
+
+        # Written as another process would: no on_commit callback runs here
+        Notification.objects.create(user=self.user, type='general', title='elsewhere', message='m')
+        self.assertEqual(self.poll(etag=etag).status_code, 200)
+        delta = self.poll(since=cursor, etag=etag)
+        self.assertEqual(delta.status_code, 200)
+        self.assertEqual(self.titles(delta), ['elsewhere'])
+
+    def test_delta_pages_through_one_large_change(self):
+        for i in range(5):
+            self.notify(str(i))
+        cursor = self.poll().json()['next_cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/notifications/mark-all-read/')
+
+        seen = []
+        etag = None
+        while True:
+            page = self.poll(since=cursor, etag=etag, limit=2)
+            # A mid-batch cursor is never answered from the ETag
+            self.assertEqual(page.status_code, 200)
+            seen += self.titles(page)
+            cursor, etag = page.json()['next_cursor'], page['ETag']
+            if not page.json()['has_more']:
+                break
+        self.assertEqual(sorted(seen), ['0', '1', '2', '3', '4'])
+        self.assertEqual(self.poll(since='not a cursor').status_code, 400)
+
+
+class BulkPostingTests(TestCase):
+    """
+    POST /api/transactions/bulk/ posts a batch of balanced transactions atomically.
+    """
+
+    URL = '/api/transactions/bulk/'
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.user = User.objects.create(username='bulk@example.com', email='bulk@example.com')
+        self.cash = Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        self.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def posting(self, reference, debit='10.00', credit='10.00'):
+        return {
+            'reference': reference,
+            'description': f'Posting {reference}',
+            'date': '2024-03-01',
+            'entries': [
+                {'account': self.cash.id, 'entry_type': 'DEBIT', 'amount': debit},
+                {'account': self.equity.id, 'entry_type': 'CREDIT', 'amount': credit},
+            ],
+        }
+
+    def post(self, items):
+        return self.client.post(self.URL, {'transactions': items}, format='json')
+
+    def test_balanced_batch_is_created(self):
+        response = self.post([self.posting('B-1'), self.posting('B-2', '2.50', '2.50')])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created', 'created'])
+        self.assertEqual(JournalEntry.objects.count(), 4)
+        self.assertEqual(self.cash.balance.debit_total, Decimal('12.50'))
+
+    def test_unbalanced_item_rejects_the_whole_batch(self):
+        response = self.post([self.posting('B-1'), self.posting('B-2', '10.00', '9.99'), self.posting('B-3')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_errors_are_reported_per_item(self):
+        duplicate = self.posting('B-1')
+        malformed = {**self.posting('B-3'), 'entries': 5}
+        described_by_object = {**self.posting('B-5'), 'description': {'text': 'sale'}}
+        response = self.post([self.posting('B-1'), duplicate, malformed, self.posting('B-4', '1.00', '2.00'), described_by_object])
+
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['valid', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('reference', results[1]['errors'])
+        self.assertEqual(results[2]['errors']['entries'], ['At least two entries are required'])
+        self.assertIn('must equal', results[3]['errors']['entries'][0])
+        self.assertEqual(results[4]['errors'], {'description': ['Description is required']})
+
+    def test_entry_count_is_limited(self):
+        from unittest import mock
+        with mock.patch('app.ledger_services.MAX_BULK_ENTRIES', 3):
+            response = self.post([self.posting('B-1'), self.posting('B-2')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('more than 3 entries', response.json()['error'])
+        self.assertFalse(Transaction.objects.exists())
+
+
+class LedgerReportTests(TestCase):
+    """
+    Dated trial balance and general ledger totals.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='reports@example.com', email='reports@example.com')
+        self.assets = Account.objects.create(name='Assets', code='1000', account_type='ASSET')
+        self.cash = Account.objects.create(name='Cash', code='1100', account_type='ASSET', parent=self.assets)
+        self.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+
+    def post(self, reference, posting_date, amount):
+        txn = Transaction.objects.create(reference=reference, description=reference, date=posting_date, user=self.user)
+        JournalEntry.objects.create(transaction=txn, account=self.cash, entry_type='DEBIT', amount=Decimal(amount))
+        JournalEntry.objects.create(transaction=txn, account=self.equity, entry_type='CREDIT', amount=Decimal(amount))
+
+    def test_dated_trial_balance_only_sums_the_period(self):
+        from .ledger_services import trial_balance
+        self.post('T-1', date(2023, 12, 31), '100')
+        self.post('T-2', date(2024, 2, 1), '20')
+        self.post('T-3', date(2024, 7, 1), '5')
+
+        report = trial_balance(date(2024, 1, 1), date(2024, 6, 30))
+
+        rows = {row['code']: row for row in report['accounts']}
+        self.assertEqual(rows['1100']['debit'], Decimal('20'))
+        self.assertEqual(rows['1000']['rollup_debit'], Decimal('20'))
+        self.assertEqual(rows['3000']['rollup_credit'], Decimal('20'))
+        self.assertTrue(report['is_balanced'])
+
+    def test_general_ledger_opens_from_the_period_close_snapshot(self):
+        from .ledger_services import close_period, general_ledger
+        self.post('T-1', date(2023, 12, 31), '100')
+        close_period(date(2023, 12, 31))
+        self.post('T-2', date(2024, 2, 1), '20')
+        self.post('T-3', date(2024, 4, 1), '5')
+        # Rows inside the closed period are not read again (set-based update, no signals)
+        JournalEntry.objects.filter(transaction__reference='T-1').update(amount=Decimal('1'))
+
+        report = general_ledger(self.assets, date(2024, 3, 1), date(2024, 12, 31))
+
+        rows = {row['code']: row for row in report['accounts']}
+        self.assertEqual(rows['1000']['opening_balance'], Decimal('120'))
+        self.assertEqual(rows['1100']['opening_balance'], Decimal('120'))
+        self.assertEqual(rows['1000']['debit'], Decimal('5'))
+        self.assertEqual(rows['1000']['closing_balance'], Decimal('125'))
+
+
+class TransactionListTests(TestCase):
+    """
+    /api/transactions/ costs the same number of queries for any page size, and cursor pages are stable.
+    """
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.user = User.objects.create(username='lister@example.com', email='lister@example.com')
+        self.cash = Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        self.revenue = Account.objects.create(name='Revenue', code='4000', account_type='REVENUE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, count):
+        created = []
+        for _ in range(count):
+            txn = Transaction.objects.create(
+                reference=f'TL-{Transaction.objects.count()}', description='sale', date=date(2024, 3, 1), user=self.user
+            )
+            JournalEntry.objects.create(transaction=txn, account=self.cash, entry_type='DEBIT', amount=Decimal('5'))
+            JournalEntry.objects.create(transaction=txn, account=self.revenue, entry_type='CREDIT', amount=Decimal('5'))
+            created.append(txn)
+        return created
+
+    def query_count(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.post(30)
+        # Page number pagination: count, page, entries with their accounts
+        for path in ('/api/transactions/', '/api/transactions/?page=2'):
+            with self.subTest(path=path):
+                count, body = self.query_count(path)
+                self.assertEqual(count, 3)
+                self.assertTrue(all(len(txn['entries']) == 2 for txn in body['results']))
+        # Cursor pagination: page, entries with their accounts
+        for page_size in (1, 5, 30):
+            with self.subTest(page_size=page_size):
+                count, body = self.query_count(f'/api/transactions/?pagination=cursor&page_size={page_size}')
+                self.assertEqual(count, 2)
+                self.assertEqual(len(body['results']), page_size)
+                self.assertEqual(body['results'][0]['entries'][0]['account_code'], '1000')
+
+    def test_cursor_pages_cover_every_transaction_once(self):
+        expected = [txn.id for txn in reversed(self.post(7))]
+        seen = []
+        body = self.client.get('/api/transactions/?pagination=cursor&page_size=3').json()
+        self.assertNotIn('count', body)
+        while True:
+            seen.extend(txn['id'] for txn in body['results'])
+            if not body['next']:
+                break
+            if len(seen) == 3:
+                # Postings made while paging land before the cursor and do not shift later pages
+                self.post(2)
+            body = self.client.get(body['next']).json()
+        self.assertEqual(seen, expected)
+
+        self.assertEqual(self.client.get('/api/transactions/?cursor=not-a-cursor').status_code, 404)
+
+
+class JournalExportTests(TestCase):
+    """
+    /api/exports/journal/ streams CSV or NDJSON, filtered by date and optionally gzipped.
+    """
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.user = User.objects.create(username='export@example.com', email='export@example.com')
+        cash = Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        revenue = Account.objects.create(name='Revenue, other', code='4000', account_type='REVENUE')
+        for reference, posting_date in [('EX-1', date(2024, 1, 10)), ('EX-2', date(2024, 2, 10)), ('EX-3', date(2024, 3, 10))]:
+            txn = Transaction.objects.create(reference=reference, description=f'{reference} sale', date=posting_date, user=self.user)
+            JournalEntry.objects.create(transaction=txn, account=cash, entry_type='DEBIT', amount=Decimal('12.50'))
+            JournalEntry.objects.create(transaction=txn, account=revenue, entry_type='CREDIT', amount=Decimal('12.50'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/exports/journal/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        import csv
+        import io
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="journal.csv"')
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], ['entry_id', 'transaction_reference', 'date', 'account_code', 'account_name', 'entry_type', 'amount', 'description'])
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[2][1:], ['EX-1', '2024-01-10', '4000', 'Revenue, other', 'CREDIT', '12.50', 'EX-1 sale'])
+
+    def test_ndjson_export_filtered_by_date(self):
+        response, body = self.export('?format=ndjson&from=2024-02-01&to=2024-02-29')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row['transaction_reference'] for row in rows], ['EX-2', 'EX-2'])
+        self.assertEqual((rows[0]['date'], rows[0]['amount'], rows[0]['entry_type']), ('2024-02-10', '12.50', 'DEBIT'))
+
+        _, body = self.export('?format=ndjson&from=2024-03-01')
+        self.assertEqual(len(body.decode().splitlines()), 2)
+
+    def test_gzip_export(self):
+        import gzip
+        response, body = self.export('?format=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="journal.csv.gz"')
+        self.assertEqual(gzip.decompress(body), self.export('?format=csv')[1])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/exports/journal/?format=json').status_code, 400)
+        # No renderer for it, so content negotiation refuses it before the view runs
+        self.assertEqual(self.client.get('/api/exports/journal/?format=xml').status_code, 404)
+        response = self.client.get('/api/exports/journal/?from=10-01-2024')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('YYYY-MM-DD', response.json()['error'])
+
+
+class AccountStatementCursorTests(TestCase):
+    """
+    Statement cursors carry the running balance, so they are signed and bound to the account.
+    """
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        user = User.objects.create(username='statement@example.com', email='statement@example.com')
+        self.cash = Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        self.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        for day in (1, 2, 3):
+            txn = Transaction.objects.create(reference=f'S-{day}', description='s', date=date(2024, 1, day), user=user)
+            JournalEntry.objects.create(transaction=txn, account=self.cash, entry_type='DEBIT', amount=Decimal('10'))
+            JournalEntry.objects.create(transaction=txn, account=self.equity, entry_type='CREDIT', amount=Decimal('10'))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def statement(self, account, cursor=None):
+        params = {'page_size': 2, **({'cursor': cursor} if cursor else {})}
+        return self.client.get(f'/api/accounts/{account.id}/statement/', params)
+
+    def next_cursor(self, response):
+        from urllib.parse import parse_qs, urlparse
+        return parse_qs(urlparse(response.json()['next']).query)['cursor'][0]
+
+    def test_pages_carry_the_running_balance(self):
+        cursor = self.next_cursor(self.statement(self.cash))
+        page = self.statement(self.cash, cursor).json()
+        self.assertEqual([Decimal(str(line['running_balance'])) for line in page['entries']], [Decimal('30')])
+
+    def test_forged_cursor_is_rejected(self):
+        from .pagination import decode_cursor, encode_cursor
+        cursor = self.next_cursor(self.statement(self.cash))
+        position = decode_cursor(cursor, f'statement:{self.cash.id}')
+
+        forged = {**position, 'balance': '1000000.00'}
+        unsigned = encode_cursor(forged, f'statement:{self.cash.id}').split(':')[0]
+        self.assertEqual(self.statement(self.cash, unsigned).status_code, 400)
+        self.assertEqual(self.statement(self.cash, cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')).status_code, 400)
+
+    def test_cursor_is_bound_to_its_account(self):
+        cursor = self.next_cursor(self.statement(self.cash))
+        self.assertEqual(self.statement(self.equity, cursor).status_code, 400)
+
+
+class OutboxTests(TestCase):
+    """
+    Outbox events are written with the change, claimed once, retried with backoff and credit exactly once.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='outbox@example.com', email='outbox@example.com')
+        self.deposit = DepositTransaction.objects.create(
+            user=self.user, coin_type='bitcoin', amount=Decimal('75'), wallet_address='bc1qoutbox'
+        )
+
+    def confirm(self):
+        self.deposit.status = 'confirmed'
+        self.deposit.save()
+
+    def failing_topic(self):
+        from unittest import mock
+        from .outbox_services import HANDLERS
+
+        def handler(payload):
+            raise RuntimeError('mail server down')
+        return mock.patch.dict(HANDLERS, {'test.failing': handler})
+
+    def make_due(self, event):
+        OutboxEvent.objects.filter(id=event.id).update(available_at=timezone.now())
+
+    def test_event_is_written_in_the_same_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.confirm()
+                raise RuntimeError('rolled back')
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        self.deposit.refresh_from_db()
+        self.confirm()
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.topic, event.payload), ('deposit.confirmed', {'deposit_id': self.deposit.id}))
+
+    def test_claimed_event_is_not_claimed_by_another_worker(self):
+        from .outbox_services import claim_events
+        self.confirm()
+        # A second worker that read the same candidate row before the first one claimed it
+        candidate = OutboxEvent.objects.values('id', 'available_at').get()
+
+        claimed = claim_events()
+
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claim_events(), [])
+        self.assertEqual(
+            OutboxEvent.objects.filter(status='pending', **candidate).update(attempts=F('attempts') + 1), 0
+        )
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+
+    def test_failure_is_retried_with_backoff(self):
+        from .outbox_services import enqueue, process_due_events, retry_delay
+        event = enqueue('test.failing', 'retry')
+        with self.failing_topic():
+            before = timezone.now()
+            self.assertEqual(process_due_events(), {'processed': 0, 'failed': 1})
+            event.refresh_from_db()
+            self.assertEqual((event.status, event.attempts), ('pending', 1))
+            self.assertIn('mail server down', event.last_error)
+            self.assertGreaterEqual(event.available_at, before + retry_delay(1))
+            # Not due again until the backoff has passed
+            self.assertEqual(process_due_events(), {'processed': 0, 'failed': 0})
+
+            self.make_due(event)
+            process_due_events()
+            event.refresh_from_db()
+            self.assertGreaterEqual(event.available_at, before + retry_delay(2))
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+
+    def test_event_fails_after_max_attempts(self):
+        from .outbox_services import enqueue, process_due_events
+        event = enqueue('test.failing', 'give-up')
+        with self.failing_topic():
+            for _ in range(3):
+                self.make_due(event)
+                process_due_events(max_attempts=3)
+            event.refresh_from_db()
+            self.assertEqual((event.status, event.attempts), ('failed', 3))
+
+            self.make_due(event)
+            self.assertEqual(process_due_events(max_attempts=3), {'processed': 0, 'failed': 0})
+
+    def test_rerunning_the_handler_credits_once(self):
+        from .outbox_services import claim_events, process_event
+        self.confirm()
+        event = claim_events()[0]
+
+        self.assertTrue(process_event(event))
+        # As if the worker died after the credit and the lease expired
+        self.assertTrue(process_event(event))
+
+        self.assertEqual(self.user.wallet.get_balance('bitcoin'), Decimal('75'))
+        self.assertEqual(Notification.objects.filter(deposit=self.deposit, type='deposit_confirmed').count(), 1)
+        self.assertEqual(OutboxEvent.objects.get().status, 'done')
+
+
+class DepositConfirmationTests(TestCase):
+    """
+    confirm_deposits confirms a batch atomically, in a constant number of queries.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create(username='confirmer@example.com', email='confirmer@example.com', is_staff=True)
+        self.users = [User.objects.create(username=f'batch{i}@example.com', email=f'batch{i}@example.com') for i in range(2)]
+
+    def deposit(self, user, coin='bitcoin', amount='10'):
+        return DepositTransaction.objects.create(
+            user=user, coin_type=coin, amount=Decimal(amount) if amount else None, wallet_address=f'{coin}-{user.id}'
+        )
+
+    def balance(self, user, coin):
+        from .models import WalletBalance
+        return WalletBalance.objects.filter(user=user, coin=coin).values_list('amount', flat=True).first() or Decimal('0')
+
+    def summary(self, coin):
+        from .models import PendingDepositSummary
+        return PendingDepositSummary.objects.filter(coin=coin).values_list('pending_count', 'pending_amount').first()
+
+    def test_credits_are_summed_per_user_and_coin(self):
+        from .deposit_services import confirm_deposits
+        first, second = self.users
+        batch = [
+            self.deposit(first, 'bitcoin', '10'), self.deposit(first, 'bitcoin', '5'),
+            self.deposit(first, 'ethereum', '7'), self.deposit(second, 'bitcoin', '3'),
+            self.deposit(second, 'bitcoin', None),
+        ]
+        left_pending = self.deposit(second, 'bitcoin', '100')
+        rejected = self.deposit(second, 'ethereum', '1')
+        rejected.status = 'rejected'
+        rejected.save()
+
+        confirmed = confirm_deposits([deposit.id for deposit in batch] + [rejected.id], self.admin)
+
+        self.assertEqual([deposit.id for deposit in confirmed], [deposit.id for deposit in batch])
+        self.assertEqual(self.balance(first, 'bitcoin'), Decimal('15'))
+        self.assertEqual(self.balance(first, 'ethereum'), Decimal('7'))
+        self.assertEqual(self.balance(second, 'bitcoin'), Decimal('3'))
+        self.assertEqual(self.balance(second, 'ethereum'), Decimal('0'))
+        for deposit in DepositTransaction.objects.filter(id__in=[deposit.id for deposit in batch]):
+            self.assertEqual((deposit.status, deposit.processed_by_id), ('confirmed', self.admin.id))
+            self.assertIsNotNone(deposit.confirmed_at)
+            self.assertIsNotNone(deposit.credited_at)
+        self.assertEqual(DepositTransaction.objects.get(pk=rejected.pk).status, 'rejected')
+        self.assertEqual(DepositTransaction.objects.get(pk=left_pending.pk).status, 'pending')
+        self.assertEqual(Notification.objects.filter(type='deposit_confirmed').count(), len(batch))
+
+        # Only the deposit left pending is still counted
+        self.assertEqual(self.summary('bitcoin'), (1, Decimal('100')))
+        self.assertEqual(self.summary('ethereum'), (0, Decimal('0')))
+
+        # One email batch event for the whole set, and no per-deposit credit events
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.topic, 'deposit.email_batch')
+        self.assertEqual(event.payload, {'deposit_ids': [deposit.id for deposit in batch]})
+
+    def test_failure_rolls_back_the_whole_batch(self):
+        from unittest import mock
+        from . import deposit_services
+        batch = [self.deposit(user) for user in self.users]
+
+        with mock.patch.object(deposit_services, 'enqueue', side_effect=RuntimeError('outbox unavailable')):
+            with self.assertRaises(RuntimeError):
+                deposit_services.confirm_deposits([deposit.id for deposit in batch], self.admin)
+
+        self.assertEqual(set(DepositTransaction.objects.values_list('status', flat=True)), {'pending'})
+        self.assertFalse(DepositTransaction.objects.filter(credited_at__isnull=False).exists())
+        for user in self.users:
+            self.assertEqual(self.balance(user, 'bitcoin'), Decimal('0'))
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(self.summary('bitcoin'), (2, Decimal('20')))
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        import math
+        from .deposit_services import confirm_deposits
+        notification_fields = [field for field in Notification._meta.concrete_fields if not field.primary_key]
+        for size in (10, 100):
+            ids = [
+                self.deposit(self.users[i % 2], ('bitcoin', 'ethereum')[i // 2 % 2]).id
+                for i in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(confirm_deposits(ids, self.admin)), size)
+            # The backend caps parameters per statement, so the notification insert alone is split
+            inserts = [query for query in queries.captured_queries if 'INTO "app_notification" (' in query['sql']]
+            batches = math.ceil(size / connection.ops.bulk_batch_size(notification_fields, [None] * size))
+            with self.subTest(size=size):
+                self.assertEqual(len(inserts), batches)
+                self.assertEqual(len(queries) - len(inserts), 20)
+
+
+class AccountClosureTests(TestCase):
+    """
+    AccountClosure stays equal to what Account.parent implies through creates, moves and deletes.
+    """
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        # assets > current > cash > petty, and a separate equity root
+        self.assets = Account.objects.create(name='Assets', code='1000', account_type='ASSET')
+        self.current = Account.objects.create(name='Current', code='1100', account_type='ASSET', parent=self.assets)
+        self.cash = Account.objects.create(name='Cash', code='1110', account_type='ASSET', parent=self.current)
+        self.petty = Account.objects.create(name='Petty cash', code='1111', account_type='ASSET', parent=self.cash)
+        self.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='closure@example.com', email='closure@example.com'))
+
+    def links(self):
+        from .models import AccountClosure
+        return set(AccountClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assert_matches_rebuild(self):
+        from .ledger_services import rebuild_account_closure
+        incremental = self.links()
+        self.assertEqual(rebuild_account_closure(), len(incremental))
+        self.assertEqual(self.links(), incremental)
+
+    def test_create_links_every_ancestor(self):
+        a, c, k, p = self.assets.id, self.current.id, self.cash.id, self.petty.id
+        self.assertEqual({link for link in self.links() if link[1] == p}, {(p, p, 0), (k, p, 1), (c, p, 2), (a, p, 3)})
+        self.assertIn((self.equity.id, self.equity.id, 0), self.links())
+        self.assert_matches_rebuild()
+
+    def test_moving_a_subtree_relinks_all_of_it(self):
+        from .ledger_services import ancestor_accounts, subtree_accounts
+        self.cash.parent = self.equity
+        self.cash.save()
+
+        self.assertEqual(
+            [(account.code, account.depth) for account in ancestor_accounts(self.petty.id)],
+            [('3000', 2), ('1110', 1), ('1111', 0)],
+        )
+        self.assertEqual([account.code for account in subtree_accounts(self.assets.id)], ['1000', '1100'])
+        self.assertEqual([account.code for account in subtree_accounts(self.equity.id)], ['1110', '1111', '3000'])
+        self.assert_matches_rebuild()
+
+        # Detaching to the top level leaves only the links inside the subtree
+        self.cash.parent = None
+        self.cash.save()
+        self.assertEqual([account.code for account in ancestor_accounts(self.petty.id)], ['1110', '1111'])
+        self.assert_matches_rebuild()
+
+    def test_moving_under_own_descendant_is_rejected(self):
+        from django.core.exceptions import ValidationError
+        before = self.links()
+        for new_parent in (self.current, self.petty):
+            with self.subTest(parent=new_parent.code):
+                account = Account.objects.get(pk=self.current.pk)
+                account.parent = new_parent
+                with self.assertRaises(ValidationError):
+                    account.save()
+        self.assertEqual(Account.objects.get(pk=self.current.pk).parent_id, self.assets.id)
+
+        response = self.client.patch(f'/api/accounts/{self.assets.id}/', {'parent': self.petty.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.json())
+        self.assertIsNone(Account.objects.get(pk=self.assets.pk).parent_id)
+        self.assertEqual(self.links(), before)
+
+    def test_delete_cascades_to_the_subtree_links(self):
+        self.current.delete()
+        self.assertEqual(list(Account.objects.order_by('code').values_list('code', flat=True)), ['1000', '3000'])
+        self.assertEqual(self.links(), {(self.assets.id, self.assets.id, 0), (self.equity.id, self.equity.id, 0)})
+        self.assert_matches_rebuild()
+
+    def test_tree_endpoint_nests_by_closure_depth(self):
+        body = self.client.get(f'/api/accounts/tree/?root={self.current.id}').json()
+        node = body['accounts'][0]
+        self.assertEqual((node['code'], node['depth']), ('1100', 0))
+        self.assertEqual((node['children'][0]['code'], node['children'][0]['children'][0]['depth']), ('1110', 2))
+
+
+class AccountBalanceTests(TestCase):
+    """
+    The AccountBalance projection equals a fresh SUM over the journal after every kind of change.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='balances@example.com', email='balances@example.com')
+        self.cash = Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        self.bank = Account.objects.create(name='Bank', code='1010', account_type='ASSET')
+        self.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        self.txn = Transaction.objects.create(reference='AB-1', description='d', date=date(2024, 5, 1), user=self.user)
+
+    def entry(self, account, entry_type, amount):
+        return JournalEntry.objects.create(transaction=self.txn, account=account, entry_type=entry_type, amount=Decimal(amount))
+
+    def assert_matches_journal(self):
+        from django.db.models import Sum
+        for account in (self.cash, self.bank, self.equity):
+            entries = JournalEntry.objects.filter(account=account)
+            debit = entries.filter(entry_type='DEBIT').aggregate(total=Sum('amount'))['total'] or Decimal('0')
+            credit = entries.filter(entry_type='CREDIT').aggregate(total=Sum('amount'))['total'] or Decimal('0')
+            balance = AccountBalance.objects.filter(account=account).values('debit_total', 'credit_total', 'net').first()
+            balance = balance or {'debit_total': Decimal('0'), 'credit_total': Decimal('0'), 'net': Decimal('0')}
+            self.assertEqual(
+                (balance['debit_total'], balance['credit_total'], balance['net']), (debit, credit, debit - credit),
+                account.code,
+            )
+
+    def test_post_edit_and_delete_keep_balances_in_step(self):
+        debit = self.entry(self.cash, 'DEBIT', '100.00')
+        credit = self.entry(self.equity, 'CREDIT', '100.00')
+        self.assert_matches_journal()
+
+        debit.amount = Decimal('60.50')
+        debit.save()
+        credit.amount = Decimal('60.50')
+        credit.save()
+        self.assert_matches_journal()
+
+        # Moved to another account and flipped to the other side
+        debit.account = self.bank
+        debit.entry_type = 'CREDIT'
+        debit.save()
+        self.assert_matches_journal()
+
+        debit.delete()
+        self.assert_matches_journal()
+        credit.delete()
+        self.assert_matches_journal()
+
+    def test_bulk_postings_keep_balances_in_step(self):
+        from .ledger_services import create_postings, validate_postings
+        items = [
+            {
+                'reference': f'AB-B{i}', 'description': 'bulk', 'date': '2024-05-02',
+                'entries': [
+                    {'account': self.cash.id, 'entry_type': 'DEBIT', 'amount': f'{i}.25'},
+                    {'account': self.bank.id, 'entry_type': 'CREDIT', 'amount': f'{i}.25'},
+                ],
+            }
+            for i in range(1, 4)
+        ]
+        errors, postings = validate_postings(items)
+        self.assertFalse(any(errors))
+        create_postings(self.user, postings)
+        self.assert_matches_journal()
+
+    def test_check_reports_drift_and_exits_non_zero(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        self.entry(self.cash, 'DEBIT', '40.00')
+        self.entry(self.equity, 'CREDIT', '40.00')
+        call_command('rebuild_account_balances', '--check', stdout=StringIO(), stderr=StringIO())
+
+        AccountBalance.objects.filter(account=self.cash).update(debit_total=Decimal('39.99'))
+        stderr = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_account_balances', '--check', stdout=StringIO(), stderr=stderr)
+        self.assertIn(f'Account {self.cash.id}', stderr.getvalue())
+        # --check leaves the projection alone
+        self.assertEqual(AccountBalance.objects.get(account=self.cash).debit_total, Decimal('39.99'))
+
+        call_command('rebuild_account_balances', stdout=StringIO(), stderr=StringIO())
+        self.assert_matches_journal()
+
+
+class PeriodCloseTests(TestCase):
+    """
+    Closed periods reject postings, and balance_as_of reads a snapshot plus the activity after it.
+    """
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from .ledger_services import close_period
+        self.user = User.objects.create(username='close@example.com', email='close@example.com', is_staff=True)
+        self.cash = Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        self.equity = Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        self.closed_txn = self.post('PC-1', date(2024, 1, 15), '100')
+        close_period(date(2024, 1, 31), self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, reference, posting_date, amount, entry_type='DEBIT'):
+        txn = Transaction.objects.create(reference=reference, description=reference, date=posting_date, user=self.user)
+        other = 'CREDIT' if entry_type == 'DEBIT' else 'DEBIT'
+        JournalEntry.objects.create(transaction=txn, account=self.cash, entry_type=entry_type, amount=Decimal(amount))
+        JournalEntry.objects.create(transaction=txn, account=self.equity, entry_type=other, amount=Decimal(amount))
+        return txn
+
+    def test_postings_into_a_closed_period_are_rejected(self):
+        from django.core.exceptions import ValidationError
+        with self.assertRaises(ValidationError):
+            Transaction.objects.create(reference='PC-2', description='late', date=date(2024, 1, 31), user=self.user)
+        with self.assertRaises(ValidationError):
+            JournalEntry.objects.create(transaction=self.closed_txn, account=self.cash, entry_type='DEBIT', amount=Decimal('1'))
+        entry = self.closed_txn.entries.first()
+        entry.amount = Decimal('1')
+        with self.assertRaises(ValidationError):
+            entry.save()
+        with self.assertRaises(ValidationError):
+            entry.delete()
+        # Moving an open transaction back into the closed period is refused too
+        moved = self.post('PC-3', date(2024, 2, 1), '5')
+        moved.date = date(2024, 1, 20)
+        with self.assertRaises(ValidationError):
+            moved.save()
+
+        response = self.client.post('/api/transactions/bulk/', {'transactions': [{
+            'reference': 'PC-4', 'description': 'late', 'date': '2024-01-10',
+            'entries': [
+                {'account': self.cash.id, 'entry_type': 'DEBIT', 'amount': '1.00'},
+                {'account': self.equity.id, 'entry_type': 'CREDIT', 'amount': '1.00'},
+            ],
+        }]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.json()['results'][0]['errors'])
+        self.assertEqual(self.cash.balance.debit_total, Decimal('105'))
+
+    def test_deletes_inside_a_closed_period_are_rejected_with_400(self):
+        entry = self.closed_txn.entries.first()
+        for path, field in [
+            (f'/api/journal-entries/{entry.id}/', 'transaction'),
+            (f'/api/transactions/{self.closed_txn.id}/', 'date'),
+            (f'/api/accounts/{self.cash.id}/', 'entries'),
+        ]:
+            with self.subTest(path=path):
+                response = self.client.delete(path)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+        self.assertEqual(self.closed_txn.entries.count(), 2)
+        self.assertTrue(Account.objects.filter(pk=self.cash.pk).exists())
+
+        response = self.client.patch(f'/api/journal-entries/{entry.id}/', {'amount': '1.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('transaction', response.json())
+
+    def test_closing_an_already_closed_period_is_rejected(self):
+        response = self.client.post('/api/periods/close/', {'period_end': '2024-01-31'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_balance_as_of_combines_snapshot_and_later_activity(self):
+        from .ledger_services import balance_as_of
+        self.post('PC-5', date(2024, 2, 10), '30')
+        self.post('PC-6', date(2024, 2, 20), '12', entry_type='CREDIT')
+        self.post('PC-7', date(2024, 3, 5), '1000')
+
+        balance = balance_as_of(self.cash.id, date(2024, 2, 29))
+
+        self.assertEqual(balance['snapshot_period_end'], date(2024, 1, 31))
+        self.assertEqual((balance['debit_total'], balance['credit_total']), (Decimal('130'), Decimal('12')))
+        self.assertEqual(balance['net'], Decimal('118'))
+        # Entries inside the closed period come from the snapshot, not the journal
+        JournalEntry.objects.filter(transaction=self.closed_txn).update(amount=Decimal('1'))
+        self.assertEqual(balance_as_of(self.cash.id, date(2024, 2, 29))['net'], Decimal('118'))
+        # Before the first close there is no snapshot and the journal alone is summed
+        self.assertEqual(balance_as_of(self.cash.id, date(2024, 1, 20))['snapshot_period_end'], None)
+        self.assertEqual(balance_as_of(self.cash.id, date(2024, 1, 20))['net'], Decimal('1'))
+
+        response = self.client.get('/api/reports/balance-as-of/', {'account': '1000', 'date': '2024-02-29'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.json()['net'])), Decimal('118'))
+
+
+class ImportLedgerResumeTests(TestCase):
+    """
+    An import interrupted mid-file and resumed from its checkpoint writes every transaction exactly once.
+    """
+
+    TRANSACTIONS = 10
+
+    def setUp(self):
+        import tempfile
+        self.user = User.objects.create(username='importer', email='importer@example.com')
+        Account.objects.create(name='Cash', code='1000', account_type='ASSET')
+        Account.objects.create(name='Equity', code='3000', account_type='EQUITY')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ledger.csv')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('reference,date,description,account_code,entry_type,amount\n')
+            for i in range(self.TRANSACTIONS):
+                f.write(f'IMP-{i},2024-04-{i + 1:02d},Import {i},1000,DEBIT,{i + 1}.00\n')
+                f.write(f'IMP-{i},2024-04-{i + 1:02d},Import {i},3000,CREDIT,{i + 1}.00\n')
+
+    def run_import(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        call_command('import_ledger', self.path, '--user', 'importer', '--batch-size', '3', *args,
+                     stdout=StringIO(), stderr=StringIO())
+
+    def interrupt_batch(self, batch_number, committed):
+        """Kill the import on its batch_number-th batch, before or after that batch is committed"""
+        from unittest import mock
+        from app.management.commands import import_ledger
+        create_postings = import_ledger.create_postings
+        calls = []
+
+        def interrupted(user, postings):
+            calls.append(postings)
+            if len(calls) == batch_number and not committed:
+                raise KeyboardInterrupt
+            transactions = create_postings(user, postings)
+            if len(calls) == batch_number:
+                raise KeyboardInterrupt
+            return transactions
+        return mock.patch.object(import_ledger, 'create_postings', interrupted)
+
+    def assert_imported_once(self):
+        references = list(Transaction.objects.values_list('reference', flat=True))
+        self.assertEqual(sorted(references), sorted(f'IMP-{i}' for i in range(self.TRANSACTIONS)))
+        self.assertEqual(JournalEntry.objects.count(), 2 * self.TRANSACTIONS)
+        self.assertEqual(AccountBalance.objects.get(account__code='1000').debit_total, Decimal('55'))
+
+    def test_resume_after_interrupted_batch(self):
+        with self.interrupt_batch(3, committed=False):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import()
+        self.assertEqual(Transaction.objects.count(), 6)
+        with open(f'{self.path}.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'rows': 12})
+
+        self.run_import('--resume')
+        self.assert_imported_once()
+
+    def test_resume_after_commit_before_checkpoint(self):
+        # The batch is written but the checkpoint still points before it
+        with self.interrupt_batch(2, committed=True):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import()
+        self.assertEqual(Transaction.objects.count(), 6)
+        with open(f'{self.path}.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'rows': 6})
+
+        self.run_import('--resume', '--skip-existing')
+        self.assert_imported_once()
@@ -10,6 +10,14 @@ router.register(r'journal-entries', views.JournalEntryViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('status/', views.api_status, name='api_status'),
+    
+    # Ledger report endpoints
+    path('reports/trial-balance/', views.trial_balance_report, name='trial_balance_report'),
+    path('reports/general-ledger/', views.general_ledger_report, name='general_ledger_report'),
+    path('reports/balance-as-of/', views.balance_as_of_report, name='balance_as_of_report'),
+    path('periods/close/', views.close_accounting_period, name='close_accounting_period'),
+    path('exports/journal/', views.export_journal, name='export_journal'),
+    
     path('auth/register/', views.register_user, name='register_user'),
     path('auth/login/', views.login_user, name='login_user'),
     path('auth/profile/', views.user_profile, name='user_profile'),
@@ -30,15 +38,20 @@ urlpatterns = [
     
     # Notification endpoints
     path('notifications/', views.get_user_notifications, name='get_user_notifications'),
+    path('notifications/unread-count/', views.get_unread_notification_count, name='notification_unread_count'),
     path('notifications/mark-read/', views.mark_notification_read, name='mark_notification_as_read'),
+    path('notifications/mark-read/bulk/', views.mark_notifications_read_bulk, name='mark_notifications_read_bulk'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_as_read'),
     
     # Deposit endpoints
     path('deposits/wallet-address/', views.get_wallet_address, name='get_wallet_address'),
     path('deposits/create/', views.create_deposit, name='create_deposit'),
     path('deposits/', views.get_user_deposits, name='get_user_deposits'),
+    path('admin/deposits/review-queue/', views.deposit_review_queue, name='deposit_review_queue'),
     
     # Wallet endpoints
     path('wallet/balance/', views.get_wallet_balance, name='get_wallet_balance'),
     path('wallet/track-copy/', views.track_wallet_copy, name='track_wallet_copy'),
+    path('prices/', views.coin_prices, name='coin_prices'),
+    path('admin/valuation/', views.portfolio_valuation, name='portfolio_valuation'),
 ]
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+Portfolio valuation for QFS Ledger application
+
+Loads every wallet balance into a users x coins NumPy matrix with one query and
+values it under price scenarios with matrix operations instead of per-wallet loops.
+Balances are stored in USD at current prices, so a scenario is a vector of price
+multipliers per coin (1.0 = unchanged, 0.8 = down 20%).
+"""
+import itertools
+from django.db.models import Case, FloatField, IntegerField, Value, When
+from django.db.models.functions import Cast
+from .models import WalletBalance
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+
+COINS = list(WalletBalance.COINS)
+# Rows converted to arrays per step of BalanceMatrix.load; only this many row tuples exist at once
+LOAD_CHUNK_SIZE = 100_000
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError('Portfolio valuation requires numpy (pip install numpy)')
+
+
+class BalanceMatrix:
+    """USD balances as a (users x coins) float matrix with the matching user ids"""
+
+    def __init__(self, user_ids, amounts, coins=None):
+        self.user_ids = user_ids
+        self.amounts = amounts
+        self.coins = list(coins or COINS)
+
+    @classmethod
+    def from_rows(cls, user_ids, coin_indexes, amounts, coins=None):
+        """Pivot parallel (user_id, coin index, amount) arrays into a dense matrix"""
+        require_numpy()
+        coins = list(coins or COINS)
+        unique_users, rows = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+        matrix = np.zeros((len(unique_users), len(coins)), dtype=np.float64)
+        np.add.at(matrix, (rows, np.asarray(coin_indexes, dtype=np.intp)), np.asarray(amounts, dtype=np.float64))
+        return cls(unique_users, matrix, coins)
+
+    @classmethod
+    def load(cls, chunk_size=LOAD_CHUNK_SIZE):
+        """
+        Load all non-zero balances with a single streamed query.
+
+        Coins are turned into column indexes in SQL, and rows are read chunk_size at a
+        time straight into typed arrays instead of being collected as tuples first.
+        """
+        require_numpy()
+        rows = (
+            WalletBalance.objects.filter(coin__in=COINS).exclude(amount=0)
+            .order_by()
+            .annotate(
+                coin_index=Case(
+                    *[When(coin=coin, then=Value(index)) for index, coin in enumerate(COINS)],
+                    output_field=IntegerField(),
+                ),
+                value=Cast('amount', FloatField()),
+            )
+            .values_list('user_id', 'coin_index', 'value')
+            .iterator(chunk_size=chunk_size)
+        )
+        row_dtype = np.dtype([('user_id', np.int64), ('coin_index', np.intp), ('value', np.float64)])
+        chunks = []
+        while True:
+            chunk = np.fromiter(itertools.islice(rows, chunk_size), dtype=row_dtype)
+            if not len(chunk):
+                break
+            chunks.append(chunk)
+        if not chunks:
+            return cls(np.zeros(0, dtype=np.int64), np.zeros((0, len(COINS))))
+        data = np.concatenate(chunks)
+        return cls.from_rows(data['user_id'], data['coin_index'], data['value'])
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def scenario_vector(shocks=None, coins=None):
+    """
+    Price multipliers per coin from fractional shocks, e.g. {'bitcoin': -0.2} -> bitcoin x 0.8
+
+    Raises:
+        ValueError: for unknown coins or shocks below -100%
+    """
+    require_numpy()
+    coins = list(coins or COINS)
+    vector = np.ones(len(coins), dtype=np.float64)
+    for coin, shock in (shocks or {}).items():
+        if coin not in coins:
+            raise ValueError(f'Unknown coin: {coin}')
+        shock = float(shock)
+        if shock < -1:
+            raise ValueError(f'Shock for {coin} cannot be below -1 (a 100% drop)')
+        vector[coins.index(coin)] = 1 + shock
+    return vector
+
+
+def top_holders(values, user_ids, top_n):
+    """The top_n (user_id, value) pairs by value, using argpartition instead of a full sort"""
+    top_n = min(top_n, len(values))
+    if top_n <= 0:
+        return []
+    candidates = np.argpartition(values, -top_n)[-top_n:]
+    ordered = candidates[np.argsort(values[candidates])[::-1]]
+    return [(int(user_ids[i]), round(float(values[i]), 2)) for i in ordered]
+
+
+def value_portfolios(matrix, scenarios=None, top_n=10):
+    """
+    Value every wallet under each scenario.
+
+    Args:
+        matrix: BalanceMatrix
+        scenarios: {name: {coin: shock}}; a 'baseline' scenario with no shocks is always included
+
+    Returns:
+        {name: {'total', 'exposure': {coin: value}, 'top_holders': [{'user_id', 'value'}]}}
+    """
+    require_numpy()
+    scenarios = {'baseline': {}, **(scenarios or {})}
+    names = list(scenarios)
+    # scenarios x coins multipliers; one matrix product values every wallet under every scenario
+    multipliers = np.vstack([scenario_vector(scenarios[name], matrix.coins) for name in names])
+    exposure = matrix.amounts.sum(axis=0) * multipliers
+    wallet_values = matrix.amounts @ multipliers.T
+
+    results = {}
+    for index, name in enumerate(names):
+        results[name] = {
+            'total': round(float(exposure[index].sum()), 2),
+            'exposure': {coin: round(float(value), 2) for coin, value in zip(matrix.coins, exposure[index])},
+            'top_holders': [
+                {'user_id': user_id, 'value': value}
+                for user_id, value in top_holders(wallet_values[:, index], matrix.user_ids, top_n)
+            ],
+        }
+    return results
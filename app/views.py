@@ -1,20 +1,25 @@
 from django.shortcuts import render
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from rest_framework.decorators import api_view, permission_classes, parser_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes, authentication_classes, action, renderer_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
 from django.utils import timezone
-from .models import Account, Transaction, JournalEntry, KYCVerification, SupportTicket, SupportReply, Notification, DepositTransaction, Wallet, WalletCopyTracking
+from django.db.models import Prefetch
+from .models import Account, Transaction, JournalEntry, KYCVerification, SupportTicket, SupportReply, Notification, DepositTransaction, WalletCopyTracking
 from .serializers import (
     AccountSerializer, TransactionSerializer, JournalEntrySerializer,
     KYCVerificationSerializer, KYCSubmissionSerializer, KYCStatusSerializer,
-    DepositTransactionSerializer, WalletSerializer
+    DepositTransactionSerializer
 )
+from .pagination import KeysetPagination
+from .renderers import CSVExportRenderer, NDJSONExportRenderer
+from .idempotency import idempotent
 
 @api_view(['GET'])
 def api_status(request):
@@ -27,24 +32,379 @@ def api_status(request):
 
 class AccountViewSet(viewsets.ModelViewSet):
     """Account management API"""
-    queryset = Account.objects.all()
+    queryset = Account.objects.select_related('balance').order_by('code')
     serializer_class = AccountSerializer
     permission_classes = [IsAuthenticated]
+    
+    tree_fields = ['id', 'code', 'name', 'account_type', 'parent_id', 'is_active', 'depth']
+    
+    def perform_update(self, serializer):
+        from django.core.exceptions import ValidationError
+        from rest_framework.exceptions import ValidationError as APIValidationError
+        
+        try:
+            serializer.save()
+        except ValidationError as e:
+            raise APIValidationError({'parent': e.messages})
+    
+    def perform_destroy(self, instance):
+        from django.core.exceptions import ValidationError
+        from django.db import transaction
+        from rest_framework.exceptions import ValidationError as APIValidationError
+        
+        # Deleting an account cascades to its journal entries, which closed periods protect
+        try:
+            with transaction.atomic():
+                instance.delete()
+        except ValidationError as e:
+            raise APIValidationError({'entries': e.messages})
+    
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Chart of accounts as a nested tree, optionally limited to ?root=<id>"""
+        from .ledger_services import subtree_accounts
+        from django.db.models import Max
+        
+        root = request.query_params.get('root')
+        if root:
+            if not root.isdigit():
+                return Response({'error': 'root must be an account id'}, status=status.HTTP_400_BAD_REQUEST)
+            accounts = list(subtree_accounts(int(root)).values(*self.tree_fields))
+            if not accounts:
+                return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            accounts = list(
+                Account.objects.annotate(depth=Max('ancestor_links__depth')).order_by('code').values(*self.tree_fields)
+            )
+        
+        nodes = {account['id']: {**account, 'children': []} for account in accounts}
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node['parent_id'])
+            if parent is not None:
+                parent['children'].append(node)
+            else:
+                roots.append(node)
+        
+        return Response({'accounts': roots}, status=status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'])
+    def subtree(self, request, pk=None):
+        """All accounts under this one with their depth"""
+        from .ledger_services import subtree_accounts
+        
+        account = self.get_object()
+        return Response({
+            'accounts': list(subtree_accounts(account.id).values(*self.tree_fields))
+        }, status=status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Entries for this account in date order with running balances (?from=&to=&cursor=&page_size=)"""
+        from rest_framework.utils.urls import replace_query_param
+        from .ledger_services import account_statement
+        from .pagination import encode_cursor, decode_cursor
+        
+        account = self.get_object()
+        # Cursors carry the running balance, so one is only accepted for the account it was issued for
+        scope = f'statement:{account.id}'
+        try:
+            date_from = _parse_date_param(request, 'from')
+            date_to = _parse_date_param(request, 'to')
+            cursor = request.query_params.get('cursor')
+            position = decode_cursor(cursor, scope) if cursor else None
+            page_size = min(int(request.query_params.get('page_size', 50)), 500)
+            if page_size < 1:
+                raise ValueError('page_size must be positive')
+            result = account_statement(account.id, date_from, date_to, position, page_size)
+        except (ValueError, KeyError, TypeError) as e:
+            return Response({'error': str(e) or 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        next_position = result.pop('next_position')
+        result['next'] = replace_query_param(
+            request.build_absolute_uri(), 'cursor', encode_cursor(next_position, scope)
+        ) if next_position else None
+        result['account'] = {'id': account.id, 'code': account.code, 'name': account.name}
+        return Response(result, status=status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'])
+    def ancestors(self, request, pk=None):
+        """Ancestor chain of this account from the root down"""
+        from .ledger_services import ancestor_accounts
+        
+        account = self.get_object()
+        return Response({
+            'accounts': list(ancestor_accounts(account.id).values(*self.tree_fields))
+        }, status=status.HTTP_200_OK)
 
 class TransactionViewSet(viewsets.ModelViewSet):
     """Transaction management API"""
-    queryset = Transaction.objects.all().order_by('-created_at')
+    queryset = Transaction.objects.select_related('user').prefetch_related(
+        Prefetch('entries', queryset=JournalEntry.objects.select_related('account').order_by('id'))
+    ).order_by('-created_at', '-id')
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
     
+    @property
+    def paginator(self):
+        """Use keyset pagination when a cursor is requested (?pagination=cursor or ?cursor=...)"""
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
+    
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+    
+    def perform_destroy(self, instance):
+        from django.core.exceptions import ValidationError
+        from django.db import transaction
+        from rest_framework.exceptions import ValidationError as APIValidationError
+        
+        try:
+            with transaction.atomic():
+                instance.delete()
+        except ValidationError as e:
+            raise APIValidationError({'date': e.messages})
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Post many balanced transactions with their entries in one atomic request"""
+        from .ledger_services import validate_postings, create_postings, MAX_BULK_ENTRIES
+        
+        items = request.data.get('transactions') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({
+                'error': 'A non-empty list of transactions is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Malformed entries are counted as none here and reported per item by validate_postings
+        entry_count = sum(
+            len(item['entries']) for item in items
+            if isinstance(item, dict) and isinstance(item.get('entries'), list)
+        )
+        if entry_count > MAX_BULK_ENTRIES:
+            return Response({
+                'error': f'A bulk posting cannot contain more than {MAX_BULK_ENTRIES} entries'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        errors, postings = validate_postings(items)
+        if any(errors):
+            return Response({
+                'error': 'Bulk posting rejected, no transactions were created',
+                'results': [
+                    {'index': index, 'status': 'invalid', 'errors': item_errors} if item_errors
+                    else {'index': index, 'status': 'valid'}
+                    for index, item_errors in enumerate(errors)
+                ]
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        transactions = create_postings(request.user, postings)
+        return Response({
+            'message': f'Created {len(transactions)} transactions',
+            'results': [
+                {'index': index, 'status': 'created', 'id': txn.id, 'reference': txn.reference}
+                for index, txn in enumerate(transactions)
+            ]
+        }, status=status.HTTP_201_CREATED)
 
 class JournalEntryViewSet(viewsets.ModelViewSet):
     """Journal Entry management API"""
-    queryset = JournalEntry.objects.all()
+    queryset = JournalEntry.objects.select_related('account').order_by('id')
     serializer_class = JournalEntrySerializer
     permission_classes = [IsAuthenticated]
+    
+    def perform_destroy(self, instance):
+        from django.core.exceptions import ValidationError
+        from django.db import transaction
+        from rest_framework.exceptions import ValidationError as APIValidationError
+        
+        try:
+            with transaction.atomic():
+                instance.delete()
+        except ValidationError as e:
+            raise APIValidationError({'transaction': e.messages})
+
+
+# ================================================
+# Ledger Report Endpoints
+# ================================================
+
+def _parse_date_param(request, name):
+    """Parse an optional YYYY-MM-DD query parameter, raising ValueError when malformed"""
+    from datetime import date
+    
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be in YYYY-MM-DD format')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def trial_balance_report(request):
+    """Trial balance aggregated in the database and rolled up the account hierarchy"""
+    from .ledger_services import trial_balance
+    
+    try:
+        date_from = _parse_date_param(request, 'from')
+        date_to = _parse_date_param(request, 'to')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        return Response(trial_balance(date_from, date_to), status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to build trial balance: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def general_ledger_report(request):
+    """Opening, period and closing totals for an account and its sub-accounts"""
+    from .ledger_services import general_ledger
+    
+    account_param = request.GET.get('account')
+    if not account_param:
+        return Response({
+            'error': 'account is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        date_from = _parse_date_param(request, 'from')
+        date_to = _parse_date_param(request, 'to')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Accept either the account code or its id, code first
+        account = Account.objects.filter(code=account_param).first()
+        if account is None:
+            if not account_param.isdigit():
+                raise Account.DoesNotExist
+            account = Account.objects.get(id=account_param)
+        return Response(general_ledger(account, date_from, date_to), status=status.HTTP_200_OK)
+    except Account.DoesNotExist:
+        return Response({
+            'error': 'Account not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to build general ledger: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def balance_as_of_report(request):
+    """Balance of one account as of a date, read from the nearest period-close snapshot"""
+    from .ledger_services import balance_as_of
+    
+    account_param = request.GET.get('account')
+    if not account_param:
+        return Response({
+            'error': 'account is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        as_of = _parse_date_param(request, 'date') or timezone.localdate()
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    account = Account.objects.filter(code=account_param).first()
+    if account is None and account_param.isdigit():
+        account = Account.objects.filter(id=account_param).first()
+    if account is None:
+        return Response({
+            'error': 'Account not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        return Response(balance_as_of(account.id, as_of), status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to compute balance: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def close_accounting_period(request):
+    """Close the ledger through period_end and freeze per-account closing balances"""
+    from datetime import date
+    from django.core.exceptions import ValidationError
+    from .ledger_services import close_period
+    
+    try:
+        period_end = date.fromisoformat(str(request.data.get('period_end')))
+    except ValueError:
+        return Response({
+            'error': 'period_end must be in YYYY-MM-DD format'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        period = close_period(period_end, request.user)
+        return Response({
+            'message': f'Period closed through {period.period_end}',
+            'period_end': period.period_end,
+            'snapshots': period.snapshots.count()
+        }, status=status.HTTP_201_CREATED)
+    except ValidationError as e:
+        return Response({
+            'error': ' '.join(e.messages)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to close period: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, CSVExportRenderer, NDJSONExportRenderer])
+def export_journal(request):
+    """
+    Stream journal entries as CSV or NDJSON (?format=csv|ndjson&from=&to=&gzip=1)
+    without loading the ledger into memory
+    """
+    from django.http import StreamingHttpResponse
+    from .ledger_services import iter_journal_rows, iter_journal_csv, iter_journal_ndjson, gzip_stream
+    
+    # Content negotiation answers any ?format= without a renderer with 404 before this runs;
+    # only json gets here, accepted so that errors render as JSON
+    export_format = request.GET.get('format', 'csv')
+    if export_format == 'json':
+        return Response({
+            'error': 'format must be csv or ndjson'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        date_from = _parse_date_param(request, 'from')
+        date_to = _parse_date_param(request, 'to')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rows = iter_journal_rows(date_from, date_to)
+    if export_format == 'csv':
+        chunks, content_type = iter_journal_csv(rows), 'text/csv'
+    else:
+        chunks, content_type = iter_journal_ndjson(rows), 'application/x-ndjson'
+    filename = f'journal.{export_format}'
+    
+    if request.GET.get('gzip') in ('1', 'true'):
+        chunks, content_type, filename = gzip_stream(chunks), 'application/gzip', f'{filename}.gz'
+    
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 # Authentication Views
@@ -473,6 +833,7 @@ def admin_kyc_review(request, kyc_id):
 # Support Ticket Views
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_support_ticket(request):
     """Create a new support ticket"""
     try:
@@ -602,30 +963,82 @@ def reply_to_support_ticket(request, ticket_id):
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_user_notifications(request):
-    """Get all notifications for the authenticated user"""
-    try:
-        notifications = Notification.objects.filter(user=request.user)
-        
-        notifications_data = []
-        for notification in notifications:
-            notifications_data.append({
-                'id': notification.id,
-                'type': notification.type,
-                'title': notification.title,
-                'message': notification.message,
-                'is_read': notification.is_read,
-                'support_ticket_id': notification.support_ticket.ticket_id if notification.support_ticket else None,
-                'created_at': notification.created_at.isoformat(),
-                'read_at': notification.read_at.isoformat() if notification.read_at else None
-            })
+    """
+    Get all notifications for the authenticated user, or with ?since=<cursor> (&limit=) only
+    those created or changed after it. Responses carry a weak ETag of the user's change
+    sequence, read from the counter row; an unchanged poll with If-None-Match gets 304
+    without reading notifications.
+    """
+    try:
+        from django.utils.cache import get_conditional_response
+        from .notification_services import (
+            DELTA_PAGE_SIZE, MAX_DELTA_PAGE_SIZE, latest_sequence, notification_etag,
+            notifications_since, serialize_notification
+        )
+        from .pagination import encode_cursor, decode_cursor
         
+        user_id = request.user.id
+        scope = f'notifications:{user_id}'
+        since = request.query_params.get('since')
+        try:
+            position = decode_cursor(since, scope) if since else None
+            limit = min(int(request.query_params.get('limit', DELTA_PAGE_SIZE)), MAX_DELTA_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError('limit must be positive')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # The committed sequence, so a change made by any process changes the ETag
+        last_seq = latest_sequence(user_id)
+        etag = notification_etag(user_id, last_seq)
+        # Only a full listing or a fully caught-up cursor is answered by the ETag alone
+        if position is None or (position.get('id') is None and position.get('seq') == last_seq):
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+        
+        if position is None:
+            notifications = Notification.objects.filter(user_id=user_id).select_related('support_ticket')
+            response = Response({
+                'notifications': [serialize_notification(notification) for notification in notifications],
+                'next_cursor': encode_cursor({'seq': last_seq}, scope),
+                'has_more': False
+            }, status=status.HTTP_200_OK)
+        else:
+            try:
+                notifications, next_position, has_more = notifications_since(user_id, position, limit, latest=last_seq)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            response = Response({
+                'notifications': [serialize_notification(notification) for notification in notifications],
+                'next_cursor': encode_cursor(next_position, scope),
+                'has_more': has_more
+            }, status=status.HTTP_200_OK)
+        
+        response['ETag'] = etag
+        return response
+        
+    except Exception as e:
         return Response({
-            'notifications': notifications_data
+            'error': f'Failed to fetch notifications: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_unread_notification_count(request):
+    """Unread notification count for the badge, read from the per-user counter row"""
+    try:
+        from .notification_services import get_unread_count
+        return Response({
+            'unread_count': get_unread_count(request.user.id)
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
         return Response({
-            'error': f'Failed to fetch notifications: {str(e)}'
+            'error': f'Failed to fetch unread count: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
@@ -658,18 +1071,58 @@ def mark_notification_read(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Most ids accepted by one bulk mark-read request
+MAX_BULK_MARK_READ = 10000
+
+
+@api_view(['POST'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read_bulk(request):
+    """Mark the given notifications as read in one statement"""
+    try:
+        notification_ids = request.data.get('notification_ids')
+        if not isinstance(notification_ids, list) or not notification_ids:
+            return Response({
+                'error': 'notification_ids must be a non-empty list'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(notification_ids) > MAX_BULK_MARK_READ:
+            return Response({
+                'error': f'At most {MAX_BULK_MARK_READ} notification_ids per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            notification_ids = {int(notification_id) for notification_id in notification_ids}
+        except (TypeError, ValueError):
+            return Response({
+                'error': 'notification_ids must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        from .notification_services import mark_notifications_read
+        count = mark_notifications_read(request.user.id, notification_ids)
+        
+        return Response({
+            'message': f'Marked {count} notifications as read',
+            'marked_count': count
+        }, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({
+            'error': f'Failed to mark notifications as read: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
 def mark_all_notifications_read(request):
     """Mark all notifications as read for the authenticated user"""
     try:
-        notifications = Notification.objects.filter(user=request.user, is_read=False)
-        for notification in notifications:
-            notification.mark_as_read()
+        from .notification_services import mark_notifications_read
+        count = mark_notifications_read(request.user.id)
         
         return Response({
-            'message': f'Marked {notifications.count()} notifications as read'
+            'message': f'Marked {count} notifications as read',
+            'marked_count': count
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -795,6 +1248,7 @@ def admin_reply_to_support_ticket(request):
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_deposit(request):
     """
     Create a deposit transaction when user clicks 'Proceed' - 
@@ -807,18 +1261,8 @@ def create_deposit(request):
                 'error': 'Coin type is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Your actual wallet addresses - REAL ADDRESSES  
-        wallet_addresses = {
-            'bitcoin': 'bc1qgvry4pf374d7wgddslw7gymrfm2geswsde26ct',  # Real Bitcoin address
-            'ethereum': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real Ethereum address
-            'ripple': 'rGhee3BsGTR9dS1eep4WvcoTEfF7EDGFq2',  # Real Ripple address
-            'stellar': 'GBAFJKIU3S2UKSVGL7RK4PMY3HRHHN4DPGYNX5PHWUQAZRFEJBU7TGI5',  # Real Stellar address
-            'usdt': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real USDT address (same as ETH)
-            'bnb': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real BNB address
-            'bnb_tiger': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real BNB Tiger address
-        }
-        
-        wallet_address = wallet_addresses.get(coin_type)
+        from .address_services import get_deposit_address
+        wallet_address = get_deposit_address(request.user.id, coin_type)
         if not wallet_address:
             return Response({
                 'error': 'Unsupported coin type'
@@ -888,18 +1332,8 @@ def get_wallet_address(request):
                 'error': 'Coin type is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Your actual wallet addresses - REAL ADDRESSES
-        wallet_addresses = {
-            'bitcoin': 'bc1qgvry4pf374d7wgddslw7gymrfm2geswsde26ct',  # Real Bitcoin address
-            'ethereum': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real Ethereum address
-            'ripple': 'rGhee3BsGTR9dS1eep4WvcoTEfF7EDGFq2',  # Real Ripple address
-            'stellar': 'GBAFJKIU3S2UKSVGL7RK4PMY3HRHHN4DPGYNX5PHWUQAZRFEJBU7TGI5',  # Real Stellar address
-            'usdt': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real USDT address (same as ETH)
-            'bnb': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real BNB address
-            'bnb_tiger': '0xdd1727b7E38E19f4fe9cf6C0aEbA72b22d5B3C2f',  # Real BNB Tiger address
-        }
-        
-        wallet_address = wallet_addresses.get(coin_type)
+        from .address_services import get_deposit_address
+        wallet_address = get_deposit_address(request.user.id, coin_type)
         if not wallet_address:
             return Response({
                 'error': 'Unsupported coin type'
@@ -922,13 +1356,13 @@ def get_wallet_address(request):
 def get_wallet_balance(request):
     """
     Get user wallet balances for all cryptocurrencies
+    Served from the cache, keyed by the wallet's updated_at.
     """
     try:
-        wallet, created = Wallet.objects.get_or_create(user=request.user)
-        serializer = WalletSerializer(wallet)
+        from .wallet_services import get_wallet_payload
         
         return Response({
-            'wallet': serializer.data
+            'wallet': get_wallet_payload(request.user.id)
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -940,6 +1374,7 @@ def get_wallet_balance(request):
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def track_wallet_copy(request):
     """
     Track when user copies a wallet address
@@ -997,3 +1432,100 @@ def track_wallet_copy(request):
         return Response({
             'error': f'Failed to track wallet copy: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def coin_prices(request):
+    """
+    Current USD coin prices from the cached price oracle; never waits on the provider
+    """
+    from .price_services import get_prices
+    
+    try:
+        quote = get_prices()
+        if not quote['prices']:
+            response = Response({
+                'error': 'Prices are not available yet, retry shortly'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '5'
+            return response
+        return Response(quote, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to get prices: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def portfolio_valuation(request):
+    """
+    Value all wallets under price scenarios (admin only)
+    POST {"scenarios": {"btc_down_20": {"bitcoin": -0.2}}, "top": 10}; GET returns the baseline only
+    """
+    from .valuation import BalanceMatrix, value_portfolios
+    
+    scenarios = request.data.get('scenarios', {}) if request.method == 'POST' else {}
+    try:
+        top_n = int(request.data.get('top', request.query_params.get('top', 10)))
+    except (TypeError, ValueError):
+        return Response({
+            'error': 'top must be an integer'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(scenarios, dict) or not all(isinstance(shocks, dict) for shocks in scenarios.values()):
+        return Response({
+            'error': 'scenarios must map scenario names to {coin: shock} objects'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        matrix = BalanceMatrix.load()
+        results = value_portfolios(matrix, scenarios, top_n=max(0, min(top_n, 100)))
+        return Response({
+            'wallets': len(matrix),
+            'scenarios': results
+        }, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except RuntimeError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to value portfolios: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def deposit_review_queue(request):
+    """
+    Pending deposits grouped by coin with cached totals (admin only); ?coin=&limit=
+    """
+    from .deposit_services import review_queue
+    
+    coin = request.query_params.get('coin')
+    if coin and coin not in dict(DepositTransaction.COIN_CHOICES):
+        return Response({
+            'error': 'Unsupported coin type'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 50)), 500))
+    except ValueError:
+        return Response({
+            'error': 'limit must be an integer'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        queue = review_queue(coin, limit)
+        return Response({
+            'pending_count': sum(group['pending_count'] for group in queue),
+            'coins': queue
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to load review queue: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
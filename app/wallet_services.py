@@ -0,0 +1,38 @@
+"""
+Wallet services for QFS Ledger application
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Wallet
+from .serializers import WalletSerializer
+
+
+def wallet_cache_key(user_id, version) -> str:
+    return f'wallet-balance:{user_id}:{version}'
+
+
+def get_wallet_payload(user_id) -> dict:
+    """
+    Serialized balances for a user, cached under the wallet's updated_at.
+
+    Every balance change bumps Wallet.updated_at in the same transaction, so a write from
+    any process (web workers, run_outbox, watch_chain) moves readers on to a new key even
+    with a per-process cache. A hit costs one indexed lookup of the marker; a miss also
+    loads the user's balance rows once.
+    """
+    version = Wallet.objects.filter(user_id=user_id).values_list('updated_at', flat=True).first()
+    # Balances are keyed by user, so an unsaved Wallet serializes them without loading the wallet row
+    if version is None:
+        return dict(WalletSerializer(Wallet(user_id=user_id)).data)
+    key = wallet_cache_key(user_id, version.timestamp())
+    payload = cache.get(key)
+    if payload is None:
+        payload = dict(WalletSerializer(Wallet(user_id=user_id)).data)
+        cache.set(key, payload, getattr(settings, 'WALLET_BALANCE_CACHE_TIMEOUT', 3600))
+    return payload
+
+
+def invalidate_wallet_cache(user_id):
+    """Bump the wallet's updated_at marker; call in the transaction that changed the balances"""
+    Wallet.objects.filter(user_id=user_id).update(updated_at=timezone.now())